@@ -0,0 +1,50 @@
+"""add lookup indexes and drop redundant primary key indexes
+
+Revision ID: 3f1c2a9d8b7e
+Revises:
+Create Date: 2026-10-18 09:12:41.503217
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f1c2a9d8b7e'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# The id columns are INTEGER PRIMARY KEY, i.e. aliases of the rowid, so these
+# indexes only duplicate the table b-tree and slow down every write.
+REDUNDANT_INDEXES = [
+    ('ix_categories_id', 'categories', 'id'),
+    ('ix_movies_id', 'movies', 'id'),
+    ('ix_reviews_id', 'reviews', 'id'),
+    ('ix_users_id', 'users', 'id'),
+]
+
+LOOKUP_INDEXES = [
+    ('ix_movies_category_id', 'movies', 'category_id'),
+    ('ix_movies_genre', 'movies', 'genre'),
+    ('ix_movies_director', 'movies', 'director'),
+    ('ix_movies_watched', 'movies', 'watched'),
+    ('ix_reviews_movie_id', 'reviews', 'movie_id'),
+]
+
+
+def upgrade() -> None:
+    # IF [NOT] EXISTS keeps the revision safe to run against databases that
+    # were created with Base.metadata.create_all() before being stamped.
+    for name, table, column in LOOKUP_INDEXES:
+        op.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {table} ({column})')
+    for name, _table, _column in REDUNDANT_INDEXES:
+        op.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+def downgrade() -> None:
+    for name, _table, _column in LOOKUP_INDEXES:
+        op.execute(f'DROP INDEX IF EXISTS {name}')
+    for name, table, column in REDUNDANT_INDEXES:
+        op.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {table} ({column})')
@@ -0,0 +1,161 @@
+"""add ON DELETE CASCADE to movies.category_id and reviews.movie_id
+
+Revision ID: 5b9d0c7e3f61
+Revises: e7b3a1f45d28
+Create Date: 2026-10-18 12:05:44.291870
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b9d0c7e3f61'
+down_revision: Union[str, None] = 'e7b3a1f45d28'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+MOVIE_COLUMNS = 'id, title, director, genre, watched, category_id, rating_count, rating_sum, rating_avg'
+REVIEW_COLUMNS = 'id, rating, comment, movie_id'
+
+MOVIE_INDEXES = {
+    'ix_movies_title': 'title',
+    'ix_movies_director': 'director',
+    'ix_movies_genre': 'genre',
+    'ix_movies_watched': 'watched',
+    'ix_movies_category_id': 'category_id',
+    'ix_movies_rating_avg': 'rating_avg',
+}
+
+# SQLite cannot alter a foreign key, so both tables are rebuilt. Dropping a
+# table drops its triggers, and renaming fails while a trigger refers to a
+# missing table, so every trigger is dropped first and recreated at the end.
+TRIGGERS = {
+    'movies_search_insert': """
+        CREATE TRIGGER movies_search_insert AFTER INSERT ON movies BEGIN
+            INSERT INTO movie_search(rowid, title, director, genre, comments)
+            VALUES (new.id, new.title, new.director, new.genre,
+                    (SELECT group_concat(comment, ' ') FROM reviews WHERE movie_id = new.id));
+        END
+    """,
+    'movies_search_update': """
+        CREATE TRIGGER movies_search_update AFTER UPDATE OF title, director, genre ON movies BEGIN
+            UPDATE movie_search SET title = new.title, director = new.director, genre = new.genre
+            WHERE rowid = new.id;
+        END
+    """,
+    'movies_search_delete': """
+        CREATE TRIGGER movies_search_delete AFTER DELETE ON movies BEGIN
+            DELETE FROM movie_search WHERE rowid = old.id;
+        END
+    """,
+    'reviews_search_insert': """
+        CREATE TRIGGER reviews_search_insert AFTER INSERT ON reviews BEGIN
+            UPDATE movie_search
+            SET comments = (SELECT group_concat(comment, ' ') FROM reviews WHERE movie_id = new.movie_id)
+            WHERE rowid = new.movie_id;
+        END
+    """,
+    'reviews_search_update': """
+        CREATE TRIGGER reviews_search_update AFTER UPDATE OF comment, movie_id ON reviews BEGIN
+            UPDATE movie_search
+            SET comments = (SELECT group_concat(comment, ' ') FROM reviews WHERE movie_id = old.movie_id)
+            WHERE rowid = old.movie_id;
+            UPDATE movie_search
+            SET comments = (SELECT group_concat(comment, ' ') FROM reviews WHERE movie_id = new.movie_id)
+            WHERE rowid = new.movie_id;
+        END
+    """,
+    'reviews_search_delete': """
+        CREATE TRIGGER reviews_search_delete AFTER DELETE ON reviews BEGIN
+            UPDATE movie_search
+            SET comments = (SELECT group_concat(comment, ' ') FROM reviews WHERE movie_id = old.movie_id)
+            WHERE rowid = old.movie_id;
+        END
+    """,
+    'reviews_rating_insert': """
+        CREATE TRIGGER reviews_rating_insert AFTER INSERT ON reviews BEGIN
+            UPDATE movies
+            SET rating_count = rating_count + 1,
+                rating_sum = rating_sum + new.rating,
+                rating_avg = (rating_sum + new.rating) / (rating_count + 1)
+            WHERE id = new.movie_id;
+        END
+    """,
+    'reviews_rating_update': """
+        CREATE TRIGGER reviews_rating_update AFTER UPDATE OF rating, movie_id ON reviews BEGIN
+            UPDATE movies
+            SET rating_count = rating_count - 1,
+                rating_sum = rating_sum - old.rating,
+                rating_avg = CASE WHEN rating_count > 1 THEN (rating_sum - old.rating) / (rating_count - 1) END
+            WHERE id = old.movie_id;
+            UPDATE movies
+            SET rating_count = rating_count + 1,
+                rating_sum = rating_sum + new.rating,
+                rating_avg = (rating_sum + new.rating) / (rating_count + 1)
+            WHERE id = new.movie_id;
+        END
+    """,
+    'reviews_rating_delete': """
+        CREATE TRIGGER reviews_rating_delete AFTER DELETE ON reviews BEGIN
+            UPDATE movies
+            SET rating_count = rating_count - 1,
+                rating_sum = rating_sum - old.rating,
+                rating_avg = CASE WHEN rating_count > 1 THEN (rating_sum - old.rating) / (rating_count - 1) END
+            WHERE id = old.movie_id;
+        END
+    """,
+}
+
+
+def rebuild_tables(on_delete):
+    for name in TRIGGERS:
+        op.execute(f'DROP TRIGGER IF EXISTS {name}')
+
+    op.execute(f"""
+        CREATE TABLE _movies_new (
+            id INTEGER NOT NULL,
+            title VARCHAR NOT NULL,
+            director VARCHAR NOT NULL,
+            genre VARCHAR NOT NULL,
+            watched BOOLEAN,
+            category_id INTEGER,
+            rating_count INTEGER DEFAULT '0' NOT NULL,
+            rating_sum FLOAT DEFAULT '0' NOT NULL,
+            rating_avg FLOAT,
+            PRIMARY KEY (id),
+            FOREIGN KEY(category_id) REFERENCES categories (id){on_delete}
+        )
+    """)
+    op.execute(f'INSERT INTO _movies_new ({MOVIE_COLUMNS}) SELECT {MOVIE_COLUMNS} FROM movies')
+    op.execute('DROP TABLE movies')
+    op.execute('ALTER TABLE _movies_new RENAME TO movies')
+    for name, column in MOVIE_INDEXES.items():
+        op.execute(f'CREATE INDEX {name} ON movies ({column})')
+
+    op.execute(f"""
+        CREATE TABLE _reviews_new (
+            id INTEGER NOT NULL,
+            rating FLOAT NOT NULL,
+            comment VARCHAR,
+            movie_id INTEGER,
+            PRIMARY KEY (id),
+            FOREIGN KEY(movie_id) REFERENCES movies (id){on_delete}
+        )
+    """)
+    op.execute(f'INSERT INTO _reviews_new ({REVIEW_COLUMNS}) SELECT {REVIEW_COLUMNS} FROM reviews')
+    op.execute('DROP TABLE reviews')
+    op.execute('ALTER TABLE _reviews_new RENAME TO reviews')
+    op.execute('CREATE INDEX ix_reviews_movie_id ON reviews (movie_id)')
+
+    for sql in TRIGGERS.values():
+        op.execute(sql)
+
+
+def upgrade() -> None:
+    rebuild_tables(' ON DELETE CASCADE')
+
+
+def downgrade() -> None:
+    rebuild_tables('')
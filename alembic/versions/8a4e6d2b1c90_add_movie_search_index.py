@@ -0,0 +1,93 @@
+"""add movie_search FTS5 index with sync triggers
+
+Revision ID: 8a4e6d2b1c90
+Revises: 3f1c2a9d8b7e
+Create Date: 2026-10-18 10:02:17.884105
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8a4e6d2b1c90'
+down_revision: Union[str, None] = '3f1c2a9d8b7e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TRIGGERS = [
+    'movies_search_insert',
+    'movies_search_update',
+    'movies_search_delete',
+    'reviews_search_insert',
+    'reviews_search_update',
+    'reviews_search_delete',
+]
+
+
+def upgrade() -> None:
+    op.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS movie_search USING fts5(
+            title, director, genre, comments,
+            tokenize = 'unicode61 remove_diacritics 2',
+            prefix = '2 3'
+        )
+    """)
+    op.execute("INSERT INTO movie_search(movie_search, rank) VALUES ('rank', 'bm25(10.0, 4.0, 2.0, 1.0)')")
+    op.execute("""
+        CREATE TRIGGER IF NOT EXISTS movies_search_insert AFTER INSERT ON movies BEGIN
+            INSERT INTO movie_search(rowid, title, director, genre, comments)
+            VALUES (new.id, new.title, new.director, new.genre,
+                    (SELECT group_concat(comment, ' ') FROM reviews WHERE movie_id = new.id));
+        END
+    """)
+    op.execute("""
+        CREATE TRIGGER IF NOT EXISTS movies_search_update AFTER UPDATE OF title, director, genre ON movies BEGIN
+            UPDATE movie_search SET title = new.title, director = new.director, genre = new.genre
+            WHERE rowid = new.id;
+        END
+    """)
+    op.execute("""
+        CREATE TRIGGER IF NOT EXISTS movies_search_delete AFTER DELETE ON movies BEGIN
+            DELETE FROM movie_search WHERE rowid = old.id;
+        END
+    """)
+    op.execute("""
+        CREATE TRIGGER IF NOT EXISTS reviews_search_insert AFTER INSERT ON reviews BEGIN
+            UPDATE movie_search
+            SET comments = (SELECT group_concat(comment, ' ') FROM reviews WHERE movie_id = new.movie_id)
+            WHERE rowid = new.movie_id;
+        END
+    """)
+    op.execute("""
+        CREATE TRIGGER IF NOT EXISTS reviews_search_update AFTER UPDATE OF comment, movie_id ON reviews BEGIN
+            UPDATE movie_search
+            SET comments = (SELECT group_concat(comment, ' ') FROM reviews WHERE movie_id = old.movie_id)
+            WHERE rowid = old.movie_id;
+            UPDATE movie_search
+            SET comments = (SELECT group_concat(comment, ' ') FROM reviews WHERE movie_id = new.movie_id)
+            WHERE rowid = new.movie_id;
+        END
+    """)
+    op.execute("""
+        CREATE TRIGGER IF NOT EXISTS reviews_search_delete AFTER DELETE ON reviews BEGIN
+            UPDATE movie_search
+            SET comments = (SELECT group_concat(comment, ' ') FROM reviews WHERE movie_id = old.movie_id)
+            WHERE rowid = old.movie_id;
+        END
+    """)
+    # Index the movies that already exist.
+    op.execute("DELETE FROM movie_search")
+    op.execute("""
+        INSERT INTO movie_search(rowid, title, director, genre, comments)
+        SELECT movies.id, movies.title, movies.director, movies.genre,
+               (SELECT group_concat(comment, ' ') FROM reviews WHERE reviews.movie_id = movies.id)
+        FROM movies
+    """)
+
+
+def downgrade() -> None:
+    for name in TRIGGERS:
+        op.execute(f'DROP TRIGGER IF EXISTS {name}')
+    op.execute('DROP TABLE IF EXISTS movie_search')
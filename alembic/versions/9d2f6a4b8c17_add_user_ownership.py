@@ -0,0 +1,68 @@
+"""add user ownership of movies and reviews, and hash user passwords
+
+Revision ID: 9d2f6a4b8c17
+Revises: 5b9d0c7e3f61
+Create Date: 2026-10-18 15:42:10.518203
+
+"""
+import base64
+import hashlib
+import os
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9d2f6a4b8c17'
+down_revision: Union[str, None] = '5b9d0c7e3f61'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEXES = {
+    'ix_movies_user_id': 'movies (user_id)',
+    'ix_movies_user_id_watched': 'movies (user_id, watched, id)',
+    'ix_movies_user_id_title': 'movies (user_id, title)',
+    'ix_reviews_user_id_movie_id': 'reviews (user_id, movie_id)',
+}
+
+
+def scrypt_hash(password):
+    # Same format as lib/passwords.py at the time of this revision
+    n, r, p = 2 ** 14, 8, 1
+    salt = os.urandom(16)
+    key = hashlib.scrypt(password.encode('utf-8'), salt=salt, n=n, r=r, p=p, maxmem=256 * n * r, dklen=32)
+    return f"scrypt${n}${r}${p}${base64.b64encode(salt).decode('ascii')}${base64.b64encode(key).decode('ascii')}"
+
+
+def upgrade() -> None:
+    # Older databases created before the users table existed
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER NOT NULL,
+            username VARCHAR NOT NULL,
+            password VARCHAR NOT NULL,
+            PRIMARY KEY (id),
+            UNIQUE (username)
+        )
+    """)
+    op.execute('ALTER TABLE movies ADD COLUMN user_id INTEGER REFERENCES users (id) ON DELETE CASCADE')
+    op.execute('ALTER TABLE reviews ADD COLUMN user_id INTEGER REFERENCES users (id) ON DELETE CASCADE')
+    for name, columns in INDEXES.items():
+        op.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {columns}')
+
+    # Passwords were stored in plain text.
+    connection = op.get_bind()
+    users = connection.execute(sa.text("SELECT id, password FROM users WHERE password NOT LIKE 'scrypt$%'")).all()
+    for user_id, password in users:
+        connection.execute(sa.text('UPDATE users SET password = :password WHERE id = :id'),
+                           {'password': scrypt_hash(password), 'id': user_id})
+
+
+def downgrade() -> None:
+    # Hashed passwords cannot be turned back into plain text and are kept.
+    for name in INDEXES:
+        op.execute(f'DROP INDEX IF EXISTS {name}')
+    op.execute('ALTER TABLE reviews DROP COLUMN user_id')
+    op.execute('ALTER TABLE movies DROP COLUMN user_id')
@@ -0,0 +1,25 @@
+"""add movies title index for keyset pagination
+
+Revision ID: c52d7f0e9a13
+Revises: 8a4e6d2b1c90
+Create Date: 2026-10-18 10:41:55.120346
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c52d7f0e9a13'
+down_revision: Union[str, None] = '8a4e6d2b1c90'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute('CREATE INDEX IF NOT EXISTS ix_movies_title ON movies (title)')
+
+
+def downgrade() -> None:
+    op.execute('DROP INDEX IF EXISTS ix_movies_title')
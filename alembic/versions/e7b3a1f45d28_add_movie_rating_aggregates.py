@@ -0,0 +1,84 @@
+"""add movie rating aggregates maintained by triggers
+
+Revision ID: e7b3a1f45d28
+Revises: c52d7f0e9a13
+Create Date: 2026-10-18 11:20:08.637412
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e7b3a1f45d28'
+down_revision: Union[str, None] = 'c52d7f0e9a13'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TRIGGERS = ['reviews_rating_insert', 'reviews_rating_update', 'reviews_rating_delete']
+
+
+def upgrade() -> None:
+    op.add_column('movies', sa.Column('rating_count', sa.Integer(), nullable=False, server_default='0'))
+    op.add_column('movies', sa.Column('rating_sum', sa.Float(), nullable=False, server_default='0'))
+    op.add_column('movies', sa.Column('rating_avg', sa.Float(), nullable=True))
+    op.create_index('ix_movies_rating_avg', 'movies', ['rating_avg'])
+
+    op.execute("""
+        CREATE TRIGGER IF NOT EXISTS reviews_rating_insert AFTER INSERT ON reviews BEGIN
+            UPDATE movies
+            SET rating_count = rating_count + 1,
+                rating_sum = rating_sum + new.rating,
+                rating_avg = (rating_sum + new.rating) / (rating_count + 1)
+            WHERE id = new.movie_id;
+        END
+    """)
+    op.execute("""
+        CREATE TRIGGER IF NOT EXISTS reviews_rating_update AFTER UPDATE OF rating, movie_id ON reviews BEGIN
+            UPDATE movies
+            SET rating_count = rating_count - 1,
+                rating_sum = rating_sum - old.rating,
+                rating_avg = CASE WHEN rating_count > 1 THEN (rating_sum - old.rating) / (rating_count - 1) END
+            WHERE id = old.movie_id;
+            UPDATE movies
+            SET rating_count = rating_count + 1,
+                rating_sum = rating_sum + new.rating,
+                rating_avg = (rating_sum + new.rating) / (rating_count + 1)
+            WHERE id = new.movie_id;
+        END
+    """)
+    op.execute("""
+        CREATE TRIGGER IF NOT EXISTS reviews_rating_delete AFTER DELETE ON reviews BEGIN
+            UPDATE movies
+            SET rating_count = rating_count - 1,
+                rating_sum = rating_sum - old.rating,
+                rating_avg = CASE WHEN rating_count > 1 THEN (rating_sum - old.rating) / (rating_count - 1) END
+            WHERE id = old.movie_id;
+        END
+    """)
+
+    # Backfill from the existing reviews.
+    op.execute("""
+        UPDATE movies
+        SET rating_count = totals.review_count,
+            rating_sum = totals.rating_sum,
+            rating_avg = totals.rating_sum / totals.review_count
+        FROM (
+            SELECT movie_id, count(*) AS review_count, total(rating) AS rating_sum
+            FROM reviews
+            GROUP BY movie_id
+        ) AS totals
+        WHERE movies.id = totals.movie_id
+    """)
+
+
+def downgrade() -> None:
+    for name in TRIGGERS:
+        op.execute(f'DROP TRIGGER IF EXISTS {name}')
+    op.drop_index('ix_movies_rating_avg', table_name='movies')
+    with op.batch_alter_table('movies') as batch_op:
+        batch_op.drop_column('rating_avg')
+        batch_op.drop_column('rating_sum')
+        batch_op.drop_column('rating_count')
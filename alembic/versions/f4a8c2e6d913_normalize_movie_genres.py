@@ -0,0 +1,149 @@
+"""normalize movie genres into a genres table with movie links and a genre bitmask
+
+Revision ID: f4a8c2e6d913
+Revises: 9d2f6a4b8c17
+Create Date: 2026-10-18 19:05:41.902117
+
+"""
+import re
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f4a8c2e6d913'
+down_revision: Union[str, None] = '9d2f6a4b8c17'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TRIGGERS = ['genres_bit_assign', 'movies_genres_link', 'movie_genres_mask_insert', 'movie_genres_mask_delete']
+MASK_BITS = 63
+
+# Same rules as lib/genres.py at the time of this revision
+GENRE_SEPARATORS = re.compile(r'[,/|;&+]')
+GENRE_NAMES = (
+    'Action', 'Adventure', 'Animation', 'Biography', 'Comedy', 'Crime', 'Documentary', 'Drama', 'Family',
+    'Fantasy', 'History', 'Horror', 'Music', 'Musical', 'Mystery', 'Romance', 'Science Fiction', 'Sport',
+    'Thriller', 'War', 'Western',
+)
+GENRE_ALIASES = {
+    'sci fi': ('Science Fiction',), 'scifi': ('Science Fiction',), 'sf': ('Science Fiction',),
+    'science fiction': ('Science Fiction',),
+    'romcom': ('Romance', 'Comedy'), 'rom com': ('Romance', 'Comedy'), 'romantic comedy': ('Romance', 'Comedy'),
+    'animated': ('Animation',), 'cartoon': ('Animation',), 'anime': ('Animation',),
+    'doc': ('Documentary',), 'documentaries': ('Documentary',), 'biopic': ('Biography',), 'bio': ('Biography',),
+    'historical': ('History',), 'kids': ('Family',), 'children': ('Family',),
+    'crimes': ('Crime',), 'comedies': ('Comedy',), 'dramas': ('Drama',), 'thrillers': ('Thriller',),
+    'westerns': ('Western',), 'mysteries': ('Mystery',), 'noir': ('Crime',), 'musicals': ('Musical',),
+    'sports': ('Sport',), 'suspense': ('Thriller',), 'scary': ('Horror',), 'war film': ('War',),
+}
+
+
+def genre_key(text):
+    return ' '.join(re.findall(r'[^\W_]+', text.casefold()))
+
+
+CANONICAL_GENRES = {genre_key(name): (name,) for name in GENRE_NAMES}
+CANONICAL_GENRES.update(GENRE_ALIASES)
+
+
+def split_genres(text):
+    names = []
+    for part in GENRE_SEPARATORS.split(text or ''):
+        typed = ' '.join(part.split())
+        if not typed:
+            continue
+        for name in CANONICAL_GENRES.get(genre_key(part), (typed,)):
+            if name not in names:
+                names.append(name)
+    return names
+
+
+def upgrade() -> None:
+    op.create_table(
+        'genres',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(), nullable=False),
+        sa.Column('bit', sa.Integer(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('name'),
+        sa.UniqueConstraint('bit'),
+    )
+    op.create_table(
+        'movie_genres',
+        sa.Column('movie_id', sa.Integer(), sa.ForeignKey('movies.id', ondelete='CASCADE'), nullable=False),
+        sa.Column('genre_id', sa.Integer(), sa.ForeignKey('genres.id', ondelete='CASCADE'), nullable=False),
+        sa.PrimaryKeyConstraint('movie_id', 'genre_id'),
+    )
+    op.create_index('ix_movie_genres_genre_id_movie_id', 'movie_genres', ['genre_id', 'movie_id'])
+    op.add_column('movies', sa.Column('genre_mask', sa.Integer(), nullable=False, server_default='0'))
+
+    # Normalize the free-text genres, one statement per distinct spelling
+    # rather than per movie; the triggers are created afterwards so they
+    # don't rewrite every mask once per link.
+    connection = op.get_bind()
+    genres = {}
+    for (spelling,) in connection.execute(sa.text('SELECT DISTINCT genre FROM movies')).all():
+        names = split_genres(spelling)
+        if not names:
+            continue
+        for name in names:
+            if name not in genres:
+                bit = len(genres) if len(genres) < MASK_BITS else None
+                genre_id = connection.execute(sa.text('INSERT INTO genres (name, bit) VALUES (:name, :bit) RETURNING id'),
+                                              {'name': name, 'bit': bit}).scalar_one()
+                genres[name] = (genre_id, bit)
+        for name in names:
+            connection.execute(sa.text('INSERT OR IGNORE INTO movie_genres (movie_id, genre_id) '
+                                       'SELECT id, :genre_id FROM movies WHERE genre = :spelling'),
+                               {'genre_id': genres[name][0], 'spelling': spelling})
+        mask = sum(1 << genres[name][1] for name in names if genres[name][1] is not None)
+        connection.execute(sa.text('UPDATE movies SET genre = :genre, genre_mask = :mask WHERE genre = :spelling'),
+                           {'genre': ', '.join(names), 'mask': mask, 'spelling': spelling})
+
+    genre_array = r"""'["' || replace(replace(replace(new.genre, '\', '\\'), '"', '\"'), ', ', '","') || '"]'"""
+    op.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS genres_bit_assign AFTER INSERT ON genres WHEN new.bit IS NULL BEGIN
+            UPDATE genres
+            SET bit = (SELECT min(candidate)
+                       FROM (SELECT 0 AS candidate UNION ALL SELECT bit + 1 FROM genres WHERE bit IS NOT NULL)
+                       WHERE candidate < {MASK_BITS}
+                         AND candidate NOT IN (SELECT bit FROM genres WHERE bit IS NOT NULL))
+            WHERE id = new.id;
+        END
+    """)
+    op.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS movies_genres_link AFTER INSERT ON movies
+        WHEN new.genre != '' AND json_valid({genre_array}) BEGIN
+            INSERT OR IGNORE INTO genres (name)
+            SELECT value FROM json_each({genre_array}) WHERE value != '';
+            INSERT OR IGNORE INTO movie_genres (movie_id, genre_id)
+            SELECT new.id, genres.id FROM json_each({genre_array}) JOIN genres ON genres.name = json_each.value;
+        END
+    """)
+    op.execute("""
+        CREATE TRIGGER IF NOT EXISTS movie_genres_mask_insert AFTER INSERT ON movie_genres BEGIN
+            UPDATE movies
+            SET genre_mask = genre_mask | coalesce((SELECT 1 << bit FROM genres WHERE id = new.genre_id), 0)
+            WHERE id = new.movie_id;
+        END
+    """)
+    op.execute("""
+        CREATE TRIGGER IF NOT EXISTS movie_genres_mask_delete AFTER DELETE ON movie_genres BEGIN
+            UPDATE movies
+            SET genre_mask = genre_mask & ~coalesce((SELECT 1 << bit FROM genres WHERE id = old.genre_id), 0)
+            WHERE id = old.movie_id;
+        END
+    """)
+
+
+def downgrade() -> None:
+    # The normalized genre text is kept; the original spellings are gone.
+    for name in TRIGGERS:
+        op.execute(f'DROP TRIGGER IF EXISTS {name}')
+    op.execute('ALTER TABLE movies DROP COLUMN genre_mask')
+    op.drop_index('ix_movie_genres_genre_id_movie_id', table_name='movie_genres')
+    op.drop_table('movie_genres')
+    op.drop_table('genres')
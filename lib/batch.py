@@ -0,0 +1,202 @@
+"""Run a line-oriented script of watchlist commands in one process and one session.
+
+Each non-blank line is one command; ``#`` starts a comment and arguments
+containing spaces are quoted as in a shell:
+
+    movie add "The Matrix" "Lana Wachowski" "Sci-Fi" 3
+    movie watch 12 13 14
+    movie unwatch 15
+    movie delete 16
+    review add 12 4.5 "Still holds up"
+    review delete 7
+    category add "Documentary"
+    category delete 4
+"""
+import shlex
+import time
+from collections import namedtuple
+
+from sqlalchemy.exc import SQLAlchemyError
+
+from helpers import Movie, Review, Category
+from watchlist import unit_of_work
+
+BatchResult = namedtuple('BatchResult', ['executed', 'failed', 'commits', 'errors', 'elapsed', 'aborted'])
+
+
+class BatchCommandError(Exception):
+    """A script line that cannot be run: bad syntax, bad arguments or a missing row."""
+
+
+def parse_int(value, name):
+    try:
+        return int(value)
+    except ValueError:
+        raise BatchCommandError(f"{name} must be a whole number, got {value!r}")
+
+
+def parse_ids(values, name):
+    if not values:
+        raise BatchCommandError(f"expected at least one {name}")
+    return [parse_int(value, name) for value in values]
+
+
+def expect_args(args, minimum, maximum, usage):
+    if not minimum <= len(args) <= maximum:
+        raise BatchCommandError(f"usage: {usage}")
+
+
+def movie_add(session, args, user_id):
+    expect_args(args, 3, 4, 'movie add TITLE DIRECTOR GENRE [CATEGORY_ID]')
+    category_id = parse_int(args[3], 'CATEGORY_ID') if len(args) == 4 else None
+    movie = Movie.create(session, args[0], args[1], args[2], category_id, user_id=user_id)
+    return f"added movie {movie.id}"
+
+
+def set_watched(session, args, user_id, watched):
+    ids = parse_ids(args, 'MOVIE_ID')
+    if len(ids) == 1:
+        if Movie.mark_watched(session, ids[0], watched=watched, user_id=user_id) is None:
+            raise BatchCommandError(f"movie {ids[0]} not found")
+        return "updated 1 movie"
+    return f"updated {Movie.bulk_mark_watched(session, watched=watched, ids=ids, user_id=user_id)} movies"
+
+
+def movie_delete(session, args, user_id):
+    ids = parse_ids(args, 'MOVIE_ID')
+    if len(ids) == 1:
+        if not Movie.delete(session, ids[0], user_id=user_id):
+            raise BatchCommandError(f"movie {ids[0]} not found")
+        return "deleted 1 movie"
+    return f"deleted {Movie.bulk_delete(session, ids=ids, user_id=user_id)} movies"
+
+
+def review_add(session, args, user_id):
+    expect_args(args, 3, 3, 'review add MOVIE_ID RATING COMMENT')
+    movie_id = parse_int(args[0], 'MOVIE_ID')
+    try:
+        rating = float(args[1])
+    except ValueError:
+        raise BatchCommandError(f"RATING must be a number, got {args[1]!r}")
+    if not 1 <= rating <= 5:
+        raise BatchCommandError("Rating must be between 1 and 5 stars.")
+    review = Review.create(session, movie_id, rating, args[2], user_id=user_id)
+    return f"added review {review.id}"
+
+
+def review_delete(session, args, user_id):
+    expect_args(args, 1, 1, 'review delete REVIEW_ID')
+    review_id = parse_int(args[0], 'REVIEW_ID')
+    if not Review.delete(session, review_id, user_id=user_id):
+        raise BatchCommandError(f"review {review_id} not found")
+    return "deleted 1 review"
+
+
+def category_add(session, args, user_id):
+    expect_args(args, 1, 1, 'category add NAME')
+    category = Category.create(session, args[0])
+    return f"added category {category.id}"
+
+
+def category_delete(session, args, user_id):
+    expect_args(args, 1, 1, 'category delete CATEGORY_ID')
+    category_id = parse_int(args[0], 'CATEGORY_ID')
+    if not Category.delete(session, category_id):
+        raise BatchCommandError(f"category {category_id} not found")
+    return "deleted 1 category"
+
+
+COMMANDS = {
+    ('movie', 'add'): movie_add,
+    ('movie', 'watch'): lambda session, args, user_id: set_watched(session, args, user_id, True),
+    ('movie', 'unwatch'): lambda session, args, user_id: set_watched(session, args, user_id, False),
+    ('movie', 'delete'): movie_delete,
+    ('review', 'add'): review_add,
+    ('review', 'delete'): review_delete,
+    ('category', 'add'): category_add,
+    ('category', 'delete'): category_delete,
+}
+
+
+def parse_line(line):
+    """Split a script line into (command function, arguments), or None for blank and comment lines."""
+    try:
+        tokens = shlex.split(line, comments=True)
+    except ValueError as e:
+        raise BatchCommandError(str(e))
+    if not tokens:
+        return None
+    command = COMMANDS.get(tuple(tokens[:2]))
+    if command is None:
+        known = ', '.join(' '.join(key) for key in COMMANDS)
+        raise BatchCommandError(f"unknown command {' '.join(tokens[:2])!r}; expected one of: {known}")
+    return command, tokens[2:]
+
+
+def run_batch(session, lines, commit_every=0, savepoints=False, on_error=None, on_success=None, user_id=None):
+    """Execute script lines in one session, committing every commit_every commands (0 = once at the end).
+
+    The lines run in one watchlist.unit_of_work() that flushes after every
+    command, so each error is reported against its own line. With savepoints,
+    each line runs in its own SAVEPOINT so a failing line is rolled back
+    alone and the batch continues. Without them, a database error rolls back
+    everything since the last commit and stops the batch; lines that fail
+    before touching the database (syntax errors, missing rows) are reported
+    and skipped either way. Commands work on user_id's watchlist, or the
+    shared one when it is None.
+    """
+    executed = failed = pending = 0
+    errors = []
+    aborted = False
+    started = time.perf_counter()
+
+    def report(line_number, message):
+        errors.append((line_number, message))
+        if on_error:
+            on_error(line_number, message)
+
+    with unit_of_work(session, flush_each=True) as uow:
+        for line_number, line in enumerate(lines, start=1):
+            try:
+                parsed = parse_line(line)
+            except BatchCommandError as e:
+                failed += 1
+                report(line_number, str(e))
+                continue
+            if parsed is None:
+                continue
+            command, args = parsed
+
+            try:
+                if savepoints:
+                    with uow.savepoint():
+                        message = command(session, args, user_id)
+                else:
+                    message = command(session, args, user_id)
+            except BatchCommandError as e:
+                failed += 1
+                report(line_number, str(e))
+                continue
+            except SQLAlchemyError as e:
+                failed += 1
+                report(line_number, str(getattr(e, 'orig', e)))
+                if savepoints:
+                    continue
+                uow.rollback()
+                # The uncommitted lines were rolled back with it
+                executed -= pending
+                pending = 0
+                aborted = True
+                break
+
+            executed += 1
+            pending += 1
+            if on_success:
+                on_success(line_number, message)
+            if commit_every and pending >= commit_every:
+                uow.commit()
+                pending = 0
+    # The unit of work's closing commit only counts if it had lines to commit
+    commits = uow.commits if pending else uow.commits - 1
+
+    return BatchResult(executed, failed, commits, errors, time.perf_counter() - started, aborted)
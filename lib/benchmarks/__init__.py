@@ -0,0 +1,48 @@
+"""Benchmarks for the watchlist models.
+
+Run them from the lib/ directory, e.g. ``python -m benchmarks.write_paths``.
+Each benchmark builds its own temporary database, so the real watchlist is
+never touched.
+"""
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+
+from sqlalchemy.orm import sessionmaker
+
+from models import Base, make_engine
+from cache import lookup_cache
+
+
+@contextmanager
+def temporary_database(echo=False):
+    """Yield a sessionmaker bound to a fresh, fully created database in a temporary directory."""
+    with tempfile.TemporaryDirectory(prefix='watchlist-bench-') as directory:
+        engine = make_engine(f"sqlite:///{os.path.join(directory, 'bench.db')}", echo=echo)
+        import helpers  # noqa: F401  (registers the tables on Base.metadata)
+        Base.metadata.create_all(engine)
+        try:
+            yield sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        finally:
+            engine.dispose()
+
+
+@contextmanager
+def lookup_cache_disabled():
+    """Turn the lookup cache off so benchmarks measure the database work."""
+    maxsize = lookup_cache.maxsize
+    lookup_cache.maxsize = 0
+    lookup_cache.clear()
+    try:
+        yield
+    finally:
+        lookup_cache.maxsize = maxsize
+
+
+def time_ops(operation, arguments):
+    """Call operation once per argument and return (ops, seconds)."""
+    started = time.perf_counter()
+    for argument in arguments:
+        operation(argument)
+    return len(arguments), time.perf_counter() - started
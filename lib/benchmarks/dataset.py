@@ -0,0 +1,145 @@
+"""Deterministic synthetic watchlist data for benchmarks.
+
+    python -m benchmarks.dataset /tmp/watchlist-1m.db --movies 1000000 --users 20000
+
+The same (movies, categories, reviews_per_movie, users, seed) always produces the
+same rows, so timings taken on different machines or commits are comparable.
+Rows are generated and inserted in chunks, so memory stays flat at 10M rows.
+"""
+import itertools
+import os
+import random
+import re
+
+import click
+from sqlalchemy import insert, text
+from sqlalchemy.orm import sessionmaker
+
+from helpers import Movie, Review, Category, User, SEARCH_DDL, RATING_DDL, GENRE_DDL
+from passwords import hash_password
+from models import Base, make_engine
+
+ADJECTIVES = ['Silent', 'Last', 'Broken', 'Golden', 'Hidden', 'Crimson', 'Lost', 'Eternal', 'Dark', 'Final',
+              'Wild', 'Secret', 'Frozen', 'Burning', 'Distant', 'Hollow', 'Iron', 'Midnight', 'Scarlet', 'Quiet']
+NOUNS = ['River', 'Empire', 'Garden', 'Horizon', 'Machine', 'Kingdom', 'Shadow', 'Signal', 'Voyage', 'Harbor',
+         'Mirror', 'Forest', 'Station', 'Promise', 'Summer', 'Winter', 'Code', 'Island', 'Dream', 'Witness']
+FIRST_NAMES = ['Ava', 'Ben', 'Chloe', 'Dev', 'Elena', 'Felix', 'Greta', 'Hiro', 'Ines', 'Jonas',
+               'Kira', 'Luca', 'Maya', 'Nils', 'Olga', 'Pablo', 'Rina', 'Sami', 'Tomas', 'Yara']
+LAST_NAMES = ['Abbott', 'Bauer', 'Costa', 'Dubois', 'Eriksen', 'Fischer', 'Garcia', 'Haddad', 'Ito', 'Jensen',
+              'Kowalski', 'Larsen', 'Moreau', 'Novak', 'Okafor', 'Petrov', 'Quinn', 'Rossi', 'Sato', 'Varga']
+GENRES = ['Drama', 'Comedy', 'Thriller', 'Horror', 'Sci-Fi', 'Romance', 'Documentary', 'Animation',
+          'Action', 'Crime', 'Fantasy', 'Western', 'Musical', 'Mystery', 'War', 'Biography']
+REVIEW_WORDS = ['great', 'slow', 'moving', 'funny', 'tense', 'beautiful', 'confusing', 'brilliant', 'dull',
+                'stunning', 'clever', 'predictable', 'haunting', 'charming', 'long', 'sharp']
+
+
+def movie_rows(rng, movies, categories, users=0):
+    for movie_id in range(1, movies + 1):
+        row = {
+            'id': movie_id,
+            'title': f"The {rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} {movie_id}",
+            'director': f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+            'genre': rng.choice(GENRES),
+            'watched': rng.random() < 0.4,
+            'category_id': rng.randint(1, categories) if categories else None,
+        }
+        # Only drawn with users, so datasets without them stay the same as before
+        row['user_id'] = rng.randint(1, users) if users else None
+        yield row
+
+
+def review_rows(rng, movies, reviews_per_movie, users=0):
+    for movie_id in range(1, movies + 1):
+        # Between none and twice the average, so some movies have no reviews
+        for _ in range(rng.randint(0, 2 * reviews_per_movie)):
+            row = {
+                'movie_id': movie_id,
+                'rating': rng.randint(2, 10) / 2,
+                'comment': ' '.join(rng.choice(REVIEW_WORDS) for _ in range(rng.randint(3, 12))),
+            }
+            row['user_id'] = rng.randint(1, users) if users else None
+            yield row
+
+
+def user_rows(users, password='password'):
+    # One hash shared by every user: hashing is deliberately slow
+    stored = hash_password(password)
+    for user_id in range(1, users + 1):
+        yield {'id': user_id, 'username': f"user{user_id}", 'password': stored}
+
+
+# The search and rating triggers do per-row work that one rebuild after the
+# load does far faster, so they are dropped while the rows go in.
+TRIGGERS = [statement for statement in SEARCH_DDL + RATING_DDL + GENRE_DDL if 'CREATE TRIGGER' in statement]
+
+
+def trigger_name(statement):
+    return re.search(r'CREATE TRIGGER IF NOT EXISTS (\w+)', statement).group(1)
+
+
+def chunks(rows, size):
+    rows = iter(rows)
+    while True:
+        chunk = list(itertools.islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def generate(session, movies, categories=50, reviews_per_movie=3, seed=0, chunk_size=10000, users=0):
+    """Insert a deterministic synthetic dataset into an empty database and return the row counts."""
+    rng = random.Random(seed)
+    for statement in TRIGGERS:
+        session.execute(text(f"DROP TRIGGER IF EXISTS {trigger_name(statement)}"))
+    try:
+        if categories:
+            session.execute(insert(Category), [{'id': i, 'name': f"Category {i}"} for i in range(1, categories + 1)])
+        for chunk in chunks(user_rows(users), chunk_size):
+            session.execute(insert(User), chunk)
+        for chunk in chunks(movie_rows(rng, movies, categories, users), chunk_size):
+            session.execute(insert(Movie), chunk)
+            session.commit()
+        reviews = 0
+        for chunk in chunks(review_rows(rng, movies, reviews_per_movie, users), chunk_size):
+            session.execute(insert(Review), chunk)
+            session.commit()
+            reviews += len(chunk)
+        Movie.rebuild_genres(session)
+        Movie.rebuild_ratings(session)
+        Movie.rebuild_search_index(session)
+    finally:
+        for statement in TRIGGERS:
+            session.execute(text(statement))
+        session.commit()
+    return {'categories': categories, 'movies': movies, 'reviews': reviews, 'users': users}
+
+
+def create_dataset(path, movies, categories=50, reviews_per_movie=3, seed=0, users=0):
+    """Create a database file at path holding the synthetic dataset."""
+    engine = make_engine(f"sqlite:///{path}")
+    try:
+        Base.metadata.create_all(engine)
+        with sessionmaker(autoflush=False, bind=engine)() as session:
+            return generate(session, movies, categories, reviews_per_movie, seed, users=users)
+    finally:
+        engine.dispose()
+
+
+@click.command()
+@click.argument('path', type=click.Path(dir_okay=False, exists=False))
+@click.option('--movies', default=100000, show_default=True)
+@click.option('--categories', default=50, show_default=True)
+@click.option('--reviews-per-movie', default=3, show_default=True, help="Average reviews per movie.")
+@click.option('--users', default=0, show_default=True,
+              help="Users owning the movies and reviews, named user1, user2, ... with password 'password'.")
+@click.option('--seed', default=0, show_default=True)
+def main(path, movies, categories, reviews_per_movie, users, seed):
+    """Write a synthetic dataset to a new database file for repeated benchmark runs."""
+    if os.path.exists(path):
+        raise click.UsageError(f"{path} already exists")
+    counts = create_dataset(path, movies, categories, reviews_per_movie, seed, users)
+    click.echo(', '.join(f"{count} {name}" for name, count in counts.items()) + f" written to {path}")
+
+
+if __name__ == '__main__':
+    main()
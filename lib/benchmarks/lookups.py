@@ -0,0 +1,179 @@
+"""Compare the hot lookups built per call with the prebuilt statements in helpers.
+
+    python -m benchmarks.lookups --movies 10000 --ops 2000
+
+For each lookup it reports microseconds per call for the old
+implementation, which built a legacy Query or a select() on every call, and
+for the current one, which executes a statement built once at import. The
+"build" column is the time spent only constructing the old statement,
+without running it. The saving is larger than that: before reusing
+compiled SQL from the statement cache, SQLAlchemy computes a cache key for
+the statement, which a new statement pays in full on every call and a
+prebuilt one computes once.
+"""
+import os
+import random
+import tempfile
+import time
+
+import click
+from sqlalchemy import false, func, select
+from sqlalchemy.orm import sessionmaker
+
+from helpers import Movie, Review, Category, User, MovieRow, COMMENT_PREVIEW_LENGTH
+from models import make_engine
+from benchmarks import lookup_cache_disabled
+from benchmarks.dataset import create_dataset
+
+
+# The per-call implementations the prebuilt statements replaced; each
+# returns the statement (or Query) so its construction can be timed alone.
+
+def legacy_movie_by_id(session, movie_id):
+    return session.query(Movie).filter_by(id=movie_id)
+
+
+def legacy_category_by_id(session, category_id):
+    return session.query(Category).filter_by(id=category_id)
+
+
+def legacy_category_by_name(session, name):
+    return session.query(Category).filter_by(name=name)
+
+
+def legacy_user_by_name(session, username):
+    return session.query(User).filter_by(username=username)
+
+
+def legacy_review_by_id(session, review_id):
+    return session.query(Review).filter_by(id=review_id)
+
+
+def legacy_movies_by_category(session, category_id):
+    return Movie._with_category(select(Movie)).where(Movie.category_id == category_id)
+
+
+def legacy_movie_rows_by_category(session, category_id):
+    return Movie._rows_select().where(Movie.category_id == category_id)
+
+
+def legacy_review_page(session, movie_id, before=None, limit=10, comment_length=COMMENT_PREVIEW_LENGTH):
+    if comment_length is None:
+        comment, truncated = Review.comment, false()
+    else:
+        comment = func.substr(Review.comment, 1, comment_length)
+        truncated = func.length(Review.comment) > comment_length
+    statement = select(Review.id, Review.movie_id, Review.rating, comment, truncated)
+    statement = statement.where(Review.movie_id == movie_id)
+    if before is not None:
+        statement = statement.where(Review.id < before)
+    return statement.order_by(Review.id.desc()).limit(limit + 1)
+
+
+# How the old implementations ran their statement
+def one_or_none(session, query):
+    return query.one_or_none()
+
+
+def scalars_all(session, statement):
+    return session.scalars(statement).all()
+
+
+def rows_all(session, statement):
+    return session.execute(statement).all()
+
+
+def movie_rows(session, statement):
+    return [MovieRow._make(row) for row in session.execute(statement)]
+
+
+# (name, build the old statement, run it, current call, argument for call i)
+LOOKUPS = [
+    ("Movie.find_by_id", legacy_movie_by_id, one_or_none, Movie.find_by_id,
+     lambda context, i: context['movie_ids'][i % len(context['movie_ids'])]),
+    ("Category.find_by_id", legacy_category_by_id, one_or_none, Category.find_by_id,
+     lambda context, i: i % context['categories'] + 1),
+    ("Category.find_by_name", legacy_category_by_name, one_or_none, Category.find_by_name,
+     lambda context, i: f"Category {i % context['categories'] + 1}"),
+    ("User.find_by_username", legacy_user_by_name, one_or_none, User.find_by_username,
+     lambda context, i: f"user{i % max(context['users'], 1) + 1}"),
+    ("Review.find_by_id", legacy_review_by_id, one_or_none, Review.find_by_id,
+     lambda context, i: context['review_ids'][i % len(context['review_ids'])]),
+    ("Review.find_by_movie", legacy_review_page, rows_all, Review.find_by_movie,
+     lambda context, i: context['movie_ids'][i % len(context['movie_ids'])]),
+    ("Movie.find_by_category", legacy_movies_by_category, scalars_all, Movie.find_by_category,
+     lambda context, i: i % context['categories'] + 1),
+    ("Movie.find_rows_by_category", legacy_movie_rows_by_category, movie_rows, Movie.find_rows_by_category,
+     lambda context, i: i % context['categories'] + 1),
+]
+
+# Listings whose row loading dwarfs statement construction; run fewer times
+LISTINGS = {"Movie.find_by_category", "Movie.find_rows_by_category"}
+
+
+def best_time(Session, call, arguments, repeat):
+    """Return the fastest of repeat runs of call over arguments, in microseconds per call."""
+    best = None
+    with Session() as session:
+        for argument in arguments[:50]:
+            call(session, argument)
+        for _ in range(repeat):
+            session.expunge_all()
+            started = time.perf_counter()
+            for argument in arguments:
+                call(session, argument)
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+    return best * 1e6 / len(arguments)
+
+
+def load_context(Session):
+    with Session() as session:
+        return {
+            'movie_ids': session.scalars(select(Movie.id).order_by(Movie.id)).all(),
+            'review_ids': session.scalars(select(Review.id).order_by(Review.id).limit(100000)).all(),
+            'categories': session.scalar(select(func.count()).select_from(Category)),
+            'users': session.scalar(select(func.count()).select_from(User)),
+        }
+
+
+@click.command()
+@click.option('--dataset', type=click.Path(exists=True, dir_okay=False),
+              help="Database from 'python -m benchmarks.dataset'; generated on the fly if omitted.")
+@click.option('--movies', default=10000, show_default=True, help="Movies to generate without --dataset.")
+@click.option('--users', default=10, show_default=True, help="Users to generate without --dataset.")
+@click.option('--ops', default=2000, show_default=True, help="Calls per repetition of each lookup.")
+@click.option('--list-ops', default=100, show_default=True, help="Calls per repetition of the by-category listings.")
+@click.option('--repeat', default=3, show_default=True, help="Repetitions per lookup; the fastest counts.")
+@click.option('--seed', default=0, show_default=True)
+def main(dataset, movies, users, ops, list_ops, repeat, seed):
+    """Print microseconds per call for each hot lookup, built per call and prebuilt."""
+    with tempfile.TemporaryDirectory(prefix='watchlist-lookups-') as directory, lookup_cache_disabled():
+        if dataset is None:
+            dataset = os.path.join(directory, 'dataset.db')
+            click.echo(f"Generating {movies} movies...", err=True)
+            create_dataset(dataset, movies, users=users)
+        engine = make_engine(f"sqlite:///{dataset}")
+        Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        try:
+            context = load_context(Session)
+            rng = random.Random(seed)
+            click.echo(f"{'lookup':<28} {'build':>8} {'per call':>9} {'prebuilt':>9} {'saved':>8}   (us/call)")
+            for name, build, run, call, argument in LOOKUPS:
+                count = list_ops if name in LISTINGS else ops
+                arguments = [argument(context, rng.randrange(1 << 30)) for _ in range(count)]
+                with Session() as session:
+                    started = time.perf_counter()
+                    for value in arguments:
+                        build(session, value)
+                    build_us = (time.perf_counter() - started) * 1e6 / count
+                before = best_time(Session, lambda session, value: run(session, build(session, value)), arguments, repeat)
+                after = best_time(Session, call, arguments, repeat)
+                click.echo(f"{name:<28} {build_us:>8.1f} {before:>9.1f} {after:>9.1f} "
+                           f"{(before - after) / before:>7.0%}")
+        finally:
+            engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""Compare ORM listings with the read-only MovieRow projections.
+
+    python -m benchmarks.projections --movies 1000000
+    python -m benchmarks.projections --dataset /tmp/watchlist-1m.db
+
+For each listing it reports rows per second, streaming every movie and
+turning it into the dict the CLI prints, and the memory each row keeps
+alive when the whole result is held in a list (as get_all() and
+find_by_category() do), measured with tracemalloc.
+"""
+import gc
+import os
+import tempfile
+import time
+import tracemalloc
+
+import click
+from sqlalchemy.orm import sessionmaker
+
+from helpers import Movie, MOVIE_FIELDS
+from models import make_engine
+from benchmarks import lookup_cache_disabled
+from benchmarks.dataset import create_dataset
+
+# (name, call returning every movie)
+LISTINGS = [
+    ("Movie.stream", lambda session: Movie.stream(session)),
+    ("Movie.stream_rows", lambda session: Movie.stream_rows(session)),
+]
+
+
+def render(movies):
+    from cli import record
+    count = 0
+    for movie in movies:
+        record(movie, MOVIE_FIELDS)
+        count += 1
+    return count
+
+
+def time_listing(Session, call):
+    """Return (rows, seconds) to stream and render every movie."""
+    with Session() as session:
+        started = time.perf_counter()
+        rows = render(call(session))
+        return rows, time.perf_counter() - started
+
+
+def retained_bytes(Session, call):
+    """Return (rows, bytes) kept alive by a list of every movie and the session holding it."""
+    with Session() as session:
+        session.connection()
+        gc.collect()
+        tracemalloc.start()
+        try:
+            before = tracemalloc.get_traced_memory()[0]
+            movies = list(call(session))
+            gc.collect()
+            after = tracemalloc.get_traced_memory()[0]
+        finally:
+            tracemalloc.stop()
+        return len(movies), after - before
+
+
+@click.command()
+@click.option('--dataset', type=click.Path(exists=True, dir_okay=False),
+              help="Database from 'python -m benchmarks.dataset'; generated on the fly if omitted.")
+@click.option('--movies', default=100000, show_default=True, help="Movies to generate without --dataset.")
+@click.option('--memory-rows', default=100000, show_default=True,
+              help="Movies held in memory for the per-row figure (tracemalloc is slow).")
+def main(dataset, movies, memory_rows):
+    """Print rows/sec and bytes per row for the ORM listings and their *_rows projections."""
+    with tempfile.TemporaryDirectory(prefix='watchlist-projections-') as directory, lookup_cache_disabled():
+        if dataset is None:
+            dataset = os.path.join(directory, 'dataset.db')
+            click.echo(f"Generating {movies} movies...", err=True)
+            create_dataset(dataset, movies)
+        engine = make_engine(f"sqlite:///{dataset}")
+        Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        try:
+            click.echo(f"{'listing':<20} {'rows':>9} {'rows/s':>11} {'bytes/row':>10}")
+            for name, call in LISTINGS:
+                rows, seconds = time_listing(Session, call)
+
+                def first_rows(session, call=call):
+                    return (movie for _, movie in zip(range(memory_rows), call(session)))
+
+                held, retained = retained_bytes(Session, first_rows)
+                click.echo(f"{name:<20} {rows:>9} {rows / seconds:>11.0f} {retained / held:>10.0f}")
+        finally:
+            engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""Latency and throughput of the HTTP API against a local keep-alive client.
+
+    python -m benchmarks.server --requests 2000 --clients 8
+"""
+import http.client
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+from sqlalchemy import insert
+
+from helpers import Movie, Category
+from server import WatchlistServer
+from benchmarks import temporary_database
+
+
+def percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def client_worker(port, requests):
+    """Send (method, path, body) requests over one keep-alive connection and return latencies."""
+    connection = http.client.HTTPConnection('127.0.0.1', port)
+    latencies = []
+    for method, path, body in requests:
+        data = json.dumps(body) if body is not None else None
+        headers = {'Content-Type': 'application/json'} if data else {}
+        started = time.perf_counter()
+        connection.request(method, path, body=data, headers=headers)
+        response = connection.getresponse()
+        response.read()
+        latencies.append(time.perf_counter() - started)
+        if response.status >= 400:
+            raise RuntimeError(f"{method} {path} returned {response.status}")
+    connection.close()
+    return latencies
+
+
+def run_scenario(port, name, make_request, total, clients):
+    per_client = total // clients
+    batches = [[make_request(c * per_client + i) for i in range(per_client)] for c in range(clients)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        latencies = sorted(l for batch in pool.map(lambda b: client_worker(port, b), batches) for l in batch)
+    elapsed = time.perf_counter() - started
+    click.echo(f"{name:<22} {len(latencies) / elapsed:>8.0f} req/s   "
+               f"p50 {percentile(latencies, 0.5) * 1000:6.2f} ms   "
+               f"p95 {percentile(latencies, 0.95) * 1000:6.2f} ms   "
+               f"p99 {percentile(latencies, 0.99) * 1000:6.2f} ms")
+
+
+@click.command()
+@click.option('--requests', 'total', default=2000, show_default=True, help="Requests per scenario.")
+@click.option('--clients', default=8, show_default=True, help="Concurrent keep-alive clients.")
+@click.option('--movies', default=10000, show_default=True, help="Movies in the seeded database.")
+def main(total, clients, movies):
+    """Run the API server on a seeded temporary database and measure it."""
+    with temporary_database() as Session:
+        session = Session()
+        session.execute(insert(Category), [{'id': 1, 'name': 'Drama'}])
+        session.execute(insert(Movie), [
+            {'title': f'Movie {i}', 'director': f'Director {i % 50}', 'genre': 'Drama', 'category_id': 1}
+            for i in range(movies)
+        ])
+        session.commit()
+        url = str(session.get_bind().url)
+        session.close()
+
+        server = WatchlistServer(('127.0.0.1', 0), workers=clients, database_url=url, quiet=True)
+        port = server.server_address[1]
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            run_scenario(port, 'GET /movies/<id>', lambda i: ('GET', f'/movies/{i % movies + 1}', None),
+                         total, clients)
+            run_scenario(port, 'GET /movies page', lambda i: ('GET', '/movies?sort=title&page_size=50', None),
+                         total, clients)
+            run_scenario(port, 'GET /search', lambda i: ('GET', f'/search?q=director+{i % 50}', None),
+                         total, clients)
+            run_scenario(port, 'POST /reviews',
+                         lambda i: ('POST', '/reviews', {'movie_id': i % movies + 1, 'rating': 4, 'comment': 'ok'}),
+                         total, clients)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+if __name__ == '__main__':
+    main()
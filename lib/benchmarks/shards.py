@@ -0,0 +1,101 @@
+"""Compare concurrent writers on one database file with the same writers on shard files.
+
+    python -m benchmarks.shards --writers 8 --ops 200
+
+Every writer is a different user adding movies and reviews, one commit per
+write, from its own thread. In single-file mode they all queue for the same
+write lock; in sharded mode each user's bucket has its own file. The global
+top-rated query is timed afterwards, fanned out over the shards.
+"""
+import os
+import tempfile
+import threading
+import time
+
+import click
+from sqlalchemy import insert
+from sqlalchemy.orm import sessionmaker
+
+from helpers import Movie, Review, User
+from models import Base, make_engine
+from passwords import hash_password
+from shards import ShardRouter
+from benchmarks import lookup_cache_disabled
+
+
+def write_load(session, user_id, ops):
+    for index in range(ops):
+        movie = Movie.create(session, f"Movie {user_id}-{index}", "Director", "Drama", user_id=user_id)
+        Review.create(session, movie.id, index % 5 + 1, "benchmark review", user_id=user_id)
+
+
+def run_writers(open_session, users, ops):
+    """Run one writer thread per user and return the elapsed seconds."""
+    errors = []
+
+    def writer(user):
+        try:
+            with open_session(user) as session:
+                write_load(session, user.id, ops)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=writer, args=(user,)) for user in users]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    if errors:
+        raise click.ClickException(f"{len(errors)} writers failed, first error: {errors[0]!r}")
+    return elapsed
+
+
+def create_users(Session, count):
+    stored = hash_password('password')
+    with Session() as session:
+        session.execute(insert(User), [{'id': i, 'username': f"user{i}", 'password': stored}
+                                       for i in range(1, count + 1)])
+        session.commit()
+        return session.query(User).order_by(User.id).all()
+
+
+def time_call(call, repeat=20):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        call()
+    return (time.perf_counter() - started) * 1000 / repeat
+
+
+@click.command()
+@click.option('--writers', default=8, show_default=True, help="Concurrent writer threads, one user each.")
+@click.option('--ops', default=200, show_default=True, help="Movies (each with a review) added per writer.")
+@click.option('--max-open', default=32, show_default=True, help="Shard engines kept open.")
+def main(writers, ops, max_open):
+    """Print write throughput for one file and for one shard per writer."""
+    writes = writers * ops * 2
+    with tempfile.TemporaryDirectory(prefix='watchlist-shards-') as directory, lookup_cache_disabled():
+        engine = make_engine(f"sqlite:///{os.path.join(directory, 'single.db')}", pool_size=writers)
+        Base.metadata.create_all(engine)
+        Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        users = create_users(Session, writers)
+        single = run_writers(lambda user: Session(), users, ops)
+        with Session() as session:
+            single_top = time_call(lambda: Movie.top_rated(session, limit=10))
+        engine.dispose()
+
+        router = ShardRouter(os.path.join(directory, 'shards'), shard_count=writers, max_open=max_open)
+        sharded = run_writers(router.session_for, users, ops)
+        sharded_top = time_call(lambda: router.top_rated(limit=10))
+        shard_files, open_engines, opened, evicted = router.stats()
+        router.dispose()
+
+    click.echo(f"{writers} writers x {ops} movies and reviews ({writes} commits)")
+    click.echo(f"one file:      {writes / single:>9.1f} writes/s   top rated {single_top:.2f} ms")
+    click.echo(f"{shard_files} shard files: {writes / sharded:>9.1f} writes/s   top rated {sharded_top:.2f} ms "
+               f"(fan-out; {open_engines} engines open, {opened} opened, {evicted} evicted)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+"""Check that the listing calls run a fixed number of SQL statements, whatever the result size.
+
+    python -m benchmarks.statements
+
+Every call is made against generated databases of increasing size, in a
+fresh session, and its rows rendered the way the CLI renders them (category
+name and rating included). If the statement count grows with the number of
+rows, something is lazy loading per row: the offending statements are
+printed and the command exits 1.
+
+The write paths are checked too: creating or updating a row and printing
+the result must take one statement. A second one is usually the row being
+reloaded because the commit expired it.
+Writes that fail and are rolled back must leave nothing behind for the
+next write to pick up, such as a cached id of a row the rollback removed.
+"""
+import sys
+from collections import Counter
+
+import click
+from sqlalchemy.exc import IntegrityError
+
+from helpers import Movie, Review, Category, User, MOVIE_FIELDS, REVIEW_FIELDS, CATEGORY_FIELDS, USER_FIELDS
+from instrumentation import count_statements
+from benchmarks import temporary_database, lookup_cache_disabled
+from benchmarks.dataset import generate
+
+SIZES = (1, 10, 100)
+
+# (name, call returning the rows to render, fields the CLI prints for them)
+CALLS = [
+    ("Movie.get_all", lambda session: Movie.get_all(session), 'movie'),
+    ("Movie.get_page", lambda session: Movie.get_page(session, page_size=1000)[0], 'movie'),
+    ("Movie.get_page(title)", lambda session: Movie.get_page(session, sort_key='title', page_size=1000)[0], 'movie'),
+    ("Movie.stream", lambda session: Movie.stream(session, batch_size=10), 'movie'),
+    ("Movie.find_by_category", lambda session: Movie.find_by_category(session, 1), 'movie'),
+    ("Movie.top_rated", lambda session: Movie.top_rated(session, limit=1000, min_reviews=0), 'movie'),
+    ("Movie.get_page_rows", lambda session: Movie.get_page_rows(session, page_size=1000)[0], 'movie'),
+    ("Movie.stream_rows", lambda session: Movie.stream_rows(session, batch_size=10), 'movie'),
+    ("Movie.find_rows_by_category", lambda session: Movie.find_rows_by_category(session, 1), 'movie'),
+    ("MovieFilter.rows", lambda session: Movie.filter(watched=False, sort_key='title').rows(session, batch_size=10),
+     'movie'),
+    ("MovieFilter.all", lambda session: Movie.filter(watched=False, sort_key='title').all(session), 'movie'),
+    ("Category.get_all", lambda session: Category.get_all(session), 'category'),
+    ("Category.get_all_rows", lambda session: Category.get_all_rows(session), 'category'),
+]
+
+
+# (name, write call returning the row the CLI prints, fields it prints)
+WRITE_CALLS = [
+    ("Movie.create", lambda session: Movie.create(session, "Up", "Pete Docter", "Animation"), 'movie'),
+    ("Movie.mark_watched", lambda session: Movie.mark_watched(session, 1), 'movie'),
+    ("Review.create", lambda session: Review.create(session, 1, 4.5, "Still holds up"), 'review'),
+    ("Category.create", lambda session: Category.create(session, "Shorts"), 'category'),
+    ("User.create", lambda session: User.create(session, "statements", "password"), 'user'),
+]
+
+
+def render(rows, kind):
+    from cli import record
+    fields = {'movie': MOVIE_FIELDS, 'review': REVIEW_FIELDS, 'category': CATEGORY_FIELDS, 'user': USER_FIELDS}[kind]
+    return [record(row, fields) for row in rows]
+
+
+def measure(sizes=SIZES):
+    """Return {call name: [(rows, statements) per size]}."""
+    measurements = {name: [] for name, _, _ in CALLS}
+    for size in sizes:
+        with temporary_database() as Session:
+            with Session() as session:
+                # One category per movie is the worst case for per-row category loads
+                generate(session, movies=size, categories=size, reviews_per_movie=2, seed=size)
+            engine = Session.kw['bind']
+            for name, call, kind in CALLS:
+                with Session() as session, count_statements(engine) as statements:
+                    rows = render(call(session), kind)
+                measurements[name].append((len(rows), statements))
+    return measurements
+
+
+def check_statement_counts(sizes=SIZES):
+    """Return (name, [(rows, statement count)], ok, extra statements) for every listing call."""
+    results = []
+    with lookup_cache_disabled():
+        measurements = measure(sizes)
+    for name, runs in measurements.items():
+        counts = [(rows, len(statements)) for rows, statements in runs]
+        ok = len({count for _, count in counts}) == 1
+        extra = Counter(runs[-1][1]) - Counter(runs[0][1])
+        results.append((name, counts, ok, extra))
+    return results
+
+
+def check_write_statements():
+    """Return (name, statements, ok) for every write call, rendered the way the CLI prints it."""
+    results = []
+    with lookup_cache_disabled(), temporary_database() as Session:
+        with Session() as session:
+            generate(session, movies=10, categories=0, reviews_per_movie=0)
+        engine = Session.kw['bind']
+        for name, call, kind in WRITE_CALLS:
+            with Session() as session, count_statements(engine) as statements:
+                render([call(session)], kind)
+            results.append((name, statements, len(statements) == 1))
+    return results
+
+
+def check_rolled_back_writes():
+    """Return (name, ok, detail) for writes repeated after the same write failed and was rolled back."""
+    results = []
+    with temporary_database() as Session:
+        with Session() as session:
+            generate(session, movies=10, categories=0, reviews_per_movie=0)
+            # The unknown category fails the INSERT after the new genre went in
+            try:
+                Movie.create(session, "Up", "Pete Docter", "Zzz", category_id=999)
+            except IntegrityError:
+                session.rollback()
+            # A genre created now gets the id the rolled-back one had
+            created = [Movie.create(session, "Coco", "Lee Unkrich", "Qqq"),
+                       Movie.create(session, "Up", "Pete Docter", "Zzz")]
+            genres = [[genre.name for genre in movie.genres] for movie in created]
+        results.append(("Movie.create after a rollback", genres == [['Qqq'], ['Zzz']],
+                        f"genres linked: {genres}"))
+    return results
+
+
+@click.command()
+def main():
+    """Fail if any listing call's statement count grows with its result size, or a write reloads its row."""
+    failed = False
+    for name, counts, ok, extra in check_statement_counts():
+        summary = ', '.join(f"{statements} statements for {rows} rows" for rows, statements in counts)
+        click.echo(f"{'OK' if ok else 'GROWS'}: {name}: {summary}")
+        for statement, times in extra.items():
+            click.echo(f"    +{times} x {statement}")
+        failed = failed or not ok
+    for name, statements, ok in check_write_statements():
+        click.echo(f"{'OK' if ok else 'RELOADS'}: {name}: {len(statements)} statements")
+        if not ok:
+            for statement in statements:
+                click.echo(f"    {statement}")
+        failed = failed or not ok
+    for name, ok, detail in check_rolled_back_writes():
+        click.echo(f"{'OK' if ok else 'STALE'}: {name}: {detail}")
+        failed = failed or not ok
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,466 @@
+"""Timed scenarios for every model classmethod and CLI listing, with JSON baselines.
+
+    python -m benchmarks.suite run --movies 100000 --output baseline.json
+    python -m benchmarks.suite run --dataset /tmp/watchlist-1m.db --baseline baseline.json
+    python -m benchmarks.suite compare baseline.json current.json --tolerance 0.1
+
+Read scenarios share one copy of the dataset; every repetition of a write
+scenario gets a fresh copy, so all runs start from the same rows. Each
+scenario is repeated and the fastest repetition is kept, which is the least
+noisy figure on a busy machine.
+"""
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+from collections import namedtuple
+from datetime import datetime, timezone
+
+import click
+import sqlalchemy
+from click.testing import CliRunner
+from sqlalchemy.orm import sessionmaker
+
+from helpers import SessionLocal, Movie, Review, Category, User
+from models import make_engine
+from benchmarks import lookup_cache_disabled, time_ops
+from benchmarks.dataset import GENRES, create_dataset
+from watchlist import unit_of_work
+
+# kind is 'read' or 'write' (ops calls per repetition), 'transaction' (ops
+# calls in one watchlist.unit_of_work, timed with its commit), or 'table' or
+# 'rebuild' (one call over the whole table per repetition, reading or
+# writing). limit caps ops for scenarios that consume rows, e.g. one delete
+# per category.
+Scenario = namedtuple('Scenario', ['name', 'kind', 'run', 'limit'])
+
+SCENARIOS = []
+
+
+def scenario(name, kind='read', limit=None):
+    """Register a function run(session, context, index) as a benchmark scenario."""
+    def register(run):
+        SCENARIOS.append(Scenario(name, kind, run, limit))
+        return run
+    return register
+
+
+def movie_id(context, index):
+    return context['movie_ids'][index % len(context['movie_ids'])]
+
+
+def category_id(context, index):
+    return index % context['categories'] + 1
+
+
+def user_id(context, index):
+    return index % max(context['users'], 1) + 1
+
+
+@scenario('Category.get_all')
+def category_get_all(session, context, index):
+    Category.get_all(session)
+
+
+@scenario('Category.find_by_id')
+def category_find_by_id(session, context, index):
+    Category.find_by_id(session, category_id(context, index))
+
+
+@scenario('Category.find_by_name')
+def category_find_by_name(session, context, index):
+    Category.find_by_name(session, f"Category {category_id(context, index)}")
+
+
+@scenario('Movie.get_all', kind='table')
+def movie_get_all(session, context, index):
+    Movie.get_all(session)
+
+
+@scenario('Movie.get_page(id)')
+def movie_get_page_by_id(session, context, index):
+    Movie.get_page(session, after=(None, movie_id(context, index)))
+
+
+@scenario('Movie.get_page(title)')
+def movie_get_page_by_title(session, context, index):
+    Movie.get_page(session, sort_key='title', after=(f"The Lost River {movie_id(context, index)}", 0))
+
+
+@scenario('Movie.stream', kind='table')
+def movie_stream(session, context, index):
+    for _ in Movie.stream(session):
+        pass
+
+
+@scenario('Movie.get_page(user)')
+def movie_get_page_for_user(session, context, index):
+    Movie.get_page(session, user_id=user_id(context, index))
+
+
+@scenario('Movie.top_rated(user)')
+def movie_top_rated_for_user(session, context, index):
+    Movie.top_rated(session, user_id=user_id(context, index))
+
+
+@scenario('Movie.search(user)')
+def movie_search_for_user(session, context, index):
+    Movie.search(session, 'river', user_id=user_id(context, index))
+
+
+@scenario('User.find_by_username')
+def user_find_by_username(session, context, index):
+    User.find_by_username(session, f"user{user_id(context, index)}")
+
+
+@scenario('Movie.get_page_rows(id)')
+def movie_get_page_rows_by_id(session, context, index):
+    Movie.get_page_rows(session, after=(None, movie_id(context, index)))
+
+
+@scenario('Movie.stream_rows', kind='table')
+def movie_stream_rows(session, context, index):
+    for _ in Movie.stream_rows(session):
+        pass
+
+
+@scenario('Movie.filter')
+def movie_filter(session, context, index):
+    genre = GENRES[index % len(GENRES)]
+    list(Movie.filter(genre=genre, watched=False, min_rating=4, sort_key='rating', descending=True, limit=50)
+         .rows(session))
+
+
+@scenario('Movie.find_by_id')
+def movie_find_by_id(session, context, index):
+    Movie.find_by_id(session, movie_id(context, index))
+
+
+@scenario('Movie.find_by_category')
+def movie_find_by_category(session, context, index):
+    Movie.find_by_category(session, category_id(context, index))
+
+
+@scenario('Movie.top_rated')
+def movie_top_rated(session, context, index):
+    Movie.top_rated(session)
+
+
+@scenario('Movie.search(selective)')
+def movie_search_selective(session, context, index):
+    # Titles end in the movie id, so this matches a handful of rows
+    Movie.search(session, str(movie_id(context, index)))
+
+
+@scenario('Movie.search(common)')
+def movie_search_common(session, context, index):
+    Movie.search(session, 'river')
+
+
+@scenario('Review.get_all', kind='table')
+def review_get_all(session, context, index):
+    Review.get_all(session)
+
+
+@scenario('Review.find_by_id')
+def review_find_by_id(session, context, index):
+    Review.find_by_id(session, index % max(context['reviews'], 1) + 1)
+
+
+def run_cli(*args):
+    from cli import cli
+    result = CliRunner().invoke(cli, list(args), catch_exceptions=False)
+    if result.exit_code != 0:
+        raise click.ClickException(f"watchlist {' '.join(args)} exited with {result.exit_code}")
+
+
+@scenario('cli movies list', kind='table')
+def cli_movies_list(session, context, index):
+    run_cli('movies', 'list', '--limit', str(context['list_limit']))
+
+
+@scenario('cli movies list --format json', kind='table')
+def cli_movies_list_json(session, context, index):
+    run_cli('movies', 'list', '--format', 'json', '--limit', str(context['list_limit']))
+
+
+@scenario('cli movies list --format csv', kind='table')
+def cli_movies_list_csv(session, context, index):
+    run_cli('movies', 'list', '--format', 'csv', '--limit', str(context['list_limit']))
+
+
+@scenario('cli movies list --sort title', kind='table')
+def cli_movies_list_by_title(session, context, index):
+    run_cli('movies', 'list', '--sort', 'title', '--limit', str(context['list_limit']))
+
+
+@scenario('cli movies list --category-id')
+def cli_movies_list_category(session, context, index):
+    run_cli('movies', 'list', '--category-id', str(category_id(context, index)),
+            '--limit', str(context['list_limit']))
+
+
+@scenario('cli movies search')
+def cli_movies_search(session, context, index):
+    run_cli('movies', 'search', 'river')
+
+
+@scenario('cli categories list')
+def cli_categories_list(session, context, index):
+    run_cli('categories', 'list')
+
+
+@scenario('Category.create', kind='write')
+def category_create(session, context, index):
+    Category.create(session, f"Benchmark category {index}")
+
+
+@scenario('Category.delete', kind='write', limit=lambda context: context['categories'])
+def category_delete(session, context, index):
+    Category.delete(session, index + 1)
+
+
+@scenario('Movie.create', kind='write')
+@scenario('Movie.create(unit of work)', kind='transaction')
+def movie_create(session, context, index):
+    Movie.create(session, f"Benchmark movie {index}", "Benchmark director", "Drama", category_id(context, index))
+
+
+@scenario('Movie.delete', kind='write', limit=lambda context: context['movies'])
+@scenario('Movie.delete(unit of work)', kind='transaction', limit=lambda context: context['movies'])
+def movie_delete(session, context, index):
+    Movie.delete(session, movie_id(context, index))
+
+
+@scenario('Movie.mark_watched', kind='write')
+@scenario('Movie.mark_watched(unit of work)', kind='transaction')
+def movie_mark_watched(session, context, index):
+    Movie.mark_watched(session, movie_id(context, index), watched=index % 2 == 0)
+
+
+@scenario('Movie.bulk_mark_watched', kind='write')
+def movie_bulk_mark_watched(session, context, index):
+    Movie.bulk_mark_watched(session, watched=index % 2 == 0, category_id=category_id(context, index))
+
+
+@scenario('Movie.bulk_delete', kind='write', limit=lambda context: context['movies'] // 10)
+def movie_bulk_delete(session, context, index):
+    Movie.bulk_delete(session, id_range=(index * 10 + 1, index * 10 + 10))
+
+
+@scenario('Movie.rebuild_ratings', kind='rebuild')
+def movie_rebuild_ratings(session, context, index):
+    Movie.rebuild_ratings(session)
+
+
+@scenario('Movie.rebuild_search_index', kind='rebuild')
+def movie_rebuild_search_index(session, context, index):
+    Movie.rebuild_search_index(session)
+
+
+@scenario('Review.create', kind='write')
+@scenario('Review.create(unit of work)', kind='transaction')
+def review_create(session, context, index):
+    Review.create(session, movie_id(context, index), 1 + index % 5, "Benchmark review")
+
+
+@scenario('Review.delete', kind='write', limit=lambda context: context['reviews'])
+def review_delete(session, context, index):
+    Review.delete(session, index + 1)
+
+
+def dataset_counts(path):
+    connection = sqlite3.connect(path)
+    try:
+        return {table: connection.execute(f"SELECT count(*) FROM {table}").fetchone()[0]
+                for table in ('categories', 'movies', 'reviews', 'users')}
+    finally:
+        connection.close()
+
+
+def open_copy(source, directory, name):
+    """Copy the dataset into directory and return (engine, sessionmaker) for the copy."""
+    path = os.path.join(directory, name)
+    shutil.copyfile(source, path)
+    engine = make_engine(f"sqlite:///{path}")
+    return engine, sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def run_scenario(item, Session, context, ops, repeat, fresh_copy):
+    """Return (ops, best seconds) for one scenario."""
+    count = 1 if item.kind in ('table', 'rebuild') else min(ops, item.limit(context) if item.limit else ops)
+    best = None
+    for repetition in range(repeat):
+        engine = None
+        if fresh_copy:
+            engine, Session = fresh_copy(repetition)
+        session = Session()
+        try:
+            if item.kind == 'transaction':
+                def run_all(_):
+                    with unit_of_work(session):
+                        for index in range(count):
+                            item.run(session, context, index)
+                _, seconds = time_ops(run_all, [count])
+            else:
+                _, seconds = time_ops(lambda index: item.run(session, context, index), range(count))
+        finally:
+            session.close()
+            if engine is not None:
+                engine.dispose()
+        best = seconds if best is None else min(best, seconds)
+    return count, best
+
+
+def run_suite(source, ops=200, repeat=3, only=(), list_limit=10000, seed=0, on_result=None):
+    """Run every scenario (or those whose name contains one of only) against a copy of source."""
+    counts = dataset_counts(source)
+    rng = random.Random(seed + 1)
+    # Distinct ids, so each delete scenario call removes a different movie
+    movie_ids = rng.sample(range(1, counts['movies'] + 1), min(ops, counts['movies'])) or [1]
+    context = dict(counts, list_limit=list_limit, movie_ids=movie_ids)
+    selected = [item for item in SCENARIOS if not only or any(pattern in item.name for pattern in only)]
+    results = {}
+    with tempfile.TemporaryDirectory(prefix='watchlist-bench-') as directory:
+        engine, Session = open_copy(source, directory, 'read.db')
+        # The CLI opens its sessions from SessionLocal
+        previous_bind = SessionLocal.kw['bind']
+        SessionLocal.configure(bind=engine)
+        try:
+            for item in selected:
+                if item.kind in ('write', 'transaction', 'rebuild'):
+                    def fresh_copy(repetition):
+                        return open_copy(source, directory, f"write-{repetition}.db")
+                else:
+                    fresh_copy = None
+                count, seconds = run_scenario(item, Session, context, ops, repeat, fresh_copy)
+                results[item.name] = {
+                    'ops': count,
+                    'seconds': seconds,
+                    'ops_per_sec': count / seconds if seconds else None,
+                    'mean_ms': seconds * 1000 / count,
+                }
+                if on_result:
+                    on_result(item.name, results[item.name])
+        finally:
+            SessionLocal.configure(bind=previous_bind)
+            engine.dispose()
+    return counts, results
+
+
+def compare_results(baseline, current, tolerance):
+    """Yield (name, baseline ops/s, current ops/s, ratio, status) for every scenario in current."""
+    for name, result in current.items():
+        before = (baseline.get(name) or {}).get('ops_per_sec')
+        after = result.get('ops_per_sec')
+        if not before or not after:
+            yield name, before, after, None, 'new'
+            continue
+        ratio = after / before
+        if ratio < 1 - tolerance:
+            status = 'REGRESSION'
+        elif ratio > 1 + tolerance:
+            status = 'faster'
+        else:
+            status = 'ok'
+        yield name, before, after, ratio, status
+
+
+def report_comparison(baseline, current, tolerance):
+    """Print the comparison table and return True if any scenario regressed."""
+    regressed = False
+    click.echo(f"{'scenario':<34} {'base ops/s':>11} {'ops/s':>11} {'ratio':>7}")
+    for name, before, after, ratio, status in compare_results(baseline, current, tolerance):
+        before_text = f"{before:>11.1f}" if before else f"{'-':>11}"
+        after_text = f"{after:>11.1f}" if after else f"{'-':>11}"
+        ratio_text = f"{ratio:>6.2f}x" if ratio else f"{'-':>7}"
+        click.echo(f"{name:<34} {before_text} {after_text} {ratio_text}  {status}")
+        regressed = regressed or status == 'REGRESSION'
+    return regressed
+
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'sqlalchemy': sqlalchemy.__version__,
+        'platform': platform.platform(),
+    }
+
+
+@click.group()
+def main():
+    """Benchmark the watchlist models and CLI listings."""
+
+
+@main.command('run')
+@click.option('--dataset', type=click.Path(exists=True, dir_okay=False),
+              help="Database from 'python -m benchmarks.dataset'; generated on the fly if omitted.")
+@click.option('--movies', default=10000, show_default=True, help="Movies to generate without --dataset.")
+@click.option('--categories', default=50, show_default=True, help="Categories to generate without --dataset.")
+@click.option('--reviews-per-movie', default=3, show_default=True, help="Average reviews to generate per movie.")
+@click.option('--users', default=0, show_default=True, help="Users owning the movies to generate without --dataset.")
+@click.option('--seed', default=0, show_default=True)
+@click.option('--ops', default=200, show_default=True, help="Calls per repetition of each scenario.")
+@click.option('--repeat', default=3, show_default=True, help="Repetitions per scenario; the fastest counts.")
+@click.option('--only', multiple=True, help="Run only scenarios whose name contains this text.")
+@click.option('--list-limit', default=10000, show_default=True, help="Rows printed by the CLI listing scenarios.")
+@click.option('--cache', is_flag=True, help="Keep the lookup cache enabled.")
+@click.option('--output', type=click.Path(dir_okay=False), help="Write the results to this JSON file.")
+@click.option('--baseline', type=click.File('r'), help="Compare the results with this JSON file.")
+@click.option('--tolerance', default=0.1, show_default=True, help="Allowed slowdown before a regression is flagged.")
+def run_command(dataset, movies, categories, reviews_per_movie, users, seed, ops, repeat, only, list_limit, cache,
+                output, baseline, tolerance):
+    """Run the scenarios and print ops/sec for each."""
+    def on_result(name, result):
+        click.echo(f"{name:<34} {result['ops']:>7} ops {result['ops_per_sec'] or 0:>11.1f} ops/s "
+                   f"{result['mean_ms']:>10.3f} ms/op")
+
+    with tempfile.TemporaryDirectory(prefix='watchlist-dataset-') as directory:
+        if dataset is None:
+            dataset = os.path.join(directory, 'dataset.db')
+            click.echo(f"Generating {movies} movies (seed {seed})...", err=True)
+            create_dataset(dataset, movies, categories, reviews_per_movie, seed, users)
+        if cache:
+            counts, results = run_suite(dataset, ops, repeat, only, list_limit, seed, on_result)
+        else:
+            with lookup_cache_disabled():
+                counts, results = run_suite(dataset, ops, repeat, only, list_limit, seed, on_result)
+
+    document = {
+        'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'dataset': dict(counts, seed=seed),
+        'settings': {'ops': ops, 'repeat': repeat, 'list_limit': list_limit, 'cache': cache},
+        'environment': environment(),
+        'results': results,
+    }
+    if output:
+        with open(output, 'w') as file:
+            json.dump(document, file, indent=2)
+            file.write('\n')
+        click.echo(f"Results written to {output}", err=True)
+    if baseline:
+        click.echo()
+        if report_comparison(json.load(baseline)['results'], results, tolerance):
+            sys.exit(1)
+
+
+@main.command('compare')
+@click.argument('baseline', type=click.File('r'))
+@click.argument('current', type=click.File('r'))
+@click.option('--tolerance', default=0.1, show_default=True, help="Allowed slowdown before a regression is flagged.")
+def compare_command(baseline, current, tolerance):
+    """Compare two result files and exit 1 if any scenario got slower than the tolerance allows."""
+    baseline, current = json.load(baseline), json.load(current)
+    if baseline.get('dataset') != current.get('dataset'):
+        click.echo(f"warning: datasets differ ({baseline.get('dataset')} vs {current.get('dataset')})", err=True)
+    if report_comparison(baseline['results'], current['results'], tolerance):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
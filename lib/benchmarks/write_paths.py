@@ -0,0 +1,115 @@
+"""Compare the single-statement write paths with the old select-then-write versions.
+
+    python -m benchmarks.write_paths --ops 2000
+"""
+import click
+from sqlalchemy import insert
+
+from helpers import Movie, Review, Category
+from benchmarks import temporary_database, lookup_cache_disabled, time_ops
+
+REVIEWS_PER_MOVIE = 3
+
+
+# The pre-RETURNING implementations: load the row into the ORM, then write it.
+# Deletes also load every child the ORM cascade had to delete one by one.
+
+def legacy_mark_watched(session, movie_id, watched=True):
+    movie = session.query(Movie).filter_by(id=movie_id).one_or_none()
+    if movie:
+        movie.watched = watched
+        session.commit()
+        return movie
+    return None
+
+
+def legacy_delete_movie(session, movie_id):
+    movie = session.query(Movie).filter_by(id=movie_id).one_or_none()
+    if movie:
+        for review in list(movie.reviews):
+            session.delete(review)
+        session.delete(movie)
+        session.commit()
+        return True
+    return False
+
+
+def legacy_delete_review(session, review_id):
+    review = session.query(Review).filter_by(id=review_id).one_or_none()
+    if review:
+        session.delete(review)
+        session.commit()
+        return True
+    return False
+
+
+def legacy_delete_category(session, category_id):
+    category = session.query(Category).filter_by(id=category_id).one_or_none()
+    if category:
+        for movie in list(category.movies):
+            for review in list(movie.reviews):
+                session.delete(review)
+            session.delete(movie)
+        session.delete(category)
+        session.commit()
+        return True
+    return False
+
+
+def seed(session, movies, categories):
+    """Insert categories, movies and REVIEWS_PER_MOVIE reviews per movie."""
+    session.execute(insert(Category), [{'id': i, 'name': f'Category {i}'} for i in range(1, categories + 1)])
+    session.execute(insert(Movie), [
+        {'id': i, 'title': f'Movie {i}', 'director': f'Director {i % 97}', 'genre': 'Drama',
+         'category_id': i % categories + 1}
+        for i in range(1, movies + 1)
+    ])
+    session.execute(insert(Review), [
+        {'movie_id': i, 'rating': 1 + (i + n) % 5, 'comment': f'Review {n} of movie {i}'}
+        for i in range(1, movies + 1) for n in range(REVIEWS_PER_MOVIE)
+    ])
+    session.commit()
+
+
+def run_pair(name, ops, before, after, movies, categories):
+    """Time the legacy and current implementation, each on its own fresh database."""
+    results = []
+    for label, operation in (('before', before), ('after', after)):
+        with temporary_database() as Session:
+            session = Session()
+            seed(session, movies, categories)
+            count, seconds = operation(session, ops)
+            session.close()
+        results.append((label, count / seconds if seconds else float('inf')))
+    (_, before_rate), (_, after_rate) = results
+    click.echo(f"{name:<16} before: {before_rate:>9.0f} ops/s   after: {after_rate:>9.0f} ops/s   "
+               f"speedup: {after_rate / before_rate:.2f}x")
+
+
+@click.command()
+@click.option('--ops', default=2000, show_default=True, help="Operations per scenario.")
+@click.option('--categories', default=50, show_default=True, help="Categories in the seeded database.")
+def main(ops, categories):
+    """Report ops/sec for each write path before and after the RETURNING rewrite."""
+    movies = max(ops, categories)
+    with lookup_cache_disabled():
+        run_pair('mark_watched', ops,
+                 lambda s, n: time_ops(lambda i: legacy_mark_watched(s, i, i % 2 == 0), range(1, n + 1)),
+                 lambda s, n: time_ops(lambda i: Movie.mark_watched(s, i, i % 2 == 0), range(1, n + 1)),
+                 movies, categories)
+        run_pair('Movie.delete', ops,
+                 lambda s, n: time_ops(lambda i: legacy_delete_movie(s, i), range(1, n + 1)),
+                 lambda s, n: time_ops(lambda i: Movie.delete(s, i), range(1, n + 1)),
+                 movies, categories)
+        run_pair('Review.delete', ops,
+                 lambda s, n: time_ops(lambda i: legacy_delete_review(s, i), range(1, n + 1)),
+                 lambda s, n: time_ops(lambda i: Review.delete(s, i), range(1, n + 1)),
+                 movies, categories)
+        run_pair('Category.delete', categories,
+                 lambda s, n: time_ops(lambda i: legacy_delete_category(s, i), range(1, n + 1)),
+                 lambda s, n: time_ops(lambda i: Category.delete(s, i), range(1, n + 1)),
+                 movies, categories)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+import os
+import threading
+from collections import OrderedDict, namedtuple
+
+CacheStats = namedtuple('CacheStats', ['size', 'maxsize', 'hits', 'misses', 'invalidations'])
+
+
+class LookupCache:
+    """Bounded LRU of row values for the by-id and by-name model lookups.
+
+    Entries hold plain column values rather than ORM instances, so they can
+    be shared by every session in the process. Writers invalidate the keys
+    they touch; writes made by other connections or processes are detected
+    through SQLite's PRAGMA data_version, which changes whenever another
+    connection commits to the database file. That never shows this
+    connection's own rollbacks, so nothing read inside an uncommitted write
+    transaction is cached.
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def _scope(self, session):
+        return str(session.get_bind().url)
+
+    def _sync(self, session):
+        """Drop everything cached for this database if another connection has committed to it.
+
+        data_version is only comparable on the same connection, so the last
+        value is tracked per pooled connection. A connection seen for the
+        first time has no baseline and conservatively clears the scope.
+        """
+        connection = session.connection()
+        if connection.dialect.name != 'sqlite':
+            return
+        version = connection.exec_driver_sql('PRAGMA data_version').scalar()
+        scope = self._scope(session)
+        key = (scope, id(connection.connection.dbapi_connection))
+        with self._lock:
+            if self._versions.get(key) != version:
+                self._versions[key] = version
+                self._drop_scope(scope)
+
+    def _writing(self, session):
+        """Return True if the session's connection has uncommitted writes.
+
+        pysqlite only opens a transaction before a write (or when
+        models.begin_write() asks for one), so an open one means values read
+        now may be rolled back.
+        """
+        connection = session.connection()
+        return connection.dialect.name == 'sqlite' and connection.connection.dbapi_connection.in_transaction
+
+    def _drop_scope(self, scope):
+        stale = [key for key in self._entries if key[0] == scope]
+        for key in stale:
+            del self._entries[key]
+        self.invalidations += len(stale)
+
+    def get(self, session, key):
+        """Return the cached values for key, or None on a miss."""
+        if self.maxsize <= 0:
+            return None
+        self._sync(session)
+        full_key = (self._scope(session),) + key
+        with self._lock:
+            values = self._entries.get(full_key)
+            if values is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(full_key)
+            self.hits += 1
+            return values
+
+    def put(self, session, key, values):
+        """Cache values for key, evicting the least recently used entry when full.
+
+        Values read inside an uncommitted write transaction are not cached.
+        """
+        if self.maxsize <= 0 or self._writing(session):
+            return
+        full_key = (self._scope(session),) + key
+        with self._lock:
+            self._entries[full_key] = values
+            self._entries.move_to_end(full_key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, session, *keys):
+        """Forget the given keys after this process has written to them."""
+        scope = self._scope(session)
+        with self._lock:
+            for key in keys:
+                if self._entries.pop((scope,) + key, None) is not None:
+                    self.invalidations += 1
+
+    def invalidate_kind(self, session, kind):
+        """Forget every cached entry of one kind, e.g. after a set-based update."""
+        scope = self._scope(session)
+        with self._lock:
+            stale = [key for key in self._entries if key[0] == scope and key[1] == kind]
+            for key in stale:
+                del self._entries[key]
+            self.invalidations += len(stale)
+
+    def clear(self):
+        with self._lock:
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+            self._versions.clear()
+
+    def stats(self):
+        with self._lock:
+            return CacheStats(len(self._entries), self.maxsize, self.hits, self.misses, self.invalidations)
+
+
+# Set WATCHLIST_LOOKUP_CACHE_SIZE=0 to disable the cache.
+lookup_cache = LookupCache(maxsize=int(os.environ.get('WATCHLIST_LOOKUP_CACHE_SIZE', '1024')))
@@ -1,12 +1,53 @@
+import csv
+import json
+import sys
+
 import click
-from helpers import SessionLocal, Movie, Review, Category
-from models import Base
-from sqlalchemy.exc import OperationalError
+from helpers import SessionLocal, Movie, MovieFilter, Genre, Review, Category, User, COMMENT_PREVIEW_LENGTH
+from helpers import MOVIE_FIELDS, REVIEW_FIELDS, REVIEW_SUMMARY_FIELDS, USER_FIELDS, CATEGORY_FIELDS, GENRE_FIELDS
+from importer import import_movies
+from batch import run_batch
+from diagnostics import check_query_plans, describe_statement, database_settings, memory_usage
+from cache import lookup_cache
+from shards import router as shard_router, move_users
+from instrumentation import QueryProfiler, SLOW_QUERY_MS
+from models import Base, engine, recycle_session, SESSION_MAX_OBJECTS
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError, SQLAlchemyError
+
+# Exit codes for the scripted commands; click itself exits with 2 on usage errors.
+EXIT_OK = 0
+EXIT_NOT_FOUND = 1
+EXIT_USAGE = 2
+EXIT_DATABASE_ERROR = 3
+
+OUTPUT_FORMATS = ('text', 'json', 'csv')
+REVIEW_PAGE_SIZE = 10
 
 class MovieWatchlistCLI:
-    def __init__(self):
+    def __init__(self, profiler=None, max_objects=SESSION_MAX_OBJECTS):
         self.session = SessionLocal()
         self.database_initialized = False  # Flag to track if the database is initialized
+        self.profiler = profiler
+        self.profiled = (0, 0.0)
+        self.max_objects = max_objects
+        self.sessions_recycled = 0
+
+    def prompt_choice(self):
+        """Prompt for a menu choice, first reporting the SQL run since the last prompt when profiling.
+
+        Between actions the session is recycled according to the session
+        policy, so the objects earlier actions loaded don't pile up in it.
+        """
+        if recycle_session(self.session, self.max_objects):
+            self.sessions_recycled += 1
+        if self.profiler is not None:
+            count, seconds = self.profiler.snapshot()
+            if count > self.profiled[0]:
+                click.echo(f"[profile] {count - self.profiled[0]} SQL statements in "
+                           f"{(seconds - self.profiled[1]) * 1000:.2f} ms", err=True)
+            self.profiled = (count, seconds)
+        return click.prompt("Enter your choice", type=int)
 
     def display_menu(self):
         """Display the main menu."""
@@ -14,13 +55,14 @@ class MovieWatchlistCLI:
         click.echo("2. Movie Management")
         click.echo("3. Review Management")
         click.echo("4. Category Management")
-        click.echo("5. Exit")
+        click.echo("5. Database Tools")
+        click.echo("6. Exit")
 
     def run(self):
         """Run the CLI application."""
         while True:
             self.display_menu()
-            choice = click.prompt("Enter your choice", type=int)
+            choice = self.prompt_choice()
 
             if choice == 1:
                 self.initialize_database()
@@ -34,6 +76,9 @@ class MovieWatchlistCLI:
                 if self.check_initialization():
                     self.category_management()
             elif choice == 5:
+                if self.check_initialization():
+                    self.database_tools()
+            elif choice == 6:
                 click.echo("Exiting...")
                 break
             else:
@@ -52,7 +97,7 @@ class MovieWatchlistCLI:
             return True
         try:
             # Check if any table exists
-            self.session.execute('SELECT 1 FROM movies LIMIT 1')
+            self.session.execute(text('SELECT 1 FROM movies LIMIT 1'))
             self.database_initialized = True
             return True
         except OperationalError:
@@ -68,13 +113,18 @@ class MovieWatchlistCLI:
         click.echo("5. List all movies in a specific category.")
         click.echo("6. Mark a movie as watched.")
         click.echo("7. Mark a movie as not watched.")
-        click.echo("8. Return to main menu")
+        click.echo("8. Import movies from a CSV or JSONL file.")
+        click.echo("9. Search movies by title, director, genre or review.")
+        click.echo("10. List the top rated movies.")
+        click.echo("11. Mark several movies as watched or not watched.")
+        click.echo("12. Delete several movies.")
+        click.echo("13. Return to main menu")
 
     def movie_management(self):
         """Handle movie management operations."""
         while True:
             self.movie_management_menu()
-            choice = click.prompt("Enter your choice", type=int)
+            choice = self.prompt_choice()
 
             if choice == 1:
                 self.add_movie()
@@ -91,6 +141,16 @@ class MovieWatchlistCLI:
             elif choice == 7:
                 self.mark_movie_not_watched()
             elif choice == 8:
+                self.import_movies()
+            elif choice == 9:
+                self.search_movies()
+            elif choice == 10:
+                self.list_top_rated_movies()
+            elif choice == 11:
+                self.bulk_mark_watched()
+            elif choice == 12:
+                self.bulk_delete_movies()
+            elif choice == 13:
                 break
             else:
                 click.echo("Invalid choice. Please try again.")
@@ -102,8 +162,12 @@ class MovieWatchlistCLI:
         genre = click.prompt("Enter the genre of the movie")
         category_id = click.prompt("Enter the category ID for the movie (optional)", type=int, default=None)
 
-        movie = Movie.create(self.session, title, director, genre, category_id)
-        click.echo(f"Movie added: {movie}")
+        try:
+            movie = Movie.create(self.session, title, director, genre, category_id)
+            click.echo(f"Movie added: {movie}")
+        except Exception as e:
+            self.session.rollback()
+            click.echo(f"Failed to add movie: {str(e)}")
 
     def delete_movie(self):
         """Delete a movie from the watchlist by ID."""
@@ -116,29 +180,89 @@ class MovieWatchlistCLI:
 
     def list_movies(self):
         """List all movies in the watchlist with their IDs and watched status."""
-        movies = Movie.get_all(self.session)
-        if movies:
-            click.echo("List of movies in the watchlist:")
-            for movie in movies:
-                watched_status = "Watched" if movie.watched else "Not Watched"
-                click.echo(f"ID: {movie.id}, Title: {movie.title}, Director: {movie.director}, Genre: {movie.genre}, Watched: {watched_status}, Category ID: {movie.category_id}")
-        else:
-            click.echo("No movies found in the watchlist.")
+        sort_key = click.prompt("Sort movies by", type=click.Choice(Movie.SORT_KEYS), default='id')
+        page_size = click.prompt("Enter the number of movies per page (0 to list all)", type=int, default=50)
+
+        if page_size <= 0:
+            # Stream the whole table; rows are printed as they are fetched.
+            found = False
+            for movie in Movie.stream_rows(self.session, sort_key=sort_key):
+                if not found:
+                    click.echo("List of movies in the watchlist:")
+                    found = True
+                self.echo_movie(movie)
+            if not found:
+                click.echo("No movies found in the watchlist.")
+            return
+
+        cursor = None
+        page = 1
+        while True:
+            movies, cursor = Movie.get_page_rows(self.session, sort_key=sort_key, after=cursor, page_size=page_size)
+            if not movies and page == 1:
+                click.echo("No movies found in the watchlist.")
+                return
+            if movies:
+                click.echo(f"List of movies in the watchlist (page {page}):")
+                for movie in movies:
+                    self.echo_movie(movie)
+            if cursor is None or not click.confirm("Show the next page?", default=True):
+                return
+            page += 1
+
+    def echo_movie(self, movie):
+        """Print one movie on a single line."""
+        watched_status = "Watched" if movie.watched else "Not Watched"
+        click.echo(f"ID: {movie.id}, Title: {movie.title}, Director: {movie.director}, Genre: {movie.genre}, Watched: {watched_status}, Category: {movie.category_name}")
 
     def show_movie_details(self):
-        """Show details for a specific movie by ID."""
+        """Show details for a specific movie by ID, with its latest reviews."""
         movie_id = click.prompt("Enter the ID of the movie to show details", type=int)
-        movie = Movie.find_by_id(self.session, movie_id)
-        if movie:
-            watched_status = "Watched" if movie.watched else "Not Watched"
-            click.echo(f"ID: {movie.id}, Title: {movie.title}, Director: {movie.director}, Genre: {movie.genre}, Watched: {watched_status}, Category ID: {movie.category_id}")
-        else:
+        details = Movie.details(self.session, movie_id, reviews=REVIEW_PAGE_SIZE)
+        if details is None:
             click.echo("Movie not found.")
+            return
+        self.echo_movie(details.movie)
+        click.echo(f"Rating: {self.format_rating(details.movie)}")
+        if not details.reviews:
+            return
+        click.echo("Latest reviews:")
+        reviews, before = details.reviews, details.next_before
+        while True:
+            for review in reviews:
+                self.echo_review(review)
+            if before is None or not click.confirm("Show older reviews?", default=False):
+                return
+            reviews, before = Review.find_by_movie(self.session, movie_id, before=before, limit=REVIEW_PAGE_SIZE)
+
+    def echo_review(self, review):
+        """Print one review on a single line, marking shortened comments."""
+        comment = f"{review.comment}..." if review.truncated else review.comment
+        click.echo(f"ID: {review.id}, Rating: {review.rating}, Comment: {comment}")
+
+    def format_rating(self, movie):
+        """Format a movie's stored rating aggregate for display."""
+        if not movie.rating_count:
+            return "No reviews yet"
+        reviews = "review" if movie.rating_count == 1 else "reviews"
+        return f"{movie.rating_avg:.1f} / 5 from {movie.rating_count} {reviews}"
+
+    def list_top_rated_movies(self):
+        """List the highest rated movies."""
+        limit = click.prompt("Enter the number of movies to show", type=int, default=10)
+        min_reviews = click.prompt("Enter the minimum number of reviews", type=int, default=1)
+        movies = Movie.top_rated(self.session, limit=limit, min_reviews=min_reviews)
+        if movies:
+            click.echo("Top rated movies:")
+            for position, movie in enumerate(movies, start=1):
+                click.echo(f"{position}. ID: {movie.id}, Title: {movie.title}, Rating: {self.format_rating(movie)}")
+        else:
+            click.echo("No rated movies found.")
 
     def list_movies_by_category(self):
         """List all movies in a specific category."""
         category_id = click.prompt("Enter the ID of the category to list movies", type=int)
-        movies = Movie.find_by_category(self.session, category_id)
+        movies = Movie.find_rows_by_category(self.session, category_id)
         if movies:
             click.echo(f"Movies in category {category_id}:")
             for movie in movies:
@@ -165,11 +289,84 @@ class MovieWatchlistCLI:
         else:
             click.echo("Movie not found.")
 
+    def import_movies(self):
+        """Import movies from a CSV or JSONL file in batched inserts."""
+        path = click.prompt("Enter the path of the CSV or JSONL file")
+        chunk_size = click.prompt("Enter the number of rows per batch", type=int, default=1000)
+        savepoints = click.confirm("Skip failing batches instead of aborting the import?", default=False)
+
+        try:
+            result = import_movies(self.session, path, chunk_size=chunk_size, savepoints=savepoints)
+        except (OSError, ValueError) as e:
+            click.echo(f"Failed to import movies: {str(e)}")
+            return
+        except SQLAlchemyError as e:
+            # import_movies() has rolled the import back
+            click.echo(f"Failed to import movies: {getattr(e, 'orig', e)}")
+            return
+
+        click.echo(f"Imported {result.imported} movies in {result.elapsed:.2f}s ({result.rows_per_second:.0f} rows/sec).")
+        if result.skipped:
+            click.echo(f"Skipped {result.skipped} rows:")
+            for error in result.errors:
+                click.echo(f"  {error}")
+
+    def search_movies(self):
+        """Search movies by title, director, genre or review comments."""
+        query = click.prompt("Enter the words to search for")
+        results = Movie.search(self.session, query)
+        if results:
+            click.echo(f"Movies matching '{query}':")
+            for result in results:
+                click.echo(f"ID: {result.id}, Title: {result.title}, Director: {result.director}, Genre: {result.genre}")
+                if result.snippet:
+                    click.echo(f"    Reviews: {result.snippet}")
+        else:
+            click.echo("No movies matched your search.")
+
+    def prompt_movie_selection(self):
+        """Ask which movies a bulk operation applies to and return the selection keyword arguments."""
+        by = click.prompt("Select movies by", type=click.Choice(['ids', 'range', 'category', 'genre']), default='ids')
+        if by == 'ids':
+            text = click.prompt("Enter the movie IDs separated by commas")
+            return {'ids': [int(part) for part in text.replace(' ', '').split(',') if part]}
+        if by == 'range':
+            first = click.prompt("Enter the first movie ID", type=int)
+            last = click.prompt("Enter the last movie ID", type=int)
+            return {'id_range': (first, last)}
+        if by == 'category':
+            return {'category_id': click.prompt("Enter the category ID", type=int)}
+        return {'genre': click.prompt("Enter the genre")}
+
+    def bulk_mark_watched(self):
+        """Mark every selected movie as watched or not watched."""
+        watched = click.confirm("Mark the movies as watched? (No marks them as not watched)", default=True)
+        try:
+            selection = self.prompt_movie_selection()
+        except ValueError:
+            click.echo("Movie IDs must be whole numbers.")
+            return
+        changed = Movie.bulk_mark_watched(self.session, watched=watched, **selection)
+        status = "watched" if watched else "not watched"
+        click.echo(f"{changed} movies marked as {status}.")
+
+    def bulk_delete_movies(self):
+        """Delete every selected movie along with its reviews."""
+        try:
+            selection = self.prompt_movie_selection()
+        except ValueError:
+            click.echo("Movie IDs must be whole numbers.")
+            return
+        if not click.confirm("Delete the selected movies and their reviews?", default=False):
+            return
+        deleted = Movie.bulk_delete(self.session, **selection)
+        click.echo(f"{deleted} movies deleted.")
+
     def review_management(self):
         """Handle review management operations."""
         while True:
             self.review_management_menu()
-            choice = click.prompt("Enter your choice", type=int)
+            choice = self.prompt_choice()
 
             if choice == 1:
                 self.add_review()
@@ -204,6 +401,7 @@ class MovieWatchlistCLI:
             review = Review.create(self.session, movie_id, rating, comment)
             click.echo(f"Review added: {review}")
         except Exception as e:
+            self.session.rollback()
             click.echo(f"Failed to add review: {str(e)}")
 
     def delete_review(self):
@@ -219,7 +417,7 @@ class MovieWatchlistCLI:
         """Handle category management operations."""
         while True:
             self.category_management_menu()
-            choice = click.prompt("Enter your choice", type=int)
+            choice = self.prompt_choice()
 
             if choice == 1:
                 self.list_categories()
@@ -235,10 +433,646 @@ class MovieWatchlistCLI:
 
     def list_categories(self):
         """List all categories."""
-        categories = Category.get_all(self.session)
+        categories = Category.get_all_rows(self.session)
         for category in categories:
             click.echo(f"ID: {category.id}, Name: {category.name}")
 
+    def database_tools(self):
+        """Handle database maintenance and diagnostic operations."""
+        while True:
+            self.database_tools_menu()
+            choice = self.prompt_choice()
+
+            if choice == 1:
+                self.check_query_plans()
+            elif choice == 2:
+                self.show_database_settings()
+            elif choice == 3:
+                self.rebuild_search_index()
+            elif choice == 4:
+                self.rebuild_ratings()
+            elif choice == 5:
+                self.show_cache_stats()
+            elif choice == 6:
+                self.show_memory_usage()
+            elif choice == 7:
+                break
+            else:
+                click.echo("Invalid choice. Please try again.")
+
+    def database_tools_menu(self):
+        """Display the database tools menu."""
+        click.echo("1. Check query plans for full table scans.")
+        click.echo("2. Show active database settings.")
+        click.echo("3. Rebuild the full-text search index.")
+        click.echo("4. Recompute movie rating aggregates.")
+        click.echo("5. Show lookup cache statistics.")
+        click.echo("6. Show session and memory usage.")
+        click.echo("7. Return to main menu")
+
+    def check_query_plans(self):
+        """Show the query plan of every hot lookup and flag full table scans."""
+        results = check_query_plans(self.session)
+        for name, plan, ok in results:
+            status = "OK" if ok else "FULL SCAN"
+            click.echo(f"{status}: {name}: {'; '.join(plan)}")
+        if all(ok for _, _, ok in results):
+            click.echo("All hot lookups use an index.")
+        else:
+            click.echo("Some lookups scan a whole table. Run 'alembic upgrade head' to add the missing indexes.")
+
+    def show_database_settings(self):
+        """Show the engine options and the pragmas active on the current connection."""
+        for name, value in database_settings(self.session).items():
+            click.echo(f"{name}: {value}")
+
+    def rebuild_search_index(self):
+        """Repopulate the full-text search index from the movies and reviews tables."""
+        Movie.rebuild_search_index(self.session)
+        click.echo("Search index rebuilt.")
+
+    def rebuild_ratings(self):
+        """Recompute every movie's rating count, sum and average from its reviews."""
+        Movie.rebuild_ratings(self.session)
+        click.echo("Rating aggregates recomputed.")
+
+    def show_cache_stats(self):
+        """Show the size and hit rate of the movie/category lookup cache."""
+        stats = lookup_cache.stats()
+        lookups = stats.hits + stats.misses
+        hit_rate = f"{100.0 * stats.hits / lookups:.1f}%" if lookups else "n/a"
+        click.echo(f"Entries: {stats.size} / {stats.maxsize}")
+        click.echo(f"Hits: {stats.hits}, Misses: {stats.misses}, Hit rate: {hit_rate}")
+        click.echo(f"Invalidations: {stats.invalidations}")
+
+    def show_memory_usage(self):
+        """Show how many objects the session holds and how much memory the process uses."""
+        for name, value in memory_usage(self.session).items():
+            click.echo(f"{name}: {value}")
+        policy = "one per action" if self.max_objects <= 0 else f"recycled above {self.max_objects} objects"
+        click.echo(f"Session policy: {policy}; sessions recycled: {self.sessions_recycled}")
+
+
+def record(obj, fields):
+    """Return the given attributes of a model instance as a dict."""
+    return {field: getattr(obj, field) for field in fields}
+
+
+def format_text(row):
+    """Format a record as one 'Field: value' line, like the interactive menu does."""
+    parts = []
+    for field, value in row.items():
+        label = field.replace('_', ' ').title().replace('Id', 'ID')
+        if field == 'watched':
+            value = "Watched" if value else "Not Watched"
+        parts.append(f"{label}: {value}")
+    return ", ".join(parts)
+
+
+def emit_rows(rows, fields, output_format):
+    """Write records to stdout as they are produced and return how many were written.
+
+    Rows are never collected into a list first, so streamed listings start
+    printing immediately in every format.
+    """
+    out = click.get_text_stream('stdout')
+    count = 0
+    if output_format == 'csv':
+        writer = csv.DictWriter(out, fieldnames=fields)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    elif output_format == 'json':
+        out.write('[')
+        for row in rows:
+            out.write(('\n' if count == 0 else ',\n') + json.dumps(row))
+            count += 1
+        out.write('\n]\n' if count else ']\n')
+    else:
+        for row in rows:
+            click.echo(format_text(row))
+            count += 1
+    return count
+
+
+def emit_row(row, fields, output_format):
+    """Write a single record to stdout."""
+    if output_format == 'json':
+        click.echo(json.dumps(row))
+    else:
+        emit_rows([row], fields, output_format)
+
+
+def current_user_id():
+    """Return the ID of the user selected with --user, or None for the shared watchlist."""
+    return click.get_current_context().meta.get('user_id')
+
+
+def fail(message, code):
+    """Print an error to stderr and exit with the given code."""
+    click.echo(message, err=True)
+    sys.exit(code)
+
+
+format_option = click.option('--format', 'output_format', type=click.Choice(OUTPUT_FORMATS), default='text',
+                             show_default=True, help="Output format.")
+
+
+@click.group(name='watchlist', invoke_without_command=True)
+@click.option('--profile', is_flag=True, envvar='WATCHLIST_PROFILE',
+              help="Print the number and duration of the SQL statements each command runs.")
+@click.option('--slow-query-ms', type=float, default=SLOW_QUERY_MS, show_default=True,
+              help="Statements slower than this go to the slow-query log.")
+@click.option('--slow-query-log', type=click.Path(dir_okay=False), envvar='WATCHLIST_SLOW_QUERY_LOG',
+              help="Append slow statements to this file.")
+@click.option('--user', 'username', envvar='WATCHLIST_USER',
+              help="Work on this user's watchlist instead of the shared one.")
+@click.pass_context
+def cli(ctx, profile, slow_query_ms, slow_query_log, username):
+    """Manage the movie watchlist. Run without a command for the interactive menu."""
+    profiler = None
+    if profile or slow_query_log:
+        profiler = QueryProfiler(slow_query_ms=slow_query_ms, slow_query_log=slow_query_log).install(engine)
+        ctx.meta['profiler'] = profiler
+        ctx.call_on_close(profiler.remove)
+        if profile:
+            ctx.call_on_close(lambda: click.echo("\n".join(profiler.summary()), err=True))
+    if ctx.invoked_subcommand is None:
+        MovieWatchlistCLI(profiler=profiler if profile else None).run()
+        return
+    session = SessionLocal()
+    ctx.obj = ctx.meta['main_session'] = session
+    ctx.call_on_close(session.close)
+    if username is not None:
+        user = User.find_by_username(session, username)
+        if user is None:
+            fail(f"No user named {username!r}.", EXIT_NOT_FOUND)
+        ctx.meta['user_id'] = user.id
+        if shard_router is not None:
+            # The user's movies and reviews live in their shard file
+            ctx.obj = shard_router.session_for(user)
+            ctx.call_on_close(ctx.obj.close)
+
+
+@cli.command()
+@click.pass_context
+def menu(ctx):
+    """Run the interactive menu."""
+    profiler = ctx.meta.get('profiler')
+    MovieWatchlistCLI(profiler=profiler if ctx.parent.params['profile'] else None).run()
+
+
+@cli.command('init')
+@click.pass_obj
+def init_database(session):
+    """Create all the tables."""
+    Base.metadata.create_all(session.get_bind())
+    click.echo("Database initialized successfully.")
+
+
+@cli.group()
+def movies():
+    """Add, list, update and delete movies."""
+
+
+@movies.command('add')
+@click.argument('title')
+@click.argument('director')
+@click.argument('genre')
+@click.option('--category-id', type=int, default=None, help="Category of the movie.")
+@format_option
+@click.pass_obj
+def add_movie_command(session, title, director, genre, category_id, output_format):
+    """Add a movie to the watchlist."""
+    try:
+        movie = Movie.create(session, title, director, genre, category_id, user_id=current_user_id())
+    except SQLAlchemyError as e:
+        session.rollback()
+        fail(f"Failed to add movie: {getattr(e, 'orig', e)}", EXIT_DATABASE_ERROR)
+    emit_row(record(movie, MOVIE_FIELDS), MOVIE_FIELDS, output_format)
+
+
+@movies.command('list')
+@click.option('--title', default=None, help="Only movies with exactly this title.")
+@click.option('--title-contains', default=None, help="Only movies whose title contains this text.")
+@click.option('--director', default=None, help="Only movies by exactly this director.")
+@click.option('--director-contains', default=None, help="Only movies whose director contains this text.")
+@click.option('--genre', multiple=True, help="Only movies in this genre; repeat for any of several.")
+@click.option('--all-genres', is_flag=True, help="With several --genre, only movies in all of them.")
+@click.option('--watched/--unwatched', default=None, help="Only watched or only unwatched movies.")
+@click.option('--category-id', type=int, default=None, help="Only list movies in this category.")
+@click.option('--min-rating', type=float, default=None, help="Only movies rated at least this on average.")
+@click.option('--max-rating', type=float, default=None, help="Only movies rated at most this on average.")
+@click.option('--sort', 'sort_key', type=click.Choice(MovieFilter.SORT_KEYS), default='id', show_default=True)
+@click.option('--desc', 'descending', is_flag=True, help="Sort in descending order.")
+@click.option('--page-size', type=int, default=500, show_default=True, help="Rows fetched per round trip.")
+@click.option('--limit', type=int, default=None, help="Stop after this many movies.")
+@click.option('--explain', is_flag=True, help="Print the SQL, its parameters and its query plan to stderr.")
+@format_option
+@click.pass_obj
+def list_movies_command(session, sort_key, descending, page_size, limit, explain, all_genres, output_format,
+                        **criteria):
+    """List movies matching the given filters, streaming them as they are read.
+
+    All filters are combined into one SQL query; e.g. unwatched sci-fi by
+    Nolan rated 4 or more, best first:
+
+        movies list --unwatched --genre Sci-Fi --director-contains Nolan --min-rating 4 --sort rating --desc
+    """
+    genres = criteria.pop('genre') or None
+    criteria['all_genres' if all_genres else 'genre'] = genres
+    movie_filter = Movie.filter(sort_key, descending, limit, user_id=current_user_id(), **criteria)
+    if explain:
+        sql, params, plan = describe_statement(session, movie_filter.rows_select(session))
+        click.echo(sql, err=True)
+        click.echo(f"parameters: {params}", err=True)
+        for detail in plan:
+            click.echo(f"plan: {detail}", err=True)
+    rows = (movie._asdict() for movie in movie_filter.rows(session, batch_size=page_size))
+    emit_rows(rows, MOVIE_FIELDS, output_format)
+
+
+@movies.command('show')
+@click.argument('movie_id', type=int)
+@click.option('--reviews', 'review_count', type=int, default=0, show_default=True,
+              help="Also show this many of the movie's latest reviews.")
+@click.option('--before', type=int, default=None, help="Only show reviews older than this review ID.")
+@format_option
+@click.pass_obj
+def show_movie_command(session, movie_id, review_count, before, output_format):
+    """Show one movie, optionally with its latest reviews."""
+    user_id = current_user_id()
+    if review_count <= 0:
+        movie = Movie.find_by_id(session, movie_id)
+        if movie is None or user_id is not None and movie.user_id != user_id:
+            fail("Movie not found.", EXIT_NOT_FOUND)
+        emit_row(record(movie, MOVIE_FIELDS), MOVIE_FIELDS, output_format)
+        return
+    if output_format == 'csv':
+        raise click.UsageError("--reviews cannot be used with --format csv; use 'reviews list' instead.")
+    details = Movie.details(session, movie_id, reviews=review_count, before=before, user_id=user_id)
+    if details is None:
+        fail("Movie not found.", EXIT_NOT_FOUND)
+    reviews = [record(review, REVIEW_SUMMARY_FIELDS) for review in details.reviews]
+    if output_format == 'json':
+        click.echo(json.dumps(dict(record(details.movie, MOVIE_FIELDS), reviews=reviews,
+                                   next_before=details.next_before)))
+        return
+    click.echo(format_text(record(details.movie, MOVIE_FIELDS)))
+    for review in reviews:
+        click.echo("  " + format_text(review))
+    if details.next_before is not None:
+        click.echo(f"Older reviews: --before {details.next_before}")
+
+
+@movies.command('watch')
+@click.argument('movie_ids', type=int, nargs=-1, required=True)
+@click.option('--unwatch', is_flag=True, help="Mark the movies as not watched instead.")
+@click.pass_obj
+def watch_movies_command(session, movie_ids, unwatch):
+    """Mark one or more movies as watched."""
+    if len(movie_ids) == 1:
+        if Movie.mark_watched(session, movie_ids[0], watched=not unwatch, user_id=current_user_id()) is None:
+            fail("Movie not found.", EXIT_NOT_FOUND)
+        click.echo("1 movie updated.")
+        return
+    changed = Movie.bulk_mark_watched(session, watched=not unwatch, ids=movie_ids, user_id=current_user_id())
+    click.echo(f"{changed} movies updated.")
+
+
+@movies.command('delete')
+@click.argument('movie_ids', type=int, nargs=-1, required=True)
+@click.pass_obj
+def delete_movies_command(session, movie_ids):
+    """Delete one or more movies and their reviews."""
+    if len(movie_ids) == 1:
+        if not Movie.delete(session, movie_ids[0], user_id=current_user_id()):
+            fail("Movie not found.", EXIT_NOT_FOUND)
+        click.echo("1 movie deleted.")
+        return
+    deleted = Movie.bulk_delete(session, ids=movie_ids, user_id=current_user_id())
+    click.echo(f"{deleted} movies deleted.")
+
+
+@movies.command('search')
+@click.argument('query')
+@click.option('--limit', type=int, default=20, show_default=True)
+@format_option
+@click.pass_obj
+def search_movies_command(session, query, limit, output_format):
+    """Full-text search over titles, directors, genres and reviews."""
+    if shard_router is not None and current_user_id() is None:
+        results = shard_router.search(query, limit=limit, main=session)
+    else:
+        results = Movie.search(session, query, limit=limit, user_id=current_user_id())
+    fields = list(results[0]._fields) if results else ['id', 'title', 'director', 'genre', 'snippet', 'rank']
+    if not emit_rows((result._asdict() for result in results), fields, output_format) and output_format == 'text':
+        fail("No movies matched your search.", EXIT_NOT_FOUND)
+
+
+@movies.command('top')
+@click.option('--limit', type=int, default=10, show_default=True)
+@click.option('--min-reviews', type=int, default=1, show_default=True, help="Skip movies with fewer reviews.")
+@format_option
+@click.pass_obj
+def top_rated_command(session, limit, min_reviews, output_format):
+    """List the highest rated movies."""
+    if shard_router is not None and current_user_id() is None:
+        movies = shard_router.top_rated(limit=limit, min_reviews=min_reviews, main=session)
+    else:
+        movies = Movie.top_rated(session, limit=limit, min_reviews=min_reviews, user_id=current_user_id())
+    emit_rows((record(movie, MOVIE_FIELDS) for movie in movies), MOVIE_FIELDS, output_format)
+
+
+@movies.command('import')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--chunk-size', type=int, default=1000, show_default=True, help="Rows per batched insert.")
+@click.option('--savepoints', is_flag=True, help="Skip failing batches instead of aborting the import.")
+@click.pass_obj
+def import_movies_command(session, path, chunk_size, savepoints):
+    """Import movies from a CSV or JSONL file."""
+    try:
+        result = import_movies(session, path, chunk_size=chunk_size, savepoints=savepoints, user_id=current_user_id())
+    except SQLAlchemyError as e:
+        fail(f"Import failed: {getattr(e, 'orig', e)}", EXIT_DATABASE_ERROR)
+    click.echo(f"Imported {result.imported} movies in {result.elapsed:.2f}s ({result.rows_per_second:.0f} rows/sec).")
+    for error in result.errors:
+        click.echo(f"Skipped {error}", err=True)
+
+
+@cli.group()
+def reviews():
+    """List, add and delete reviews."""
+
+
+@reviews.command('add')
+@click.argument('movie_id', type=int)
+@click.argument('rating', type=click.FloatRange(1, 5))
+@click.argument('comment')
+@format_option
+@click.pass_obj
+def add_review_command(session, movie_id, rating, comment, output_format):
+    """Add a review (1 to 5 stars) to a movie."""
+    try:
+        review = Review.create(session, movie_id, rating, comment, user_id=current_user_id())
+    except SQLAlchemyError as e:
+        session.rollback()
+        fail(f"Failed to add review: {getattr(e, 'orig', e)}", EXIT_DATABASE_ERROR)
+    emit_row(record(review, REVIEW_FIELDS), REVIEW_FIELDS, output_format)
+
+
+@reviews.command('list')
+@click.argument('movie_id', type=int)
+@click.option('--limit', type=click.IntRange(min=1), default=REVIEW_PAGE_SIZE, show_default=True,
+              help="Reviews per page.")
+@click.option('--before', type=int, default=None, help="Only list reviews older than this review ID.")
+@click.option('--full', is_flag=True, help="Print whole comments instead of shortening long ones.")
+@format_option
+@click.pass_obj
+def list_reviews_command(session, movie_id, limit, before, full, output_format):
+    """List a movie's reviews, newest first."""
+    reviews, next_before = Review.find_by_movie(session, movie_id, before=before, limit=limit,
+                                                comment_length=None if full else COMMENT_PREVIEW_LENGTH)
+    emit_rows((record(review, REVIEW_SUMMARY_FIELDS) for review in reviews), REVIEW_SUMMARY_FIELDS, output_format)
+    if next_before is not None:
+        click.echo(f"Older reviews: --before {next_before}", err=True)
+
+
+@reviews.command('delete')
+@click.argument('review_id', type=int)
+@click.pass_obj
+def delete_review_command(session, review_id):
+    """Delete a review."""
+    if not Review.delete(session, review_id, user_id=current_user_id()):
+        fail("Review not found.", EXIT_NOT_FOUND)
+    click.echo("Review deleted successfully.")
+
+
+@cli.group()
+def categories():
+    """List categories."""
+
+
+@categories.command('list')
+@format_option
+@click.pass_obj
+def list_categories_command(session, output_format):
+    """List all categories."""
+    rows = (category._asdict() for category in Category.get_all_rows(session))
+    emit_rows(rows, CATEGORY_FIELDS, output_format)
+
+
+@categories.command('add')
+@click.argument('name')
+@format_option
+@click.pass_obj
+def add_category_command(session, name, output_format):
+    """Add a category."""
+    try:
+        category = Category.create(session, name)
+    except SQLAlchemyError as e:
+        session.rollback()
+        fail(f"Failed to add category: {getattr(e, 'orig', e)}", EXIT_DATABASE_ERROR)
+    emit_row(record(category, CATEGORY_FIELDS), CATEGORY_FIELDS, output_format)
+
+
+@cli.group()
+def genres():
+    """List the genres movies are filed under."""
+
+
+@genres.command('list')
+@format_option
+@click.pass_obj
+def list_genres_command(session, output_format):
+    """List all genres with their bit in the movies' genre mask."""
+    emit_rows((record(genre, GENRE_FIELDS) for genre in Genre.get_all(session)), GENRE_FIELDS, output_format)
+
+
+@cli.group()
+@click.pass_context
+def users(ctx):
+    """Manage the users who keep their own watchlists."""
+    # Users live in the main database even when --user selects a shard
+    ctx.obj = ctx.meta['main_session']
+
+
+@users.command('list')
+@format_option
+@click.pass_obj
+def list_users_command(session, output_format):
+    """List all users."""
+    emit_rows((record(user, USER_FIELDS) for user in User.get_all(session)), USER_FIELDS, output_format)
+
+
+@users.command('add')
+@click.argument('username')
+@click.password_option()
+@format_option
+@click.pass_obj
+def add_user_command(session, username, password, output_format):
+    """Add a user."""
+    try:
+        user = User.create(session, username, password)
+    except SQLAlchemyError as e:
+        session.rollback()
+        fail(f"Failed to add user: {getattr(e, 'orig', e)}", EXIT_DATABASE_ERROR)
+    emit_row(record(user, USER_FIELDS), USER_FIELDS, output_format)
+
+
+@users.command('passwd')
+@click.argument('username')
+@click.password_option()
+@click.pass_obj
+def set_password_command(session, username, password):
+    """Change a user's password."""
+    user = User.find_by_username(session, username)
+    if user is None or not User.set_password(session, user.id, password):
+        fail("User not found.", EXIT_NOT_FOUND)
+    click.echo("Password changed.")
+
+
+@users.command('check')
+@click.argument('username')
+@click.option('--password', prompt=True, hide_input=True)
+@click.pass_obj
+def check_password_command(session, username, password):
+    """Check a user's password (exits 1 if it is wrong)."""
+    if User.authenticate(session, username, password) is None:
+        fail("Wrong username or password.", EXIT_NOT_FOUND)
+    click.echo("Password OK.")
+
+
+@users.command('delete')
+@click.argument('username')
+@click.pass_obj
+def delete_user_command(session, username):
+    """Delete a user and their movies and reviews."""
+    user = User.find_by_username(session, username)
+    if user is None:
+        fail("User not found.", EXIT_NOT_FOUND)
+    if shard_router is not None:
+        shard_router.delete_user(user.id)
+    if not User.delete(session, user.id):
+        fail("User not found.", EXIT_NOT_FOUND)
+    click.echo("User deleted successfully.")
+
+
+@cli.command('batch')
+@click.argument('script', type=click.File('r'), default='-')
+@click.option('--commit-every', type=int, default=0, show_default=True,
+              help="Commit after this many commands; 0 commits once at the end.")
+@click.option('--savepoints', is_flag=True, help="Run each line in a savepoint and keep going past failing lines.")
+@click.option('--quiet', is_flag=True, help="Only report failing lines.")
+@click.pass_obj
+def batch_command(session, script, commit_every, savepoints, quiet):
+    """Run a file of commands (or stdin) in one process and one transaction."""
+    def on_error(line_number, message):
+        click.echo(f"line {line_number}: {message}", err=True)
+
+    def on_success(line_number, message):
+        if not quiet:
+            click.echo(f"line {line_number}: {message}")
+
+    result = run_batch(session, script, commit_every=commit_every, savepoints=savepoints,
+                       on_error=on_error, on_success=on_success, user_id=current_user_id())
+    rate = result.executed / result.elapsed if result.elapsed else 0
+    click.echo(f"{result.executed} commands executed, {result.failed} failed, {result.commits} commits "
+               f"in {result.elapsed:.2f}s ({rate:.0f} commands/sec).", err=True)
+    if result.aborted:
+        click.echo("Batch aborted; uncommitted commands were rolled back.", err=True)
+        sys.exit(EXIT_DATABASE_ERROR)
+    sys.exit(EXIT_NOT_FOUND if result.failed else EXIT_OK)
+
+
+@cli.command('serve')
+@click.option('--host', default='127.0.0.1', show_default=True)
+@click.option('--port', type=int, default=8000, show_default=True)
+@click.option('--workers', type=int, default=8, show_default=True, help="Worker threads and pooled connections.")
+@click.option('--quiet', is_flag=True, help="Don't log every request.")
+@click.pass_context
+def serve_command(ctx, host, port, workers, quiet):
+    """Serve the watchlist as a local HTTP/JSON API."""
+    from server import serve
+    click.echo(f"Serving the watchlist API on http://{host}:{port} with {workers} workers.", err=True)
+    serve(host=host, port=port, workers=workers, quiet=quiet, profiler=ctx.meta.get('profiler'))
+
+
+@cli.group()
+def db():
+    """Database maintenance and diagnostics."""
+
+
+@db.command('settings')
+@format_option
+@click.pass_obj
+def settings_command(session, output_format):
+    """Print the engine settings and active pragmas."""
+    settings = database_settings(session)
+    if output_format == 'text':
+        for name, value in settings.items():
+            click.echo(f"{name}: {value}")
+    else:
+        emit_row(settings, list(settings), output_format)
+
+
+@db.command('memory')
+@format_option
+@click.pass_obj
+def memory_command(session, output_format):
+    """Print the session's identity-map size and the process's resident memory."""
+    usage = memory_usage(session)
+    if output_format == 'text':
+        for name, value in usage.items():
+            click.echo(f"{name}: {value}")
+    else:
+        emit_row(usage, list(usage), output_format)
+
+
+@db.command('check-plans')
+@click.pass_obj
+def check_plans_command(session):
+    """Fail if a hot lookup does a full table scan."""
+    failed = False
+    for name, plan, ok in check_query_plans(session):
+        click.echo(f"{'OK' if ok else 'FULL SCAN'}: {name}: {'; '.join(plan)}")
+        failed = failed or not ok
+    sys.exit(EXIT_NOT_FOUND if failed else EXIT_OK)
+
+
+@db.command('move-to-shards')
+@click.pass_context
+def move_to_shards_command(ctx):
+    """Move every user's movies and reviews into their shard files (needs WATCHLIST_SHARD_DIR)."""
+    if shard_router is None:
+        raise click.UsageError("Set WATCHLIST_SHARD_DIR to the directory for the shard files.")
+
+    def on_user(user, count):
+        click.echo(f"{user.username}: {count} movies moved to {shard_router.path(shard_router.shard_of(user.id))}")
+
+    moved = move_users(ctx.meta['main_session'], shard_router, on_user=on_user)
+    click.echo(f"{moved} movies moved.")
+
+
+@db.command('analyze')
+@click.pass_obj
+def analyze_command(session):
+    """Collect index statistics so the query planner picks the most selective index for filtered listings."""
+    session.execute(text("ANALYZE"))
+    session.commit()
+    click.echo("Index statistics updated.")
+
+
+@db.command('rebuild')
+@click.pass_obj
+def rebuild_command(session):
+    """Rebuild the search index, the rating aggregates and the movies' genre links."""
+    Movie.rebuild_genres(session)
+    Movie.rebuild_search_index(session)
+    Movie.rebuild_ratings(session)
+    click.echo("Genre links, search index and rating aggregates rebuilt.")
+
+
 if __name__ == '__main__':
-    cli = MovieWatchlistCLI()
-    cli.run()
+    cli()
@@ -0,0 +1,122 @@
+import os
+import sys
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from sqlalchemy import select, tuple_
+
+from helpers import Movie, Review, Category, User, movie_genres
+from models import SessionLocal, PRAGMA_DEFAULTS
+from cache import lookup_cache
+
+
+def hot_lookups(session):
+    """Return (name, statement) pairs for the lookups the CLI runs on every command."""
+    return [
+        ("movie by id", select(Movie).where(Movie.id == 1)),
+        ("movies by category", Movie._with_category(select(Movie)).where(Movie.category_id == 1)),
+        ("movies by genre", select(movie_genres.c.movie_id).where(movie_genres.c.genre_id == 1)),
+        ("movies by director", select(Movie).where(Movie.director == 'Christopher Nolan')),
+        ("movies by watched status", select(Movie).where(Movie.watched == True)),  # noqa: E712
+        ("movies page by title", Movie._with_category(select(Movie))
+            .where(tuple_(Movie.title, Movie.id) > tuple_('M', 1))
+            .order_by(Movie.title, Movie.id).limit(50)),
+        ("filtered movies", Movie.filter(watched=False, genre='Sci-Fi', director='Christopher Nolan',
+                                         min_rating=4, sort_key='rating', descending=True).rows_select(session)),
+        # What Movie.filter(all_genres=...) runs, with literal ids and bits so the plan
+        # doesn't depend on which genres exist
+        ("movies in all of several genres", Movie._rows_select()
+            .where(Movie.id.in_(select(movie_genres.c.movie_id).where(movie_genres.c.genre_id == 1)),
+                   Movie.genre_mask.op('&')(6) == 6)
+            .order_by(Movie.id)),
+        ("reviews by movie", select(Review).where(Review.movie_id == 1)),
+        ("reviews page by movie", select(Review).where(Review.movie_id == 1, Review.id < 1000)
+            .order_by(Review.id.desc()).limit(11)),
+        ("movies page for user", Movie._with_category(select(Movie))
+            .where(Movie.user_id == 1, Movie.id > 1000).order_by(Movie.id).limit(50)),
+        ("watched movies for user", select(Movie.id).where(Movie.user_id == 1, Movie.watched == True)  # noqa: E712
+            .order_by(Movie.id).limit(50)),
+        ("reviews by user and movie", select(Review).where(Review.user_id == 1, Review.movie_id == 1)),
+        ("user by name", select(User).where(User.username == 'alice')),
+        ("category by id", select(Category).where(Category.id == 1)),
+        ("category by name", select(Category).where(Category.name == 'Drama')),
+    ]
+
+
+def explain(session, statement):
+    """Return the EXPLAIN QUERY PLAN detail lines for a statement."""
+    compiled = statement.compile(dialect=session.bind.dialect, compile_kwargs={"literal_binds": True})
+    rows = session.connection().exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}").fetchall()
+    return [row[-1] for row in rows]
+
+
+def describe_statement(session, statement):
+    """Return (SQL with placeholders, bind parameters, EXPLAIN QUERY PLAN lines) for a statement."""
+    # Expand IN lists into one placeholder per value, as they are executed
+    compiled = statement.compile(dialect=session.bind.dialect, compile_kwargs={"render_postcompile": True})
+    return str(compiled), compiled.params, explain(session, statement)
+
+
+def is_full_scan(detail):
+    """Return True if a query plan line reads a whole table or index instead of searching it."""
+    return detail.startswith("SCAN ")
+
+
+def check_query_plans(session):
+    """Explain every hot lookup and return (name, plan lines, ok) tuples."""
+    results = []
+    for name, statement in hot_lookups(session):
+        plan = explain(session, statement)
+        results.append((name, plan, not any(is_full_scan(detail) for detail in plan)))
+    return results
+
+
+def resident_memory():
+    """Return (current, peak) resident set size of this process in bytes; None where the platform can't tell."""
+    current = peak = None
+    try:
+        with open('/proc/self/statm') as statm:
+            current = int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        pass
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Kilobytes on Linux, bytes on macOS
+        peak = peak if sys.platform == 'darwin' else peak * 1024
+    return current, peak
+
+
+def memory_usage(session=None):
+    """Return the session's identity-map size, the lookup cache size and the process's resident memory."""
+    usage = {}
+    if session is not None:
+        usage["identity_map"] = len(session.identity_map)
+        usage["pending"] = len(session.new)
+        usage["dirty"] = len(session.dirty)
+    usage["lookup_cache_entries"] = lookup_cache.stats().size
+    usage["rss_bytes"], usage["peak_rss_bytes"] = resident_memory()
+    return usage
+
+
+def database_settings(session):
+    """Return the engine settings and the pragma values active on the session's connection."""
+    engine = session.get_bind()
+    settings = {"url": engine.url.render_as_string(hide_password=True), "echo": engine.echo}
+    connection = session.connection()
+    if engine.dialect.name == "sqlite":
+        for name in PRAGMA_DEFAULTS:
+            settings[name] = connection.exec_driver_sql(f"PRAGMA {name}").scalar()
+    return settings
+
+
+if __name__ == '__main__':
+    session = SessionLocal()
+    failed = False
+    for name, plan, ok in check_query_plans(session):
+        print(f"{'ok' if ok else 'FULL SCAN'}: {name}: {'; '.join(plan)}")
+        failed = failed or not ok
+    session.close()
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,97 @@
+"""Genre names as typed by users, turned into canonical genre names.
+
+Genres used to be free text, so "Sci-Fi", "sci fi" and "Science Fiction"
+were three different genres. split_genres() maps such spellings to one
+canonical name and splits multi-genre text ("Drama / Romance") into
+several names:
+
+    >>> split_genres("sci fi, romcom")
+    ['Science Fiction', 'Romance', 'Comedy']
+
+Spellings are compared case-insensitively and ignoring punctuation, in any
+script. Names that aren't known genres or aliases are kept as typed, with
+runs of spaces collapsed:
+
+    >>> split_genres("drama / Comédie romantique / 時代劇")
+    ['Drama', 'Comédie romantique', '時代劇']
+"""
+import re
+
+GENRE_SEPARATORS = re.compile(r'[,/|;&+]')
+
+GENRE_NAMES = (
+    'Action', 'Adventure', 'Animation', 'Biography', 'Comedy', 'Crime', 'Documentary', 'Drama', 'Family',
+    'Fantasy', 'History', 'Horror', 'Music', 'Musical', 'Mystery', 'Romance', 'Science Fiction', 'Sport',
+    'Thriller', 'War', 'Western',
+)
+
+# genre_key() of a spelling -> canonical names
+GENRE_ALIASES = {
+    'sci fi': ('Science Fiction',),
+    'scifi': ('Science Fiction',),
+    'sf': ('Science Fiction',),
+    'science fiction': ('Science Fiction',),
+    'romcom': ('Romance', 'Comedy'),
+    'rom com': ('Romance', 'Comedy'),
+    'romantic comedy': ('Romance', 'Comedy'),
+    'animated': ('Animation',),
+    'cartoon': ('Animation',),
+    'anime': ('Animation',),
+    'doc': ('Documentary',),
+    'documentaries': ('Documentary',),
+    'biopic': ('Biography',),
+    'bio': ('Biography',),
+    'historical': ('History',),
+    'kids': ('Family',),
+    'children': ('Family',),
+    'crimes': ('Crime',),
+    'comedies': ('Comedy',),
+    'dramas': ('Drama',),
+    'thrillers': ('Thriller',),
+    'westerns': ('Western',),
+    'mysteries': ('Mystery',),
+    'noir': ('Crime',),
+    'musicals': ('Musical',),
+    'sports': ('Sport',),
+    'suspense': ('Thriller',),
+    'scary': ('Horror',),
+    'war film': ('War',),
+}
+
+
+def genre_key(text):
+    """Return text case-folded, with every run of punctuation and spaces turned into one space."""
+    return ' '.join(re.findall(r'[^\W_]+', text.casefold()))
+
+
+# Known names match whatever their spelling's case and punctuation
+CANONICAL_GENRES = {genre_key(name): (name,) for name in GENRE_NAMES}
+CANONICAL_GENRES.update(GENRE_ALIASES)
+
+
+def canonical_genres(text):
+    """Return the canonical names for one genre spelling (several for aliases such as "romcom").
+
+    A spelling that isn't a known genre or alias is its own canonical name;
+    only blank text has none.
+    """
+    key = genre_key(text)
+    if key in CANONICAL_GENRES:
+        return CANONICAL_GENRES[key]
+    name = ' '.join(text.split())
+    return (name,) if name else ()
+
+
+def split_genres(text):
+    """Return the canonical genre names in a movie's genre text, in order and without repeats."""
+    names = []
+    for part in GENRE_SEPARATORS.split(text or ''):
+        for name in canonical_genres(part):
+            if name not in names:
+                names.append(name)
+    return names
+
+
+def genre_text(text):
+    """Return genre text in the form movies store it: the canonical names joined by ", "."""
+    return ', '.join(split_genres(text))
@@ -1,15 +1,91 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Boolean, Float
+from collections import namedtuple
+
+from sqlalchemy import Column, Integer, String, ForeignKey, Boolean, Float, DDL, Index, Table, TypeDecorator, bindparam, delete, event, false, func, insert, literal, or_, select, text, tuple_, update
 from sqlalchemy.orm import relationship
-from sqlalchemy.orm import relationship, declarative_base
+from sqlalchemy.orm import relationship, declarative_base, joinedload, make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.orm.util import identity_key
+from sqlalchemy import inspect
 from models import Base, SessionLocal
 from models import Base
+from cache import lookup_cache
+from passwords import hash_password, verify_password, needs_rehash, verify_unknown_user
+from genres import split_genres, genre_text
+
+# Characters of a review comment shown in listings before it is cut short.
+COMMENT_PREVIEW_LENGTH = 200
+
+class User(Base):
+    __tablename__ = 'users'
+
+    id = Column(Integer, primary_key=True)
+    username = Column(String, unique=True, nullable=False)
+    # A passwords.hash_password() hash; rows older than hashing hold plain text
+    # until the user next logs in.
+    password = Column(String, nullable=False)
+    movies = relationship('Movie', back_populates='user', passive_deletes=True)
+    reviews = relationship('Review', back_populates='user', passive_deletes=True)
+
+    def __repr__(self):
+        return f"<User(id={self.id}, username={self.username})>"
+
+    @classmethod
+    def create(cls, session, username, password):
+        user = cls(username=username, password=hash_password(password))
+        session.add(user)
+        commit_keeping(session, user)
+        return user
+
+    @classmethod
+    def delete(cls, session, user_id):
+        # Their movies and reviews are removed by ON DELETE CASCADE
+        statement = delete(cls).where(cls.id == user_id).returning(cls.id)
+        deleted = session.execute(statement).first() is not None
+        commit(session)
+        if deleted:
+            lookup_cache.invalidate_kind(session, 'movie')
+        return deleted
+
+    @classmethod
+    def get_all(cls, session):
+        return session.query(cls).order_by(cls.id).all()
+
+    @classmethod
+    def find_by_username(cls, session, username):
+        return session.scalars(USER_BY_NAME, {'username': username}).one_or_none()
+
+    @classmethod
+    def authenticate(cls, session, username, password):
+        """Return the user if the password matches, else None.
+
+        This is the only place a password is hashed on a read path, so callers
+        should authenticate once per login rather than once per request. A
+        plain-text or outdated hash is upgraded on a successful check.
+        """
+        user = cls.find_by_username(session, username)
+        if user is None:
+            return verify_unknown_user(password) or None
+        if not verify_password(password, user.password):
+            return None
+        if needs_rehash(user.password):
+            user.password = hash_password(password)
+            commit(session)
+        return user
+
+    @classmethod
+    def set_password(cls, session, user_id, password):
+        statement = update(cls).where(cls.id == user_id).values(password=hash_password(password)).returning(cls.id)
+        changed = session.execute(statement).first() is not None
+        commit(session)
+        return changed
+
 
 class Category(Base):
     __tablename__ = 'categories'
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True)
     name = Column(String, unique=True, nullable=False)
-    movies = relationship('Movie', back_populates='category', cascade='all, delete-orphan')
+    movies = relationship('Movie', back_populates='category', cascade='all, delete-orphan', passive_deletes=True)
 
     def __repr__(self):
         return f"<Category(id={self.id}, name={self.name})>"
@@ -18,109 +94,639 @@ class Category(Base):
     def create(cls, session, name):
         category = cls(name=name)
         session.add(category)
-        session.commit()
+        commit_keeping(session, category)
+        lookup_cache.invalidate(session, ('category', category.id), ('category_name', name))
         return category
 
     @classmethod
     def delete(cls, session, category_id):
-        category = session.query(cls).filter_by(id=category_id).one_or_none()
-        if category:
-            session.delete(category)
-            session.commit()
-            return True
-        return False
+        # Its movies (and their reviews) are removed by ON DELETE CASCADE
+        statement = delete(cls).where(cls.id == category_id).returning(cls.name)
+        name = session.execute(statement).scalar_one_or_none()
+        commit(session)
+        if name is None:
+            return False
+        lookup_cache.invalidate(session, ('category', category_id), ('category_name', name))
+        lookup_cache.invalidate_kind(session, 'movie')
+        return True
 
     @classmethod
     def get_all(cls, session):
         return session.query(cls).all()
 
+    @classmethod
+    def get_all_rows(cls, session):
+        """Return every category as a read-only CategoryRow."""
+        return [CategoryRow._make(row) for row in session.execute(select(cls.id, cls.name))]
+
     @classmethod
     def find_by_id(cls, session, category_id):
-        return session.query(cls).filter_by(id=category_id).one_or_none()
+        return cached_lookup(session, cls, ('category', category_id),
+                             lambda: session.scalars(CATEGORY_BY_ID, {'id': category_id}).one_or_none())
 
     @classmethod
     def find_by_name(cls, session, name):
-        return session.query(cls).filter_by(name=name).one_or_none()
+        return cached_lookup(session, cls, ('category_name', name),
+                             lambda: session.scalars(CATEGORY_BY_NAME, {'name': name}).one_or_none())
+
+
+# Which genres each movie is in. The primary key serves "genres of a movie",
+# the (genre_id, movie_id) index "movies in a genre".
+movie_genres = Table(
+    'movie_genres', Base.metadata,
+    Column('movie_id', Integer, ForeignKey('movies.id', ondelete='CASCADE'), primary_key=True),
+    Column('genre_id', Integer, ForeignKey('genres.id', ondelete='CASCADE'), primary_key=True),
+    Index('ix_movie_genres_genre_id_movie_id', 'genre_id', 'movie_id'),
+)
+
+
+class Genre(Base):
+    __tablename__ = 'genres'
+
+    id = Column(Integer, primary_key=True)
+    # Canonical name, see genres.split_genres()
+    name = Column(String, unique=True, nullable=False)
+    # Position of the genre's bit in Movie.genre_mask; NULL once every bit is taken
+    bit = Column(Integer, unique=True, nullable=True)
+
+    # SQLite integers are signed 64-bit, so bits 0-62 are usable
+    MASK_BITS = 63
+
+    def __repr__(self):
+        return f"<Genre(id={self.id}, name={self.name}, bit={self.bit})>"
+
+    @property
+    def mask(self):
+        return 0 if self.bit is None else 1 << self.bit
+
+    @classmethod
+    def get_all(cls, session):
+        return session.scalars(select(cls).order_by(cls.name)).all()
+
+    @classmethod
+    def find_by_names(cls, session, names):
+        """Return the existing genres among the canonical names, in the order given.
+
+        Not cached: resolve() inserts genres inside the caller's transaction,
+        and a cached id would outlive a rollback of it.
+        """
+        if not names:
+            return []
+        # A lookup must not flush the movies a unit of work is batching
+        with session.no_autoflush:
+            found = {genre.name: genre for genre in session.scalars(GENRES_BY_NAME, {'names': list(names)})}
+        return [found[name] for name in names if name in found]
+
+    @classmethod
+    def resolve(cls, session, names):
+        """Return the genres for the canonical names, in the order given, creating the missing ones.
+
+        A new genre gets the lowest free bit of Movie.genre_mask, or none
+        when all MASK_BITS are taken.
+        """
+        genres = cls.find_by_names(session, names)
+        # Another writer may take a name or bit between the SELECT and the INSERT; look again
+        for _ in range(3):
+            missing = [name for name in names if name not in {genre.name for genre in genres}]
+            if not missing:
+                break
+            with session.no_autoflush:
+                used = set(session.scalars(select(cls.bit).where(cls.bit.isnot(None))))
+                free = (bit for bit in range(cls.MASK_BITS) if bit not in used)
+                session.execute(insert(cls).prefix_with('OR IGNORE'),
+                                [{'name': name, 'bit': next(free, None)} for name in missing])
+            genres = cls.find_by_names(session, names)
+        return genres
+
+
+class GenreText(TypeDecorator):
+    """Movie genre text, written as genres.genre_text() returns it by every ORM and Core statement.
+
+    The movies_genres_link trigger reads the stored text as the movie's
+    canonical genre names, so a bulk insert(Movie) can't create genres in
+    some other spelling. Compare with literal(text, String) to match text
+    as stored.
+    """
+    impl = String
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        return None if value is None else genre_text(value)
+
 
 class Movie(Base):
     __tablename__ = 'movies'
 
-    id = Column(Integer, primary_key=True, index=True)
-    title = Column(String, nullable=False)
-    director = Column(String, nullable=False)
-    genre = Column(String, nullable=False)
-    watched = Column(Boolean, default=False)
-    category_id = Column(Integer, ForeignKey('categories.id'), nullable=True)
+    id = Column(Integer, primary_key=True)
+    title = Column(String, nullable=False, index=True)
+    director = Column(String, nullable=False, index=True)
+    genre = Column(GenreText, nullable=False, index=True)
+    watched = Column(Boolean, default=False, index=True)
+    category_id = Column(Integer, ForeignKey('categories.id', ondelete='CASCADE'), nullable=True, index=True)
+    # Rating aggregates, maintained by the reviews_rating_* triggers below so
+    # that every write path (ORM, bulk insert, raw SQL) keeps them current.
+    rating_count = Column(Integer, nullable=False, default=0, server_default='0')
+    rating_sum = Column(Float, nullable=False, default=0.0, server_default='0')
+    rating_avg = Column(Float, nullable=True, index=True)
+    # Owner of the watchlist entry; NULL for movies on the shared watchlist.
+    user_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'), nullable=True, index=True)
+    # OR of Genre.mask for the movie's genres, kept in step with movie_genres
+    # by the movie_genres_mask_* triggers below; "in all of these genres" is
+    # a bitwise test on it instead of one join per genre.
+    genre_mask = Column(Integer, nullable=False, default=0, server_default='0')
     category = relationship('Category', back_populates='movies')
-    reviews = relationship('Review', back_populates='movie', cascade='all, delete-orphan')
+    reviews = relationship('Review', back_populates='movie', cascade='all, delete-orphan', passive_deletes=True)
+    user = relationship('User', back_populates='movies')
+    genres = relationship('Genre', secondary=movie_genres, order_by='Genre.name', passive_deletes=True)
+
+    # Per-user listings seek to the user's rows instead of filtering the
+    # whole table: ix_movies_user_id (which ends with the rowid) serves
+    # ordering by id, these serve the watched filter and ordering by title.
+    __table_args__ = (
+        Index('ix_movies_user_id_watched', 'user_id', 'watched', 'id'),
+        Index('ix_movies_user_id_title', 'user_id', 'title'),
+    )
+
+    # Columns listings can be ordered by. Each has an index, and since every
+    # SQLite index ends with the rowid, (column, id) keyset seeks are indexed.
+    SORT_KEYS = ('id', 'title', 'director', 'genre')
 
     def __repr__(self):
         return f"<Movie(id={self.id}, title={self.title}, director={self.director}, genre={self.genre}, watched={self.watched}, category_id={self.category_id})>"
 
+    @property
+    def category_name(self):
+        return self.category.name if self.category is not None else None
+
+    @classmethod
+    def _owned_by(cls, statement, user_id):
+        # user_id None means the whole table, as before users existed
+        return statement if user_id is None else statement.where(cls.user_id == user_id)
+
+    @classmethod
+    def _with_category(cls, statement):
+        # Listings show the category name; loading it in the same query
+        # (a LEFT OUTER JOIN) avoids one lazy load per distinct category.
+        return statement.options(joinedload(cls.category))
+
     @classmethod
-    def create(cls, session, title, director, genre, category_id=None):
-        movie = cls(title=title, director=director, genre=genre, category_id=category_id)
+    def create(cls, session, title, director, genre, category_id=None, user_id=None):
+        """Add a movie. genre may name several genres ("Drama / Romance"); it is stored normalized."""
+        # Every column is set, so none is left unloaded after the INSERT; the
+        # genre is normalized here too so the instance shows what is stored.
+        # The movies_genres_link trigger creates and links the genres named
+        # in the text, so the INSERT is the only statement.
+        movie = cls(title=title, director=director, genre=genre_text(genre), category_id=category_id,
+                    user_id=user_id, rating_avg=None)
         session.add(movie)
-        session.commit()
+        commit_keeping(session, movie, rewritten=['genre_mask'])
+        lookup_cache.invalidate(session, ('movie', movie.id))
         return movie
 
     @classmethod
-    def delete(cls, session, movie_id):
-        movie = session.query(cls).filter_by(id=movie_id).one_or_none()
-        if movie:
-            session.delete(movie)
-            session.commit()
-            return True
-        return False
+    def delete(cls, session, movie_id, user_id=None):
+        # Its reviews are removed by ON DELETE CASCADE
+        statement = cls._owned_by(delete(cls).where(cls.id == movie_id), user_id).returning(cls.id)
+        deleted = session.execute(statement).first() is not None
+        commit(session)
+        if deleted:
+            lookup_cache.invalidate(session, ('movie', movie_id))
+        return deleted
 
     @classmethod
     def get_all(cls, session):
-        return session.query(cls).all()
+        return session.scalars(cls._with_category(select(cls))).all()
+
+    @classmethod
+    def _sort_column(cls, sort_key):
+        if sort_key not in cls.SORT_KEYS:
+            raise ValueError(f"Cannot sort movies by {sort_key!r}; choose one of {', '.join(cls.SORT_KEYS)}.")
+        return getattr(cls, sort_key)
+
+    @classmethod
+    def get_page(cls, session, sort_key='id', after=None, page_size=50, user_id=None):
+        """Return one page of movies and the cursor for the next page (None on the last page).
+
+        Pages are found by keyset: the cursor is the (sort value, id) of the
+        last movie returned, so every page is an index seek instead of an
+        OFFSET scan over all the rows before it.
+        """
+        statement = cls._page(cls._owned_by(cls._with_category(select(cls)), user_id), sort_key, after, page_size)
+        return cls._with_cursor(session.scalars(statement).all(), sort_key, page_size)
+
+    @classmethod
+    def _page(cls, statement, sort_key, after, page_size):
+        if page_size < 1:
+            raise ValueError(f"page_size must be at least 1, not {page_size}.")
+        column = cls._sort_column(sort_key)
+        if sort_key == 'id':
+            statement = statement.order_by(cls.id)
+            if after is not None:
+                statement = statement.where(cls.id > after[1])
+        else:
+            statement = statement.order_by(column, cls.id)
+            if after is not None:
+                statement = statement.where(tuple_(column, cls.id) > tuple_(*after))
+        return statement.limit(page_size)
+
+    @staticmethod
+    def _with_cursor(movies, sort_key, page_size):
+        if len(movies) < page_size:
+            return movies, None
+        last = movies[-1]
+        return movies, (getattr(last, sort_key), last.id)
+
+    @classmethod
+    def stream(cls, session, sort_key='id', batch_size=500, user_id=None):
+        """Yield every movie in (sort_key, id) order, fetching batch_size rows at a time."""
+        statement = cls._owned_by(cls._with_category(select(cls)), user_id)
+        return session.scalars(cls._stream(statement, sort_key, batch_size))
+
+    @classmethod
+    def _stream(cls, statement, sort_key, batch_size):
+        column = cls._sort_column(sort_key)
+        order = (cls.id,) if sort_key == 'id' else (column, cls.id)
+        return statement.order_by(*order).execution_options(yield_per=batch_size)
+
+    # Read-only variants of the listings for callers that only print the
+    # rows. They select just the MovieRow columns and return plain tuples,
+    # so no ORM instance is built or kept in the session's identity map.
+
+    @classmethod
+    def _rows_select(cls):
+        columns = [getattr(cls, field) for field in MovieRow._fields if field != 'category_name']
+        columns.insert(MovieRow._fields.index('category_name'), Category.name.label('category_name'))
+        return select(*columns).outerjoin(Category, cls.category_id == Category.id)
+
+    @classmethod
+    def get_page_rows(cls, session, sort_key='id', after=None, page_size=50, user_id=None):
+        """Like get_page(), returning MovieRows."""
+        statement = cls._page(cls._owned_by(cls._rows_select(), user_id), sort_key, after, page_size)
+        return cls._with_cursor([MovieRow._make(row) for row in session.execute(statement)], sort_key, page_size)
+
+    @classmethod
+    def stream_rows(cls, session, sort_key='id', batch_size=500, user_id=None):
+        """Like stream(), yielding MovieRows."""
+        statement = cls._stream(cls._owned_by(cls._rows_select(), user_id), sort_key, batch_size)
+        return map(MovieRow._make, session.execute(statement))
+
+    @classmethod
+    def find_rows_by_category(cls, session, category_id, user_id=None):
+        """Like find_by_category(), returning MovieRows."""
+        statement, params = owned_lookup(MOVIE_ROWS_BY_CATEGORY, {'category_id': category_id}, user_id)
+        return [MovieRow._make(row) for row in session.execute(statement, params)]
 
     @classmethod
     def find_by_id(cls, session, movie_id):
-        return session.query(cls).filter_by(id=movie_id).one_or_none()
+        return cached_lookup(session, cls, ('movie', movie_id),
+                             lambda: session.scalars(MOVIE_BY_ID, {'id': movie_id}).one_or_none())
+
+    @classmethod
+    def find_by_category(cls, session, category_id, user_id=None):
+        statement, params = owned_lookup(MOVIES_BY_CATEGORY, {'category_id': category_id}, user_id)
+        return session.scalars(statement, params).all()
+
+    @classmethod
+    def _selection_filters(cls, ids=None, id_range=None, category_id=None, genre=None, chunk_size=500,
+                           user_id=None):
+        """Yield one list of WHERE conditions per statement needed to cover a selection.
+
+        Range, category and genre filters are combined into a single
+        statement; an ID list is split into chunks of chunk_size so each IN
+        list stays well under SQLite's bound-parameter limit.
+        """
+        conditions = []
+        if id_range is not None:
+            first, last = id_range
+            conditions.append(cls.id.between(first, last))
+        if category_id is not None:
+            conditions.append(cls.category_id == category_id)
+        if genre is not None:
+            conditions.append(cls._in_any_genre(split_genres(genre)))
+        if ids is None and not conditions:
+            raise ValueError("Select movies by ID list, ID range, category or genre.")
+        if user_id is not None:
+            conditions.append(cls.user_id == user_id)
+        if ids is None:
+            yield conditions
+            return
+        ids = sorted(set(ids))
+        for start in range(0, len(ids), chunk_size):
+            yield conditions + [cls.id.in_(ids[start:start + chunk_size])]
 
     @classmethod
-    def find_by_category(cls, session, category_id):
-        return session.query(cls).filter_by(category_id=category_id).all()
+    def bulk_mark_watched(cls, session, watched=True, ids=None, id_range=None, category_id=None, genre=None,
+                          chunk_size=500, user_id=None):
+        """Set the watched status of every selected movie and return how many changed."""
+        changed = 0
+        for conditions in cls._selection_filters(ids, id_range, category_id, genre, chunk_size, user_id):
+            statement = (
+                update(cls)
+                .where(*conditions, or_(cls.watched.is_(None), cls.watched != watched))
+                .values(watched=watched)
+            )
+            changed += session.execute(statement).rowcount
+        commit(session)
+        if changed:
+            lookup_cache.invalidate_kind(session, 'movie')
+        return changed
 
     @classmethod
-    def mark_watched(cls, session, movie_id, watched=True):
-        movie = cls.find_by_id(session, movie_id)
-        if movie:
-            movie.watched = watched
-            session.commit()
-            return movie
-        return None
+    def bulk_delete(cls, session, ids=None, id_range=None, category_id=None, genre=None, chunk_size=500,
+                    user_id=None):
+        """Delete every selected movie (and, by cascade, its reviews) and return how many were deleted."""
+        deleted = 0
+        for conditions in cls._selection_filters(ids, id_range, category_id, genre, chunk_size, user_id):
+            deleted += session.execute(delete(cls).where(*conditions)).rowcount
+        commit(session)
+        if deleted:
+            lookup_cache.invalidate_kind(session, 'movie')
+        return deleted
+
+    @classmethod
+    def top_rated(cls, session, limit=10, min_reviews=1, user_id=None):
+        """Return the highest rated movies using the stored rating aggregates."""
+        statement = (
+            cls._owned_by(cls._with_category(select(cls)), user_id)
+            .where(cls.rating_count >= min_reviews)
+            .order_by(cls.rating_avg.desc(), cls.rating_count.desc(), cls.id)
+            .limit(limit)
+        )
+        return session.scalars(statement).all()
+
+    @classmethod
+    def _in_any_genre(cls, names):
+        # Seeks ix_movie_genres_genre_id_movie_id once per genre
+        genre_ids = select(Genre.id).where(Genre.name.in_(names))
+        return cls.id.in_(select(movie_genres.c.movie_id).where(movie_genres.c.genre_id.in_(genre_ids)))
+
+    @classmethod
+    def rebuild_genres(cls, session, only_unlinked=False):
+        """Normalize the genre text of movies without movie_genres links and link them to their genres.
+
+        Works on each distinct genre spelling at once, so it costs a few
+        statements per spelling rather than per movie. Inserted movies are
+        linked by the movies_genres_link trigger; this catches rows from
+        before the trigger, written in another spelling, or loaded with the
+        triggers dropped. Without only_unlinked every link is rebuilt, genres
+        no movie uses any more are deleted and every genre_mask recomputed.
+        """
+        if not only_unlinked:
+            session.execute(delete(movie_genres))
+        unlinked = cls.id.notin_(select(movie_genres.c.movie_id))
+        spellings = session.scalars(select(cls.genre).where(unlinked).distinct()).all()
+        for spelling in spellings:
+            names = split_genres(spelling)
+            canonical = ', '.join(names)
+            # Only the rows about to be linked, and only if their text changes
+            if canonical != spelling:
+                session.execute(update(cls).where(cls.genre == literal(spelling, String), unlinked).values(genre=canonical)
+                                .execution_options(synchronize_session=False))
+            if not names:
+                continue
+            genre_ids = [genre.id for genre in Genre.resolve(session, names)]
+            links = (select(cls.id, Genre.id).join(Genre, Genre.id.in_(genre_ids))
+                     .where(cls.genre == canonical, unlinked))
+            session.execute(insert(movie_genres).prefix_with('OR IGNORE').from_select(['movie_id', 'genre_id'], links))
+        if not only_unlinked:
+            # Genres only other spellings used, freeing their bits
+            session.execute(delete(Genre).where(Genre.id.notin_(select(movie_genres.c.genre_id))))
+            # The movie_genres_mask_* triggers keep masks current link by link,
+            # but may be dropped for a bulk load
+            session.execute(text(GENRE_MASK_REBUILD))
+        commit(session)
+        lookup_cache.invalidate_kind(session, 'movie')
+
+    @classmethod
+    def rebuild_ratings(cls, session):
+        """Recompute every movie's rating aggregates from the reviews table in one GROUP BY pass."""
+        session.execute(text("UPDATE movies SET rating_count = 0, rating_sum = 0, rating_avg = NULL WHERE rating_count != 0 OR rating_avg IS NOT NULL"))
+        session.execute(text(RATING_REBUILD))
+        commit(session)
+        lookup_cache.invalidate_kind(session, 'movie')
+
+    @classmethod
+    def search(cls, session, query, limit=20, user_id=None):
+        """Full-text search over titles, directors, genres and review comments, best matches first."""
+        match = fts_query(query)
+        if not match:
+            return []
+        if user_id is None:
+            rows = session.execute(SEARCH_QUERY, {"match": match, "limit": limit})
+        else:
+            rows = session.execute(USER_SEARCH_QUERY, {"match": match, "limit": limit, "user_id": user_id})
+        return [SearchResult(*row) for row in rows]
+
+    @classmethod
+    def rebuild_search_index(cls, session):
+        """Repopulate the full-text index from the movies and reviews tables."""
+        session.execute(text("DELETE FROM movie_search"))
+        session.execute(text(SEARCH_POPULATE))
+        commit(session)
+
+    @classmethod
+    def details(cls, session, movie_id, reviews=10, before=None, comment_length=COMMENT_PREVIEW_LENGTH,
+                user_id=None):
+        """Return the movie, its category and a newest-first page of its reviews, or None.
+
+        This is two indexed queries however many reviews the movie has: the
+        movie joined to its category, then one page of reviews. The rating
+        aggregate is stored on the movie row. Pass next_before back as before
+        to get the following page.
+        """
+        statement = cls._with_category(select(cls)).where(cls.id == movie_id)
+        movie = session.scalars(cls._owned_by(statement, user_id)).one_or_none()
+        if movie is None:
+            return None
+        page, next_before = [], None
+        if reviews > 0:
+            page, next_before = Review.find_by_movie(session, movie_id, before=before, limit=reviews,
+                                                     comment_length=comment_length)
+        return MovieDetails(movie, page, next_before)
+
+    @classmethod
+    def mark_watched(cls, session, movie_id, watched=True, user_id=None):
+        statement = cls._owned_by(update(cls).where(cls.id == movie_id), user_id).values(watched=watched).returning(cls)
+        movie = session.scalars(statement).one_or_none()
+        commit_keeping(session, movie)
+        if movie is not None:
+            lookup_cache.invalidate(session, ('movie', movie_id))
+        return movie
+
+    @classmethod
+    def filter(cls, sort_key='id', descending=False, limit=None, **criteria):
+        """Return a MovieFilter for the given criteria; see MovieFilter."""
+        return MovieFilter(sort_key, descending, limit, **criteria)
+
+
+class MovieFilter:
+    """Conditions and ordering for a movie listing, compiled into one SELECT.
+
+    Criteria left as None are ignored:
+
+        title, director          exact match
+        title_contains,
+        director_contains        case-insensitive substring match
+        genre                    one genre or a list: movies in any of them
+        all_genres               a list of genres: movies in all of them
+        watched                  True or False
+        category_id, user_id     exact match
+        min_rating, max_rating   inclusive bounds on the average rating
+
+    Filters are immutable; where() and order_by() return a narrowed copy, so
+    one base filter can be reused:
+
+        unwatched = Movie.filter(watched=False)
+        unwatched.where(genre='Sci-Fi', director_contains='Nolan', min_rating=4).order_by('rating', descending=True)
+
+    Every value is sent as a bind parameter. Exact matches and rating bounds
+    can be answered from the indexes on their columns; substring matches
+    (LIKE '%...%') cannot, and are checked on the rows the other conditions
+    leave. Genre names are normalized like Movie.create() does. "Any of"
+    seeks the movie_genres index; "all of" seeks it for the first genre and
+    tests Movie.genre_mask for the rest, whose bits are looked up when the
+    statement is built (which is why building it takes a session).
+    """
+
+    CRITERIA = ('title', 'title_contains', 'director', 'director_contains', 'genre', 'all_genres', 'watched',
+                'category_id', 'user_id', 'min_rating', 'max_rating')
+    SORT_KEYS = Movie.SORT_KEYS + ('rating',)
+
+    def __init__(self, sort_key='id', descending=False, limit=None, **criteria):
+        unknown = sorted(set(criteria) - set(self.CRITERIA))
+        if unknown:
+            raise ValueError(f"Cannot filter movies by {', '.join(unknown)}; choose from {', '.join(self.CRITERIA)}.")
+        if sort_key not in self.SORT_KEYS:
+            raise ValueError(f"Cannot sort movies by {sort_key!r}; choose one of {', '.join(self.SORT_KEYS)}.")
+        self.criteria = {name: value for name, value in criteria.items() if value is not None}
+        self.sort_key = sort_key
+        self.descending = descending
+        self.limit = limit
+
+    def __repr__(self):
+        criteria = ', '.join(f"{name}={value!r}" for name, value in self.criteria.items())
+        return f"<MovieFilter({criteria}; sort={self.sort_key}{' desc' if self.descending else ''}, limit={self.limit})>"
+
+    def where(self, **criteria):
+        """Return a copy with criteria added (or replaced, or removed when None)."""
+        return MovieFilter(self.sort_key, self.descending, self.limit, **{**self.criteria, **criteria})
+
+    def order_by(self, sort_key, descending=False):
+        return MovieFilter(sort_key, descending, self.limit, **self.criteria)
+
+    def limited(self, limit):
+        return MovieFilter(self.sort_key, self.descending, limit, **self.criteria)
+
+    def conditions(self, session):
+        """Return the WHERE conditions for the criteria."""
+        criteria = self.criteria
+        conditions = []
+        for name in ('title', 'director'):
+            column = getattr(Movie, name)
+            if name in criteria:
+                conditions.append(column == criteria[name])
+            if f'{name}_contains' in criteria:
+                conditions.append(column.contains(criteria[f'{name}_contains'], autoescape=True))
+        if 'genre' in criteria:
+            conditions.append(Movie._in_any_genre(genre_names(criteria['genre'])))
+        if 'all_genres' in criteria:
+            conditions.extend(self._all_genres_conditions(session, genre_names(criteria['all_genres'])))
+        if 'watched' in criteria:
+            conditions.append(Movie.watched == bool(criteria['watched']))
+        for name in ('category_id', 'user_id'):
+            if name in criteria:
+                conditions.append(getattr(Movie, name) == criteria[name])
+        if 'min_rating' in criteria:
+            conditions.append(Movie.rating_avg >= criteria['min_rating'])
+        if 'max_rating' in criteria:
+            conditions.append(Movie.rating_avg <= criteria['max_rating'])
+        return conditions
+
+    @staticmethod
+    def _all_genres_conditions(session, names):
+        # Seek the movies of the first genre, then test the mask for the rest
+        conditions = [Movie._in_any_genre(names[:1])]
+        rest = Genre.find_by_names(session, names[1:])
+        if len(rest) < len(names) - 1:
+            # A genre no movie has
+            conditions.append(false())
+        mask = sum(genre.mask for genre in rest)
+        if mask:
+            conditions.append(Movie.genre_mask.op('&')(mask) == mask)
+        # Genres added after every bit was taken
+        conditions.extend(Movie._in_any_genre([genre.name]) for genre in rest if genre.bit is None)
+        return conditions
+
+    def _apply(self, session, statement):
+        column = Movie.rating_avg if self.sort_key == 'rating' else getattr(Movie, self.sort_key)
+        # id breaks ties, in the same direction so one index can serve both
+        order = (column,) if self.sort_key == 'id' else (column, Movie.id)
+        statement = statement.where(*self.conditions(session)).order_by(
+            *(key.desc() if self.descending else key for key in order))
+        return statement if self.limit is None else statement.limit(self.limit)
+
+    def rows_select(self, session):
+        """Return the SELECT of MovieRows matching this filter."""
+        return self._apply(session, Movie._rows_select())
+
+    def select(self, session):
+        """Return the SELECT of Movie instances (with their category) matching this filter."""
+        return self._apply(session, Movie._with_category(select(Movie)))
+
+    def rows(self, session, batch_size=500):
+        """Yield the matching movies as MovieRows, fetching batch_size rows at a time."""
+        statement = self.rows_select(session).execution_options(yield_per=batch_size)
+        return map(MovieRow._make, session.execute(statement))
+
+    def all(self, session):
+        """Return the matching movies as Movie instances."""
+        return session.scalars(self.select(session)).all()
+
+    def count(self, session):
+        """Return how many movies match, ignoring the limit."""
+        return session.scalar(select(func.count()).select_from(Movie).where(*self.conditions(session)))
+
 
 class Review(Base):
     __tablename__ = 'reviews'
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True)
     rating = Column(Float, nullable=False)
     comment = Column(String, nullable=True)
-    movie_id = Column(Integer, ForeignKey('movies.id'))
+    movie_id = Column(Integer, ForeignKey('movies.id', ondelete='CASCADE'), index=True)
+    # Author of the review; NULL for reviews written before users existed.
+    user_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'), nullable=True)
     movie = relationship('Movie', back_populates='reviews')
+    user = relationship('User', back_populates='reviews')
+
+    __table_args__ = (
+        Index('ix_reviews_user_id_movie_id', 'user_id', 'movie_id'),
+    )
 
     def __repr__(self):
         return f"<Review(id={self.id}, rating={self.rating}, comment={self.comment}, movie_id={self.movie_id})>"
 
     @classmethod
-    def create(cls, session, movie_id, rating, comment):
-        review = cls(movie_id=movie_id, rating=rating, comment=comment)
+    def create(cls, session, movie_id, rating, comment, user_id=None):
+        review = cls(movie_id=movie_id, rating=rating, comment=comment, user_id=user_id)
         session.add(review)
-        session.commit()
+        commit_keeping(session, review)
+        # The rating triggers have updated the movie's aggregates
+        lookup_cache.invalidate(session, ('movie', movie_id))
         return review
 
     @classmethod
-    def delete(cls, session, review_id):
-        review = session.query(cls).filter_by(id=review_id).one_or_none()
-        if review:
-            session.delete(review)
-            session.commit()
-            return True
-        return False
+    def delete(cls, session, review_id, user_id=None):
+        statement = delete(cls).where(cls.id == review_id)
+        if user_id is not None:
+            statement = statement.where(cls.user_id == user_id)
+        statement = statement.returning(cls.movie_id)
+        row = session.execute(statement).first()
+        commit(session)
+        if row is None:
+            return False
+        lookup_cache.invalidate(session, ('movie', row.movie_id))
+        return True
 
     @classmethod
     def get_all(cls, session):
@@ -128,4 +734,354 @@ class Review(Base):
 
     @classmethod
     def find_by_id(cls, session, review_id):
-        return session.query(cls).filter_by(id=review_id).one_or_none()
+        return session.scalars(REVIEW_BY_ID, {'id': review_id}).one_or_none()
+
+    @classmethod
+    def find_by_user(cls, session, user_id, movie_id=None):
+        """Return a user's reviews, or only those of one movie, using ix_reviews_user_id_movie_id."""
+        if movie_id is None:
+            return session.scalars(REVIEWS_BY_USER, {'user_id': user_id}).all()
+        return session.scalars(REVIEWS_BY_USER_AND_MOVIE, {'user_id': user_id, 'movie_id': movie_id}).all()
+
+    @classmethod
+    def find_by_movie(cls, session, movie_id, before=None, limit=10, comment_length=COMMENT_PREVIEW_LENGTH):
+        """Return one newest-first page of a movie's reviews and the cursor for the next page (None on the last page).
+
+        Pages are found by keyset on the review id, so each one is a single
+        seek down ix_reviews_movie_id, whose entries end with the id. Comments
+        longer than comment_length are cut short in SQL and flagged as
+        truncated, so a page of long reviews costs no more to fetch than a
+        page of short ones. Review.find_by_id returns the full text.
+        """
+        if limit < 1:
+            raise ValueError(f"limit must be at least 1, not {limit}.")
+        statement = REVIEW_PAGES[before is not None, comment_length is not None]
+        params = {'movie_id': movie_id, 'before': before, 'comment_length': comment_length, 'limit': limit + 1}
+        rows = session.execute(statement, params).all()
+        reviews = [ReviewSummary(*row[:4], truncated=bool(row[4])) for row in rows[:limit]]
+        return reviews, reviews[-1].id if len(rows) > limit else None
+
+
+def genre_names(genres):
+    """Return the canonical names for a genre or a list of genres, as MovieFilter accepts them."""
+    names = []
+    for genre in [genres] if isinstance(genres, str) else genres:
+        for name in split_genres(genre):
+            if name not in names:
+                names.append(name)
+    return names
+
+
+def commit(session):
+    """Commit the session, or only flush it while a caller is grouping writes into one transaction.
+
+    Inside a watchlist.unit_of_work() that batches flushes, do neither.
+    """
+    if session.info.get('defer_flush'):
+        return
+    if session.info.get('defer_commit'):
+        session.flush()
+    else:
+        session.commit()
+
+
+def commit_keeping(session, instance, rewritten=()):
+    """commit(session), keeping the column values of the instance just written loaded.
+
+    A commit expires every instance, so printing the row a write path
+    returns would SELECT it straight back. The values the flush sent (or
+    got back from RETURNING) are what was committed, so they are restored
+    without a query. Columns a trigger rewrites after the INSERT are named
+    in rewritten and left expired, to be loaded if they are read.
+    """
+    if instance is None or session.info.get('defer_flush'):
+        commit(session)
+        return
+    session.flush()
+    state = inspect(instance)
+    values = {attr.key: state.dict[attr.key] for attr in state.mapper.column_attrs
+              if attr.key in state.dict and attr.key not in rewritten}
+    commit(session)
+    for key, value in values.items():
+        set_committed_value(instance, key, value)
+    if rewritten:
+        session.expire(instance, rewritten)
+
+
+def column_values(obj):
+    """Return a dict of an instance's column attribute values."""
+    return {attr.key: getattr(obj, attr.key) for attr in inspect(type(obj)).column_attrs}
+
+
+def cached_lookup(session, cls, key, load):
+    """Return the instance for key from the lookup cache, calling load() on a miss."""
+    values = lookup_cache.get(session, key)
+    if values is not None:
+        instance = attach_cached(session, cls, values)
+        if instance is not None:
+            return instance
+    instance = load()
+    if instance is not None:
+        lookup_cache.put(session, key, column_values(instance))
+    return instance
+
+
+def attach_cached(session, cls, values):
+    """Attach cached column values to the session as a persistent instance without a SELECT."""
+    existing = session.identity_map.get(identity_key(cls, values['id']))
+    if existing is not None:
+        state = inspect(existing)
+        if not state.expired_attributes:
+            return existing
+        if state.modified:
+            # Don't overwrite pending changes with cached values
+            return None
+    instance = cls(**values)
+    make_transient_to_detached(instance)
+    return session.merge(instance, load=False)
+
+
+# Full-text search index. movie_search is an FTS5 table whose rowid is the
+# movie id; review comments for a movie are concatenated into one column.
+# Triggers keep it in sync with every write path, including bulk inserts.
+SEARCH_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS movie_search USING fts5(
+        title, director, genre, comments,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3'
+    )""",
+    # Rank title matches above director, genre and comment matches.
+    "INSERT INTO movie_search(movie_search, rank) VALUES ('rank', 'bm25(10.0, 4.0, 2.0, 1.0)')",
+    """CREATE TRIGGER IF NOT EXISTS movies_search_insert AFTER INSERT ON movies BEGIN
+        INSERT INTO movie_search(rowid, title, director, genre, comments)
+        VALUES (new.id, new.title, new.director, new.genre,
+                (SELECT group_concat(comment, ' ') FROM reviews WHERE movie_id = new.id));
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS movies_search_update AFTER UPDATE OF title, director, genre ON movies BEGIN
+        UPDATE movie_search SET title = new.title, director = new.director, genre = new.genre
+        WHERE rowid = new.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS movies_search_delete AFTER DELETE ON movies BEGIN
+        DELETE FROM movie_search WHERE rowid = old.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS reviews_search_insert AFTER INSERT ON reviews BEGIN
+        UPDATE movie_search
+        SET comments = (SELECT group_concat(comment, ' ') FROM reviews WHERE movie_id = new.movie_id)
+        WHERE rowid = new.movie_id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS reviews_search_update AFTER UPDATE OF comment, movie_id ON reviews BEGIN
+        UPDATE movie_search
+        SET comments = (SELECT group_concat(comment, ' ') FROM reviews WHERE movie_id = old.movie_id)
+        WHERE rowid = old.movie_id;
+        UPDATE movie_search
+        SET comments = (SELECT group_concat(comment, ' ') FROM reviews WHERE movie_id = new.movie_id)
+        WHERE rowid = new.movie_id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS reviews_search_delete AFTER DELETE ON reviews BEGIN
+        UPDATE movie_search
+        SET comments = (SELECT group_concat(comment, ' ') FROM reviews WHERE movie_id = old.movie_id)
+        WHERE rowid = old.movie_id;
+    END""",
+]
+
+SEARCH_POPULATE = """
+    INSERT INTO movie_search(rowid, title, director, genre, comments)
+    SELECT movies.id, movies.title, movies.director, movies.genre,
+           (SELECT group_concat(comment, ' ') FROM reviews WHERE reviews.movie_id = movies.id)
+    FROM movies
+"""
+
+SEARCH_SELECT = """
+    SELECT movie_search.rowid,
+           highlight(movie_search, 0, '[', ']'),
+           highlight(movie_search, 1, '[', ']'),
+           highlight(movie_search, 2, '[', ']'),
+           snippet(movie_search, 3, '[', ']', '...', 12),
+           rank
+    FROM movie_search
+"""
+
+SEARCH_QUERY = text(SEARCH_SELECT + """
+    WHERE movie_search MATCH :match
+    ORDER BY rank
+    LIMIT :limit
+""")
+
+# One user's movies only. The user's movie ids come from ix_movies_user_id and
+# the index is probed once per id, instead of matching every user's movies.
+USER_SEARCH_QUERY = text(SEARCH_SELECT + """
+    WHERE movie_search MATCH :match
+      AND movie_search.rowid IN (SELECT id FROM movies WHERE user_id = :user_id)
+    ORDER BY rank
+    LIMIT :limit
+""")
+
+# Keep movies.rating_count/rating_sum/rating_avg current in O(1) per review write.
+RATING_DDL = [
+    """CREATE TRIGGER IF NOT EXISTS reviews_rating_insert AFTER INSERT ON reviews BEGIN
+        UPDATE movies
+        SET rating_count = rating_count + 1,
+            rating_sum = rating_sum + new.rating,
+            rating_avg = (rating_sum + new.rating) / (rating_count + 1)
+        WHERE id = new.movie_id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS reviews_rating_update AFTER UPDATE OF rating, movie_id ON reviews BEGIN
+        UPDATE movies
+        SET rating_count = rating_count - 1,
+            rating_sum = rating_sum - old.rating,
+            rating_avg = CASE WHEN rating_count > 1 THEN (rating_sum - old.rating) / (rating_count - 1) END
+        WHERE id = old.movie_id;
+        UPDATE movies
+        SET rating_count = rating_count + 1,
+            rating_sum = rating_sum + new.rating,
+            rating_avg = (rating_sum + new.rating) / (rating_count + 1)
+        WHERE id = new.movie_id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS reviews_rating_delete AFTER DELETE ON reviews BEGIN
+        UPDATE movies
+        SET rating_count = rating_count - 1,
+            rating_sum = rating_sum - old.rating,
+            rating_avg = CASE WHEN rating_count > 1 THEN (rating_sum - old.rating) / (rating_count - 1) END
+        WHERE id = old.movie_id;
+    END""",
+]
+
+RATING_REBUILD = """
+    UPDATE movies
+    SET rating_count = totals.review_count,
+        rating_sum = totals.rating_sum,
+        rating_avg = totals.rating_sum / totals.review_count
+    FROM (
+        SELECT movie_id, count(*) AS review_count, total(rating) AS rating_sum
+        FROM reviews
+        GROUP BY movie_id
+    ) AS totals
+    WHERE movies.id = totals.movie_id
+"""
+
+# A movie's genre text (genres.genre_text()) read as a JSON array of genre
+# names, with quotes and backslashes in the names escaped. Text that still
+# doesn't make one, e.g. with control characters, links nothing until
+# Movie.rebuild_genres() normalizes it.
+GENRE_ARRAY = r"""'["' || replace(replace(replace(new.genre, '\', '\\'), '"', '\"'), ', ', '","') || '"]'"""
+
+# Inserted movies are linked to their genres, and new genres created, by
+# triggers, so every write path links them and Movie.create() stays one
+# statement. The triggers trust the genre text to be canonical: the
+# GenreText column type normalizes it for every SQLAlchemy write, and raw
+# SQL must store genres.genre_text() itself (or run Movie.rebuild_genres()). Movie.genre_mask follows movie_genres; a genre without a bit
+# (or a missing genre row) contributes nothing.
+GENRE_DDL = [
+    f"""CREATE TRIGGER IF NOT EXISTS genres_bit_assign AFTER INSERT ON genres WHEN new.bit IS NULL BEGIN
+        UPDATE genres
+        SET bit = (SELECT min(candidate)
+                   FROM (SELECT 0 AS candidate UNION ALL SELECT bit + 1 FROM genres WHERE bit IS NOT NULL)
+                   WHERE candidate < {Genre.MASK_BITS}
+                     AND candidate NOT IN (SELECT bit FROM genres WHERE bit IS NOT NULL))
+        WHERE id = new.id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS movies_genres_link AFTER INSERT ON movies
+    WHEN new.genre != '' AND json_valid({GENRE_ARRAY}) BEGIN
+        INSERT OR IGNORE INTO genres (name)
+        SELECT value FROM json_each({GENRE_ARRAY}) WHERE value != '';
+        INSERT OR IGNORE INTO movie_genres (movie_id, genre_id)
+        SELECT new.id, genres.id FROM json_each({GENRE_ARRAY}) JOIN genres ON genres.name = json_each.value;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS movie_genres_mask_insert AFTER INSERT ON movie_genres BEGIN
+        UPDATE movies
+        SET genre_mask = genre_mask | coalesce((SELECT 1 << bit FROM genres WHERE id = new.genre_id), 0)
+        WHERE id = new.movie_id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS movie_genres_mask_delete AFTER DELETE ON movie_genres BEGIN
+        UPDATE movies
+        SET genre_mask = genre_mask & ~coalesce((SELECT 1 << bit FROM genres WHERE id = old.genre_id), 0)
+        WHERE id = old.movie_id;
+    END""",
+]
+
+GENRE_MASK_REBUILD = """
+    UPDATE movies
+    SET genre_mask = coalesce((SELECT sum(1 << genres.bit)
+                               FROM movie_genres JOIN genres ON genres.id = movie_genres.genre_id
+                               WHERE movie_genres.movie_id = movies.id), 0)
+"""
+
+# Listing rows from the *_rows methods. A namedtuple is a plain tuple: a
+# 10-field MovieRow is 120 bytes plus its values, about 440 bytes per row in
+# total, against about 1,280 for a Movie instance with its instance state and
+# identity-map entry. Streaming 1M movies into CLI records runs at about 137k
+# rows/s against 46k (python -m benchmarks.projections).
+MovieRow = namedtuple('MovieRow', ['id', 'title', 'director', 'genre', 'watched', 'category_id', 'category_name',
+                                   'rating_avg', 'rating_count', 'user_id'])
+CategoryRow = namedtuple('CategoryRow', ['id', 'name'])
+SearchResult = namedtuple('SearchResult', ['id', 'title', 'director', 'genre', 'snippet', 'rank'])
+ReviewSummary = namedtuple('ReviewSummary', ['id', 'movie_id', 'rating', 'comment', 'truncated'])
+MovieDetails = namedtuple('MovieDetails', ['movie', 'reviews', 'next_before'])
+
+# Fields the CLI and the API print for each kind of row, instance or projection
+MOVIE_FIELDS = list(MovieRow._fields)
+REVIEW_FIELDS = ['id', 'movie_id', 'rating', 'comment']
+REVIEW_SUMMARY_FIELDS = list(ReviewSummary._fields)
+USER_FIELDS = ['id', 'username']
+CATEGORY_FIELDS = list(CategoryRow._fields)
+GENRE_FIELDS = ['id', 'name', 'bit']
+
+for statement in SEARCH_DDL + RATING_DDL + GENRE_DDL:
+    event.listen(Base.metadata, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+
+
+def fts_query(query):
+    """Turn free text into an FTS5 query: every word must match, the last one as a prefix."""
+    terms = ['"{}"'.format(term.replace('"', '""')) for term in query.split()]
+    if terms:
+        terms[-1] += '*'
+    return ' '.join(terms)
+
+
+# Prebuilt statements for the lookups run on every command and request.
+# Building a select() (or a legacy Query) and computing its statement-cache
+# key take longer in Python than SQLite takes to run a primary-key lookup.
+# These are built once, with the values as bind parameters; their cache key
+# is computed once too, and their compiled SQL reused on every call. See
+# benchmarks/lookups.py.
+
+USER_BY_NAME = select(User).where(User.username == bindparam('username'))
+CATEGORY_BY_ID = select(Category).where(Category.id == bindparam('id'))
+CATEGORY_BY_NAME = select(Category).where(Category.name == bindparam('name'))
+GENRES_BY_NAME = select(Genre).where(Genre.name.in_(bindparam('names', expanding=True)))
+MOVIE_BY_ID = select(Movie).where(Movie.id == bindparam('id'))
+REVIEW_BY_ID = select(Review).where(Review.id == bindparam('id'))
+REVIEWS_BY_USER = select(Review).where(Review.user_id == bindparam('user_id'))
+REVIEWS_BY_USER_AND_MOVIE = REVIEWS_BY_USER.where(Review.movie_id == bindparam('movie_id'))
+
+# (all users' statement, one user's statement) pairs for owned_lookup()
+MOVIES_BY_CATEGORY = (Movie._with_category(select(Movie)).where(Movie.category_id == bindparam('category_id')),)
+MOVIES_BY_CATEGORY += (MOVIES_BY_CATEGORY[0].where(Movie.user_id == bindparam('user_id')),)
+MOVIE_ROWS_BY_CATEGORY = (Movie._rows_select().where(Movie.category_id == bindparam('category_id')),)
+MOVIE_ROWS_BY_CATEGORY += (MOVIE_ROWS_BY_CATEGORY[0].where(Movie.user_id == bindparam('user_id')),)
+
+
+def owned_lookup(statements, params, user_id):
+    """Pick the all-users or one-user statement of a pair and return it with its parameters."""
+    if user_id is None:
+        return statements[0], params
+    return statements[1], {**params, 'user_id': user_id}
+
+
+def review_page(paged, truncated):
+    """Build the Review.find_by_movie statement for one combination of its options."""
+    if truncated:
+        comment = func.substr(Review.comment, 1, bindparam('comment_length', type_=Integer))
+        truncated = func.length(Review.comment) > bindparam('comment_length', type_=Integer)
+    else:
+        comment, truncated = Review.comment, false()
+    statement = select(Review.id, Review.movie_id, Review.rating, comment, truncated)
+    statement = statement.where(Review.movie_id == bindparam('movie_id'))
+    if paged:
+        statement = statement.where(Review.id < bindparam('before'))
+    return statement.order_by(Review.id.desc()).limit(bindparam('limit', type_=Integer))
+
+
+# Keyed by (paged with before=, comments cut to comment_length)
+REVIEW_PAGES = {(paged, truncated): review_page(paged, truncated)
+                for paged in (False, True) for truncated in (False, True)}
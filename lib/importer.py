@@ -0,0 +1,178 @@
+import csv
+import json
+import time
+from collections import namedtuple
+from itertools import islice
+
+from sqlalchemy import insert, select
+from sqlalchemy.exc import SQLAlchemyError
+
+from helpers import Movie, Category, commit
+from genres import genre_text
+from models import begin_write
+
+REQUIRED_FIELDS = ('title', 'director', 'genre')
+TRUE_VALUES = ('1', 'true', 'yes', 'y', 'watched')
+FALSE_VALUES = ('', '0', 'false', 'no', 'n')
+MAX_REPORTED_ERRORS = 20
+
+ImportResult = namedtuple('ImportResult', ['imported', 'skipped', 'errors', 'elapsed', 'rows_per_second'])
+
+
+def read_rows(path):
+    """Yield (line_number, row) pairs from a CSV or JSON Lines file, one row at a time."""
+    if path.endswith(('.jsonl', '.ndjson')):
+        with open(path, encoding='utf-8') as f:
+            for line_number, line in enumerate(f, start=1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield line_number, json.loads(line)
+                except ValueError as e:
+                    yield line_number, ValueError(f"invalid JSON: {e}")
+    else:
+        with open(path, newline='', encoding='utf-8') as f:
+            # Line 1 is the header row
+            for line_number, row in enumerate(csv.DictReader(f), start=2):
+                yield line_number, row
+
+
+def parse_watched(value):
+    """Convert a CSV/JSON watched value to a bool."""
+    if isinstance(value, bool):
+        return value
+    if value is None:
+        return False
+    text = str(value).strip().lower()
+    if text in TRUE_VALUES:
+        return True
+    if text in FALSE_VALUES:
+        return False
+    raise ValueError(f"invalid watched value: {value!r}")
+
+
+def validate_row(row):
+    """Return the Movie column values for a row, raising ValueError if it is invalid."""
+    if not isinstance(row, dict):
+        raise ValueError("row must be an object")
+    values = {}
+    for field in REQUIRED_FIELDS:
+        value = row.get(field)
+        if value is None or not str(value).strip():
+            raise ValueError(f"missing {field}")
+        values[field] = str(value).strip()
+    # Normalized before the check: text of separators alone names no genre
+    values['genre'] = genre_text(values['genre'])
+    if not values['genre']:
+        raise ValueError("missing genre")
+
+    category_id = row.get('category_id')
+    if category_id in (None, ''):
+        values['category_id'] = None
+    else:
+        try:
+            values['category_id'] = int(category_id)
+        except (TypeError, ValueError):
+            raise ValueError(f"invalid category_id: {category_id!r}")
+
+    values['watched'] = parse_watched(row.get('watched'))
+    return values
+
+
+def validated_rows(rows, on_error):
+    """Yield (line_number, column dict) for each valid (line_number, row) pair, reporting bad rows to on_error."""
+    for line_number, row in rows:
+        try:
+            if isinstance(row, Exception):
+                raise row
+            yield line_number, validate_row(row)
+        except ValueError as e:
+            on_error(line_number, str(e))
+
+
+def with_known_categories(session, chunk, known, on_error):
+    """Return the column dicts of a chunk of (line_number, values) whose category exists, reporting the others.
+
+    known is the set of category IDs already found, so each ID is looked up
+    once per import, in one query per chunk.
+    """
+    wanted = {values['category_id'] for _, values in chunk} - known - {None}
+    if wanted:
+        known.update(session.scalars(select(Category.id).where(Category.id.in_(wanted))))
+    rows = []
+    for line_number, values in chunk:
+        if values['category_id'] is None or values['category_id'] in known:
+            rows.append(values)
+        else:
+            on_error(line_number, f"unknown category_id: {values['category_id']}")
+    return rows
+
+
+def chunked(iterable, size):
+    """Yield lists of at most size items from iterable."""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def import_movies(session, path, chunk_size=1000, savepoints=False, progress=None, user_id=None):
+    """Stream movies from a CSV or JSONL file into the database.
+
+    Rows are inserted with one executemany per chunk and committed once at the
+    end. With savepoints=True each chunk runs in its own SAVEPOINT, so a chunk
+    that fails is skipped instead of aborting the whole import. With user_id
+    the movies go on that user's watchlist.
+    """
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be at least 1")
+
+    errors = []
+    skipped = 0
+
+    def record_error(line_number, message):
+        nonlocal skipped
+        skipped += 1
+        if len(errors) < MAX_REPORTED_ERRORS:
+            errors.append(f"line {line_number}: {message}")
+
+    imported = 0
+    started = time.perf_counter()
+    statement = insert(Movie)
+    categories = set()
+    try:
+        if savepoints:
+            begin_write(session)
+        for chunk in chunked(validated_rows(read_rows(path), record_error), chunk_size):
+            # Rejected row by row, like invalid values, rather than failing the whole INSERT
+            chunk = with_known_categories(session, chunk, categories, record_error)
+            if not chunk:
+                continue
+            if user_id is not None:
+                for values in chunk:
+                    values['user_id'] = user_id
+            if savepoints:
+                try:
+                    with session.begin_nested():
+                        session.execute(statement, chunk)
+                except SQLAlchemyError as e:
+                    skipped += len(chunk)
+                    if len(errors) < MAX_REPORTED_ERRORS:
+                        errors.append(f"chunk after {imported} imported rows: {getattr(e, 'orig', e)}")
+                    continue
+            else:
+                session.execute(statement, chunk)
+            imported += len(chunk)
+            if progress:
+                progress(imported, time.perf_counter() - started)
+        commit(session)
+    except Exception:
+        session.rollback()
+        raise
+
+    elapsed = time.perf_counter() - started
+    rate = imported / elapsed if elapsed > 0 else float(imported)
+    return ImportResult(imported, skipped, errors, elapsed, rate)
@@ -0,0 +1,193 @@
+"""Opt-in SQL instrumentation: per-statement latency histograms, row counts and a slow-query log.
+
+Nothing here is active unless a QueryProfiler is installed on an engine, e.g.
+with ``watchlist --profile ...`` or ``WATCHLIST_PROFILE=1``.
+"""
+import bisect
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+# Upper bounds of the latency histogram buckets, in milliseconds.
+BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+SLOW_QUERY_MS = float(os.environ.get('WATCHLIST_SLOW_QUERY_MS', '100'))
+SLOW_QUERY_LOG = os.environ.get('WATCHLIST_SLOW_QUERY_LOG') or None
+
+slow_query_logger = logging.getLogger('watchlist.slow_query')
+
+
+class StatementStats:
+    """Timing and row totals for one distinct SQL statement."""
+
+    __slots__ = ('statement', 'count', 'total', 'max', 'rows', 'histogram')
+
+    def __init__(self, statement):
+        self.statement = statement
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.rows = 0
+        self.histogram = [0] * (len(BUCKETS_MS) + 1)
+
+    def record(self, seconds, rows):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        if rows > 0:
+            self.rows += rows
+        self.histogram[bisect.bisect_left(BUCKETS_MS, seconds * 1000)] += 1
+
+
+class CountingCursor(sqlite3.Cursor):
+    """sqlite3 cursor that adds the rows it fetches to the statement they came from."""
+
+    stats = None
+
+    def _count(self, rows):
+        if self.stats is not None:
+            self.stats.rows += rows
+
+    def fetchone(self):
+        row = super().fetchone()
+        if row is not None:
+            self._count(1)
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        rows = super().fetchmany(*args, **kwargs)
+        self._count(len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = super().fetchall()
+        self._count(len(rows))
+        return rows
+
+
+class CountingConnection(sqlite3.Connection):
+    """sqlite3 connection whose cursors count fetched rows."""
+
+    def cursor(self, factory=CountingCursor):
+        return super().cursor(factory)
+
+
+def normalize(statement):
+    """Collapse whitespace so the same statement always groups together."""
+    return re.sub(r'\s+', ' ', statement).strip()
+
+
+class QueryProfiler:
+    """Record how long every statement run on an engine takes and how many rows it returns.
+
+    SELECT row counts come from counting cursors, since SQLite does not report
+    them up front; INSERT/UPDATE/DELETE use the cursor's rowcount. Statements
+    slower than slow_query_ms are written to the watchlist.slow_query logger,
+    and to slow_query_log if a path is given.
+    """
+
+    def __init__(self, slow_query_ms=SLOW_QUERY_MS, slow_query_log=SLOW_QUERY_LOG):
+        self.slow_query_ms = slow_query_ms
+        self.statements = {}
+        self._lock = threading.Lock()
+        self._engines = []
+        self._log_handler = None
+        if slow_query_log:
+            self._log_handler = logging.FileHandler(slow_query_log)
+            self._log_handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+            slow_query_logger.addHandler(self._log_handler)
+            slow_query_logger.setLevel(logging.WARNING)
+
+    def install(self, engine):
+        """Start recording statements on engine."""
+        event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+        if engine.dialect.name == 'sqlite':
+            event.listen(engine, 'do_connect', self._do_connect)
+            # Connections opened before now don't have counting cursors
+            engine.dispose()
+        self._engines.append(engine)
+        return self
+
+    def remove(self):
+        """Stop recording on every engine this profiler was installed on."""
+        for engine in self._engines:
+            event.remove(engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.remove(engine, 'after_cursor_execute', self._after_cursor_execute)
+            if engine.dialect.name == 'sqlite':
+                event.remove(engine, 'do_connect', self._do_connect)
+                engine.dispose()
+        self._engines = []
+        if self._log_handler is not None:
+            slow_query_logger.removeHandler(self._log_handler)
+            self._log_handler.close()
+            self._log_handler = None
+
+    def _do_connect(self, dialect, connection_record, cargs, cparams):
+        cparams.setdefault('factory', CountingConnection)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        seconds = time.perf_counter() - conn.info['query_started'].pop()
+        key = normalize(statement)
+        with self._lock:
+            stats = self.statements.get(key)
+            if stats is None:
+                stats = self.statements[key] = StatementStats(key)
+            stats.record(seconds, cursor.rowcount)
+        if isinstance(cursor, CountingCursor):
+            cursor.stats = stats
+        if seconds * 1000 >= self.slow_query_ms:
+            slow_query_logger.warning("slow query %.2f ms: %s; parameters: %.200r", seconds * 1000, key, parameters)
+
+    def snapshot(self):
+        """Return (statement count, total seconds) recorded so far."""
+        with self._lock:
+            return (sum(stats.count for stats in self.statements.values()),
+                    sum(stats.total for stats in self.statements.values()))
+
+    def reset(self):
+        with self._lock:
+            self.statements = {}
+
+    def summary(self, top=10):
+        """Return lines describing the recorded statements, slowest in total first."""
+        with self._lock:
+            statements = sorted(self.statements.values(), key=lambda stats: stats.total, reverse=True)
+        count = sum(stats.count for stats in statements)
+        total = sum(stats.total for stats in statements)
+        lines = [f"SQL: {count} statements in {total * 1000:.2f} ms"]
+        if not statements:
+            return lines
+        lines.append(f"{'count':>7} {'total ms':>10} {'mean ms':>9} {'max ms':>9} {'rows':>8}  statement")
+        for stats in statements[:top]:
+            text = stats.statement if len(stats.statement) <= 80 else stats.statement[:77] + '...'
+            lines.append(f"{stats.count:>7} {stats.total * 1000:>10.2f} {stats.total * 1000 / stats.count:>9.3f} "
+                         f"{stats.max * 1000:>9.3f} {stats.rows:>8}  {text}")
+        histogram = [sum(column) for column in zip(*(stats.histogram for stats in statements))]
+        labels = [f"<={bound:g}ms" for bound in BUCKETS_MS] + [f">{BUCKETS_MS[-1]:g}ms"]
+        lines.append("latency: " + ", ".join(f"{label} {n}" for label, n in zip(labels, histogram) if n))
+        return lines
+
+
+@contextmanager
+def count_statements(engine):
+    """Collect the SQL statements executed on engine inside the block into the yielded list."""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(normalize(statement))
+
+    event.listen(engine, 'after_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'after_cursor_execute', record)
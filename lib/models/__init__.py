@@ -1,12 +1,95 @@
-from sqlalchemy import create_engine
+import os
+
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker, declarative_base
 
-DATABASE_URL = "sqlite:///Movie-Watchlist.db"
+TRUE_VALUES = ("1", "true", "yes", "on")
+
+DATABASE_URL = os.environ.get("WATCHLIST_DATABASE_URL", "sqlite:///Movie-Watchlist.db")
+
+# Echoing every statement to stdout is useful when debugging but slows down
+# every listing, so it is off unless WATCHLIST_ECHO is set.
+ECHO = os.environ.get("WATCHLIST_ECHO", "").lower() in TRUE_VALUES
+
+# SQLite performance profile applied to every new connection. Each pragma can
+# be overridden with WATCHLIST_<NAME> (e.g. WATCHLIST_SYNCHRONOUS=FULL); an
+# empty value leaves SQLite's default in place.
+PRAGMA_DEFAULTS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "mmap_size": "268435456",  # 256 MiB
+    "cache_size": "-65536",  # negative values are KiB, so 64 MiB
+    "temp_store": "MEMORY",
+    "busy_timeout": "5000",  # milliseconds
+    "foreign_keys": "ON",
+}
+
+
+def load_pragmas(environ=os.environ):
+    """Return the pragma profile, applying WATCHLIST_<NAME> overrides from the environment."""
+    pragmas = {}
+    for name, default in PRAGMA_DEFAULTS.items():
+        value = environ.get(f"WATCHLIST_{name.upper()}", default).strip()
+        if value:
+            pragmas[name] = value
+    return pragmas
+
+
+PRAGMAS = load_pragmas()
+
+# How long a long-running process (the interactive CLI) keeps one session:
+# 0 closes it after every action, N keeps it until its identity map holds
+# more than N instances. Servers already use one session per request.
+SESSION_MAX_OBJECTS = int(os.environ.get("WATCHLIST_SESSION_MAX_OBJECTS", "0"))
+
+
+def make_engine(url=DATABASE_URL, echo=ECHO, pragmas=None, **kwargs):
+    """Create an engine that applies the pragma profile on every SQLite connection."""
+    engine = create_engine(url, echo=echo, **kwargs)
+    if engine.dialect.name == "sqlite":
+        profile = PRAGMAS if pragmas is None else pragmas
+
+        @event.listens_for(engine, "connect")
+        def apply_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for name, value in profile.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+            cursor.close()
+
+    return engine
+
+
+def begin_write(session):
+    """Open an explicit write transaction on the session's connection if none is open.
+
+    pysqlite only emits BEGIN before INSERT/UPDATE/DELETE, so a SAVEPOINT
+    issued first would start a transaction of its own, and releasing it would
+    commit. Beginning explicitly keeps savepoints nested inside one
+    transaction; IMMEDIATE takes the write lock up front so a long batch
+    cannot fail half way on a lock upgrade.
+    """
+    connection = session.connection()
+    if connection.dialect.name == "sqlite" and not connection.connection.dbapi_connection.in_transaction:
+        connection.exec_driver_sql("BEGIN IMMEDIATE")
+
+
+def recycle_session(session, max_objects=SESSION_MAX_OBJECTS):
+    """Close the session if the policy says it has lived long enough, and return True if it did.
+
+    A closed session stays usable: it forgets every instance it held, ends
+    its transaction (so the next read sees other processes' commits) and
+    hands its connection back to the pool until it is next used.
+    """
+    if max_objects <= 0 or len(session.identity_map) > max_objects:
+        session.close()
+        return True
+    return False
+
 
-engine = create_engine(DATABASE_URL, echo=True)
+engine = make_engine()
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
 def init_db():
-    from helpers import Movie, Review, Category 
-    Base.metadata.create_all(bind=engine)
\ No newline at end of file
+    from helpers import Movie, Review, Category
+    Base.metadata.create_all(bind=engine)
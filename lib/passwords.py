@@ -0,0 +1,67 @@
+"""Password hashing for watchlist users.
+
+Passwords are stored as ``scrypt$<n>$<r>$<p>$<salt>$<hash>`` with base64
+salt and hash. scrypt is deliberately slow and memory hard (tens of
+milliseconds and 16 MiB per check with the defaults), so it only runs when a
+user logs in or changes their password, never on ordinary reads and writes.
+"""
+import base64
+import functools
+import hashlib
+import hmac
+import os
+
+SCRYPT_N = 2 ** 14
+SCRYPT_R = 8
+SCRYPT_P = 1
+SALT_BYTES = 16
+KEY_BYTES = 32
+
+
+def b64encode(data):
+    return base64.b64encode(data).decode('ascii')
+
+
+def hash_password(password, n=SCRYPT_N, r=SCRYPT_R, p=SCRYPT_P):
+    """Return a salted scrypt hash of password in the stored format."""
+    salt = os.urandom(SALT_BYTES)
+    key = hashlib.scrypt(password.encode('utf-8'), salt=salt, n=n, r=r, p=p, maxmem=256 * n * r, dklen=KEY_BYTES)
+    return f"scrypt${n}${r}${p}${b64encode(salt)}${b64encode(key)}"
+
+
+def verify_password(password, stored):
+    """Return True if password matches the stored hash.
+
+    Rows written before passwords were hashed hold the plain text; those are
+    compared directly, and needs_rehash() tells the caller to upgrade them.
+    """
+    if not is_hashed(stored):
+        return hmac.compare_digest(password.encode('utf-8'), stored.encode('utf-8'))
+    _, n, r, p, salt, expected = stored.split('$')
+    n, r, p = int(n), int(r), int(p)
+    key = hashlib.scrypt(password.encode('utf-8'), salt=base64.b64decode(salt), n=n, r=r, p=p,
+                         maxmem=256 * n * r, dklen=len(base64.b64decode(expected)))
+    return hmac.compare_digest(key, base64.b64decode(expected))
+
+
+def is_hashed(stored):
+    return stored.startswith('scrypt$') and stored.count('$') == 5
+
+
+def needs_rehash(stored):
+    """Return True if stored is plain text or was hashed with weaker parameters than the current ones."""
+    if not is_hashed(stored):
+        return True
+    _, n, r, p, _, _ = stored.split('$')
+    return (int(n), int(r), int(p)) != (SCRYPT_N, SCRYPT_R, SCRYPT_P)
+
+
+@functools.lru_cache(maxsize=None)
+def dummy_hash():
+    return hash_password('')
+
+
+def verify_unknown_user(password):
+    """Spend as long as a real check, so unknown usernames can't be told apart by timing."""
+    verify_password(password, dummy_hash())
+    return False
@@ -0,0 +1,406 @@
+"""Local HTTP/JSON API for the watchlist.
+
+    python lib/main.py serve --port 8000
+
+Requests are handled by a fixed pool of worker threads. Each request gets
+its own session from a pooled engine, so requests never share ORM state.
+
+Without credentials every route works on the shared watchlist. POST /login
+checks a password once and returns a token; requests that send it as
+``Authorization: Bearer <token>`` work on that user's watchlist, so the slow
+password hash never runs per request. With WATCHLIST_SHARD_DIR set, a
+logged-in user's requests go to their shard file, and top-rated and search
+without a token cover every shard (see shards.py).
+
+    GET    /health
+    GET    /memory
+    POST   /login                  {"username", "password"}
+    GET    /movies?sort=title&page_size=50&after=<value>&after_id=<id>
+    GET    /movies/top-rated?limit=10&min_reviews=1
+    GET    /movies/<id>?reviews=10&before=<review id>
+    GET    /movies/<id>/reviews?limit=10&before=<review id>&full=1
+    POST   /movies                 {"title", "director", "genre", "category_id"}
+    POST   /movies/<id>/watched    {"watched": true}
+    DELETE /movies/<id>
+    GET    /search?q=<words>&limit=20
+    POST   /reviews                {"movie_id", "rating", "comment"}
+    DELETE /reviews/<id>
+    GET    /categories
+    POST   /categories             {"name"}
+    DELETE /categories/<id>
+"""
+import json
+import os
+import re
+import secrets
+import socketserver
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import sessionmaker
+
+from helpers import Movie, Review, Category, User, COMMENT_PREVIEW_LENGTH
+from helpers import MOVIE_FIELDS, REVIEW_FIELDS, REVIEW_SUMMARY_FIELDS, CATEGORY_FIELDS
+from models import DATABASE_URL, make_engine
+from shards import router as shard_router
+from diagnostics import memory_usage
+
+# Seconds a login token stays valid
+TOKEN_TTL = float(os.environ.get('WATCHLIST_TOKEN_TTL', '86400'))
+
+
+# Most rows any one request returns
+MAX_LIMIT = 1000
+
+
+class ApiError(Exception):
+    """An error reported to the client as a JSON body with an HTTP status."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def to_dict(obj, fields):
+    return {field: getattr(obj, field) for field in fields}
+
+
+def int_param(query, name, default=None):
+    values = query.get(name)
+    if not values:
+        return default
+    try:
+        return int(values[0])
+    except ValueError:
+        raise ApiError(HTTPStatus.BAD_REQUEST, f"{name} must be a whole number")
+
+
+def limit_param(query, name, default):
+    """Return a row-count parameter, capped at MAX_LIMIT; 0 and negative counts are rejected."""
+    value = int_param(query, name, default)
+    if value < 1:
+        raise ApiError(HTTPStatus.BAD_REQUEST, f"{name} must be at least 1")
+    return min(value, MAX_LIMIT)
+
+
+def require(body, name, kind):
+    value = body.get(name)
+    if not isinstance(value, kind) or isinstance(value, bool) and kind is not bool:
+        raise ApiError(HTTPStatus.BAD_REQUEST, f"{name} is required")
+    return value
+
+
+# Route handlers take (session, match, query, body) and return (status, payload).
+# session.info['user_id'] is the logged-in user, or None for the shared watchlist.
+
+def list_movies(session, match, query, body):
+    sort_key = query.get('sort', ['id'])[0]
+    page_size = limit_param(query, 'page_size', 50)
+    after = None
+    after_id = int_param(query, 'after_id')
+    if (after_id is None) != ('after' not in query):
+        raise ApiError(HTTPStatus.BAD_REQUEST, "after and after_id must be given together")
+    if after_id is not None:
+        after_value = query['after'][0]
+        try:
+            after = (int(after_value) if sort_key == 'id' else after_value, after_id)
+        except ValueError:
+            raise ApiError(HTTPStatus.BAD_REQUEST, "after must be a whole number when sorting by id")
+    try:
+        movies, cursor = Movie.get_page_rows(session, sort_key=sort_key, after=after, page_size=page_size,
+                                        user_id=session.info['user_id'])
+    except ValueError as e:
+        raise ApiError(HTTPStatus.BAD_REQUEST, str(e))
+    next_page = {'after': cursor[0], 'after_id': cursor[1]} if cursor else None
+    return HTTPStatus.OK, {'movies': [to_dict(movie, MOVIE_FIELDS) for movie in movies], 'next': next_page}
+
+
+def top_rated_movies(session, match, query, body):
+    limit, min_reviews = limit_param(query, 'limit', 10), int_param(query, 'min_reviews', 1)
+    if shard_router is not None and session.info['user_id'] is None:
+        movies = shard_router.top_rated(limit=limit, min_reviews=min_reviews, main=session)
+    else:
+        movies = Movie.top_rated(session, limit=limit, min_reviews=min_reviews, user_id=session.info['user_id'])
+    return HTTPStatus.OK, {'movies': [to_dict(movie, MOVIE_FIELDS) for movie in movies]}
+
+
+def show_movie(session, match, query, body):
+    # 0 (the default) shows the movie without its reviews
+    review_count = min(int_param(query, 'reviews', 0), MAX_LIMIT)
+    user_id = session.info['user_id']
+    if review_count <= 0:
+        movie = Movie.find_by_id(session, int(match.group('id')))
+        if movie is None or user_id is not None and movie.user_id != user_id:
+            raise ApiError(HTTPStatus.NOT_FOUND, "Movie not found.")
+        return HTTPStatus.OK, to_dict(movie, MOVIE_FIELDS)
+    details = Movie.details(session, int(match.group('id')), reviews=review_count, before=int_param(query, 'before'),
+                            user_id=user_id)
+    if details is None:
+        raise ApiError(HTTPStatus.NOT_FOUND, "Movie not found.")
+    payload = to_dict(details.movie, MOVIE_FIELDS)
+    payload['reviews'] = [to_dict(review, REVIEW_SUMMARY_FIELDS) for review in details.reviews]
+    payload['next_before'] = details.next_before
+    return HTTPStatus.OK, payload
+
+
+def list_movie_reviews(session, match, query, body):
+    full = query.get('full', ['0'])[0].lower() in ('1', 'true', 'yes')
+    reviews, next_before = Review.find_by_movie(session, int(match.group('id')), before=int_param(query, 'before'),
+                                                limit=limit_param(query, 'limit', 10),
+                                                comment_length=None if full else COMMENT_PREVIEW_LENGTH)
+    return HTTPStatus.OK, {'reviews': [to_dict(review, REVIEW_SUMMARY_FIELDS) for review in reviews],
+                           'next_before': next_before}
+
+
+def add_movie(session, match, query, body):
+    category_id = body.get('category_id')
+    if category_id is not None and not isinstance(category_id, int):
+        raise ApiError(HTTPStatus.BAD_REQUEST, "category_id must be a whole number")
+    movie = Movie.create(session, require(body, 'title', str), require(body, 'director', str),
+                         require(body, 'genre', str), category_id, user_id=session.info['user_id'])
+    return HTTPStatus.CREATED, to_dict(movie, MOVIE_FIELDS)
+
+
+def mark_watched(session, match, query, body):
+    movie = Movie.mark_watched(session, int(match.group('id')), watched=bool(body.get('watched', True)),
+                               user_id=session.info['user_id'])
+    if movie is None:
+        raise ApiError(HTTPStatus.NOT_FOUND, "Movie not found.")
+    return HTTPStatus.OK, to_dict(movie, MOVIE_FIELDS)
+
+
+def delete_movie(session, match, query, body):
+    if not Movie.delete(session, int(match.group('id')), user_id=session.info['user_id']):
+        raise ApiError(HTTPStatus.NOT_FOUND, "Movie not found.")
+    return HTTPStatus.OK, {'deleted': True}
+
+
+def search_movies(session, match, query, body):
+    words, limit = query.get('q', [''])[0], limit_param(query, 'limit', 20)
+    if shard_router is not None and session.info['user_id'] is None:
+        results = shard_router.search(words, limit=limit, main=session)
+    else:
+        results = Movie.search(session, words, limit=limit, user_id=session.info['user_id'])
+    return HTTPStatus.OK, {'results': [result._asdict() for result in results]}
+
+
+def add_review(session, match, query, body):
+    rating = body.get('rating')
+    if not isinstance(rating, (int, float)) or isinstance(rating, bool) or not 1 <= rating <= 5:
+        raise ApiError(HTTPStatus.BAD_REQUEST, "Rating must be between 1 and 5 stars.")
+    review = Review.create(session, require(body, 'movie_id', int), float(rating), body.get('comment'),
+                           user_id=session.info['user_id'])
+    return HTTPStatus.CREATED, to_dict(review, REVIEW_FIELDS)
+
+
+def delete_review(session, match, query, body):
+    if not Review.delete(session, int(match.group('id')), user_id=session.info['user_id']):
+        raise ApiError(HTTPStatus.NOT_FOUND, "Review not found.")
+    return HTTPStatus.OK, {'deleted': True}
+
+
+def show_memory(session, match, query, body):
+    # Sessions live for one request, so only the process figures grow
+    return HTTPStatus.OK, memory_usage()
+
+
+def list_categories(session, match, query, body):
+    return HTTPStatus.OK, {'categories': [category._asdict() for category in Category.get_all_rows(session)]}
+
+
+def add_category(session, match, query, body):
+    category = Category.create(session, require(body, 'name', str))
+    return HTTPStatus.CREATED, to_dict(category, CATEGORY_FIELDS)
+
+
+def delete_category(session, match, query, body):
+    if not Category.delete(session, int(match.group('id'))):
+        raise ApiError(HTTPStatus.NOT_FOUND, "Category not found.")
+    return HTTPStatus.OK, {'deleted': True}
+
+
+ROUTES = [
+    ('GET', r'/memory', show_memory),
+    ('GET', r'/movies', list_movies),
+    ('GET', r'/movies/top-rated', top_rated_movies),
+    ('GET', r'/movies/(?P<id>\d+)', show_movie),
+    ('GET', r'/movies/(?P<id>\d+)/reviews', list_movie_reviews),
+    ('POST', r'/movies', add_movie),
+    ('POST', r'/movies/(?P<id>\d+)/watched', mark_watched),
+    ('DELETE', r'/movies/(?P<id>\d+)', delete_movie),
+    ('GET', r'/search', search_movies),
+    ('POST', r'/reviews', add_review),
+    ('DELETE', r'/reviews/(?P<id>\d+)', delete_review),
+    ('GET', r'/categories', list_categories),
+    ('POST', r'/categories', add_category),
+    ('DELETE', r'/categories/(?P<id>\d+)', delete_category),
+]
+ROUTES = [(method, re.compile(pattern + r'/?\Z'), handler) for method, pattern, handler in ROUTES]
+
+
+class WatchlistRequestHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 keeps client connections open between requests
+    protocol_version = 'HTTP/1.1'
+    # Drop idle keep-alive connections so they don't pin a worker thread
+    timeout = 5
+    # Headers and body are separate writes; with Nagle on, each response
+    # waits for the client's delayed ACK (~40 ms)
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self.dispatch('GET')
+
+    def do_POST(self):
+        self.dispatch('POST')
+
+    def do_DELETE(self):
+        self.dispatch('DELETE')
+
+    def dispatch(self, method):
+        url = urlsplit(self.path)
+        try:
+            body = self.read_body()
+            if url.path == '/health':
+                self.send_json(HTTPStatus.OK, {'status': 'ok'})
+                return
+            if url.path == '/login' and method == 'POST':
+                self.send_json(*self.login(body))
+                return
+            user_id = self.authenticated_user()
+            for route_method, pattern, handler in ROUTES:
+                match = pattern.match(url.path)
+                if match and route_method == method:
+                    break
+            else:
+                raise ApiError(HTTPStatus.NOT_FOUND, f"No route for {method} {url.path}")
+            # Session per request: nothing is shared between requests but the pool
+            with self.server.session_for(user_id) as session:
+                session.info['user_id'] = user_id
+                try:
+                    status, payload = handler(session, match, parse_qs(url.query), body)
+                except IntegrityError as e:
+                    session.rollback()
+                    raise ApiError(HTTPStatus.CONFLICT, str(e.orig))
+            self.send_json(status, payload)
+        except ApiError as e:
+            self.send_json(e.status, {'error': e.message})
+        except Exception as e:
+            self.log_error("%s %s failed: %r", method, self.path, e)
+            self.send_json(HTTPStatus.INTERNAL_SERVER_ERROR, {'error': 'Internal server error'})
+
+    def login(self, body):
+        username, password = require(body, 'username', str), require(body, 'password', str)
+        with self.server.Session() as session:
+            user = User.authenticate(session, username, password)
+            if user is None:
+                raise ApiError(HTTPStatus.UNAUTHORIZED, "Wrong username or password.")
+            user_id = user.id
+            if shard_router is not None:
+                shard_router.session_for(user).close()
+        return HTTPStatus.OK, {'token': self.server.issue_token(user_id), 'user_id': user_id}
+
+    def authenticated_user(self):
+        """Return the user ID for the request's bearer token, or None if it sent none."""
+        header = self.headers.get('Authorization')
+        if not header:
+            return None
+        scheme, _, token = header.partition(' ')
+        user_id = self.server.user_for_token(token.strip()) if scheme.lower() == 'bearer' else None
+        if user_id is None:
+            raise ApiError(HTTPStatus.UNAUTHORIZED, "Invalid or expired token. POST /login for a new one.")
+        return user_id
+
+    def read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if not length:
+            return {}
+        try:
+            body = json.loads(self.rfile.read(length))
+        except ValueError:
+            raise ApiError(HTTPStatus.BAD_REQUEST, "Request body must be JSON")
+        if not isinstance(body, dict):
+            raise ApiError(HTTPStatus.BAD_REQUEST, "Request body must be a JSON object")
+        return body
+
+    def send_json(self, status, payload):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+
+class WatchlistServer(socketserver.ThreadingMixIn, HTTPServer):
+    """HTTP server that hands each connection to a bounded pool of worker threads."""
+
+    daemon_threads = True
+
+    def __init__(self, address, workers=8, database_url=DATABASE_URL, quiet=False, profiler=None):
+        super().__init__(address, WatchlistRequestHandler)
+        self.quiet = quiet
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='watchlist-api')
+        # One pooled connection per worker, so a request never waits for a connection
+        self.engine = make_engine(database_url, pool_size=workers, max_overflow=0)
+        if profiler is not None:
+            profiler.install(self.engine)
+        self.Session = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
+        # Login tokens live in memory as token -> (user ID, expiry) and end
+        # with the server process at the latest
+        self.tokens = {}
+        self.tokens_lock = threading.Lock()
+
+    def session_for(self, user_id):
+        """Return a session on the user's shard in sharded mode, else on the main database."""
+        if shard_router is not None and user_id is not None:
+            return shard_router.session(shard_router.shard_of(user_id))
+        return self.Session()
+
+    def issue_token(self, user_id):
+        token = secrets.token_urlsafe(32)
+        now = time.monotonic()
+        with self.tokens_lock:
+            # A login already pays for a password hash, so sweeping expired
+            # tokens here is cheap and keeps only the valid ones in memory
+            for expired in [key for key, (_, expires) in self.tokens.items() if expires <= now]:
+                del self.tokens[expired]
+            self.tokens[token] = (user_id, now + TOKEN_TTL)
+        return token
+
+    def user_for_token(self, token):
+        with self.tokens_lock:
+            user_id, expires = self.tokens.get(token, (None, None))
+            if user_id is not None and expires <= time.monotonic():
+                del self.tokens[token]
+                return None
+            return user_id
+
+    def process_request(self, request, client_address):
+        self.executor.submit(self.process_request_thread, request, client_address)
+
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown(wait=True)
+        self.engine.dispose()
+
+
+def serve(host='127.0.0.1', port=8000, workers=8, database_url=DATABASE_URL, quiet=False, profiler=None):
+    """Run the API server until interrupted, recording its SQL with profiler if one is given."""
+    server = WatchlistServer((host, port), workers=workers, database_url=database_url, quiet=quiet,
+                             profiler=profiler)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
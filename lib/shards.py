@@ -0,0 +1,256 @@
+"""Optional sharded storage: each bucket of users gets its own SQLite file.
+
+SQLite allows one writer per database file, so with many active users every
+write queues behind the same lock. Setting WATCHLIST_SHARD_DIR puts each
+user's movies and reviews in ``shard-<bucket>.db`` under that directory,
+bucket being ``user_id % WATCHLIST_SHARD_COUNT``; writers for users in
+different buckets never wait for each other.
+
+The main database keeps the users table (logins and user IDs) and the
+shared watchlist. Every shard has the full schema, so the models work
+unchanged on a shard session; each shard holds a copy of the user rows it
+needs for its foreign keys, and its own categories.
+
+Queries across all users (top rated, search) run on every shard in a thread
+pool and the per-shard results are merged. Movie IDs are only unique within
+a shard; (user_id, id) identifies a movie across shards.
+"""
+import glob
+import heapq
+import os
+import re
+import threading
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import insert, select
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.schema import CreateColumn
+
+from helpers import Movie, Review, Category, User, SearchResult
+from models import Base, make_engine
+from genres import genre_text
+
+SHARD_DIR = os.environ.get('WATCHLIST_SHARD_DIR') or None
+SHARD_COUNT = int(os.environ.get('WATCHLIST_SHARD_COUNT', '64'))
+# Shard engines kept open at once; each holds pooled connections and file handles.
+MAX_OPEN_SHARDS = int(os.environ.get('WATCHLIST_MAX_OPEN_SHARDS', '32'))
+FAN_OUT_WORKERS = int(os.environ.get('WATCHLIST_FAN_OUT_WORKERS', '8'))
+
+SHARD_FILE = re.compile(r'shard-(\d+)\.db$')
+
+# A search result from one shard, with the owner that makes its id unambiguous.
+SearchMatch = namedtuple('SearchMatch', SearchResult._fields + ('user_id',))
+
+
+class ShardRouter:
+    """Route sessions to per-user shard files, keeping at most max_open engines open."""
+
+    def __init__(self, directory, shard_count=SHARD_COUNT, max_open=MAX_OPEN_SHARDS, workers=FAN_OUT_WORKERS):
+        self.directory = directory
+        self.shard_count = shard_count
+        self.max_open = max_open
+        self.workers = workers
+        self._engines = OrderedDict()
+        # Shards whose schema is known to be current, so reopening one skips upgrade_shard()
+        self._created = set()
+        self._lock = threading.Lock()
+        self._pool = None
+        self.opened = 0
+        self.evicted = 0
+
+    def shard_of(self, user_id):
+        return user_id % self.shard_count
+
+    def path(self, shard):
+        return os.path.join(self.directory, f"shard-{shard:04d}.db")
+
+    def existing_shards(self):
+        """Return the numbers of the shard files created so far."""
+        shards = []
+        for path in glob.glob(os.path.join(self.directory, 'shard-*.db')):
+            match = SHARD_FILE.search(path)
+            if match:
+                shards.append(int(match.group(1)))
+        return sorted(shards)
+
+    def engine(self, shard):
+        """Return the engine for a shard, creating or upgrading its file and schema on first use.
+
+        Engines are kept in an LRU; the least recently used one is disposed
+        when more than max_open are open. Sessions still using an evicted
+        engine keep their connection until they close it.
+        """
+        with self._lock:
+            engine = self._engines.get(shard)
+            if engine is not None:
+                self._engines.move_to_end(shard)
+                return engine
+            os.makedirs(self.directory, exist_ok=True)
+            engine = make_engine(f"sqlite:///{self.path(shard)}")
+            if shard not in self._created:
+                upgrade_shard(engine)
+                self._created.add(shard)
+            self._engines[shard] = engine
+            self.opened += 1
+            evicted = []
+            while len(self._engines) > self.max_open:
+                evicted.append(self._engines.popitem(last=False)[1])
+            self.evicted += len(evicted)
+        for old in evicted:
+            old.dispose()
+        return engine
+
+    def session(self, shard):
+        return sessionmaker(autocommit=False, autoflush=False, bind=self.engine(shard))()
+
+    def session_for(self, user):
+        """Return a session on user's shard, copying the user row there if it is not yet present."""
+        session = self.session(self.shard_of(user.id))
+        copy_users(session, [user])
+        return session
+
+    def delete_user(self, user_id):
+        """Delete the user's rows from their shard; ON DELETE CASCADE removes their movies and reviews."""
+        shard = self.shard_of(user_id)
+        if shard not in self.existing_shards():
+            return False
+        with self.session(shard) as session:
+            return User.delete(session, user_id)
+
+    def fan_out(self, call):
+        """Run call(session) on every shard in the thread pool and return the results in shard order."""
+        def run(shard):
+            with self.session(shard) as session:
+                return call(session)
+
+        shards = self.existing_shards()
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='shard-fan-out')
+        return list(self._pool.map(run, shards))
+
+    def top_rated(self, limit=10, min_reviews=1, main=None):
+        """Return the highest rated movies of all users (and of main's shared watchlist), in Movie.top_rated order."""
+        # Each shard's top `limit` contains every movie of the global top `limit` it holds
+        def call(session):
+            return Movie.top_rated(session, limit=limit, min_reviews=min_reviews)
+
+        results = self.fan_out(call) + ([call(main)] if main is not None else [])
+        return heapq.nsmallest(limit, (movie for movies in results for movie in movies),
+                               key=lambda movie: (movie.rating_avg is None, -(movie.rating_avg or 0),
+                                                  -movie.rating_count, movie.user_id or 0, movie.id))
+
+    def search(self, query, limit=20, main=None):
+        """Search every user's movies (and main's shared watchlist) and return the best ranked matches.
+
+        Ranks are computed per shard, so term frequencies differ slightly
+        between shards; the ordering is close to, not exactly, what one
+        database would give.
+        """
+        def call(session):
+            return search_with_owner(session, query, limit)
+
+        results = self.fan_out(call) + ([call(main)] if main is not None else [])
+        return heapq.nsmallest(limit, (result for rows in results for result in rows),
+                               key=lambda result: result.rank)
+
+    def stats(self):
+        """Return (shard files, open engines, engines opened, engines evicted)."""
+        with self._lock:
+            open_engines = len(self._engines)
+        return len(self.existing_shards()), open_engines, self.opened, self.evicted
+
+    def dispose(self):
+        with self._lock:
+            engines = list(self._engines.values())
+            self._engines.clear()
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown()
+        for engine in engines:
+            engine.dispose()
+
+
+def upgrade_shard(engine):
+    """Create a shard's schema, or bring one made by an older version up to date.
+
+    alembic only migrates the main database. create_all() adds missing
+    tables and triggers but not columns, so columns added to existing
+    tables since are added here first. Movies in a shard from before genres
+    were normalized are then linked to the shard's genres.
+    """
+    added = []
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            existing = {row[1] for row in connection.exec_driver_sql(f"PRAGMA table_info({table.name})")}
+            # A missing table is left to create_all()
+            for column in table.columns if existing else ():
+                if column.name not in existing:
+                    ddl = CreateColumn(column).compile(dialect=engine.dialect)
+                    connection.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {ddl}")
+                    added.append(f"{table.name}.{column.name}")
+    Base.metadata.create_all(engine)
+    if 'movies.genre_mask' in added:
+        with sessionmaker(bind=engine)() as session:
+            Movie.rebuild_genres(session, only_unlinked=True)
+    return added
+
+
+def copy_users(session, users):
+    """Copy the user rows a shard's foreign keys need, skipping those already there."""
+    users = [user for user in users if session.get(User, user.id) is None]
+    if users:
+        # Passwords stay in the main database; the copies cannot log in
+        session.execute(insert(User).prefix_with('OR IGNORE'),
+                        [{'id': user.id, 'username': user.username, 'password': '!'} for user in users])
+        session.commit()
+
+
+def search_with_owner(session, query, limit):
+    results = Movie.search(session, query, limit=limit)
+    owners = dict(session.execute(select(Movie.id, Movie.user_id).where(Movie.id.in_([r.id for r in results]))).all())
+    return [SearchMatch(*result, owners.get(result.id)) for result in results]
+
+
+def move_users(session, router, on_user=None):
+    """Copy every user's movies and reviews from the main database into their shards, then delete them there.
+
+    Category rows the moved movies use are copied along with them. Returns
+    the number of movies moved.
+    """
+    moved = 0
+    user_ids = session.scalars(select(Movie.user_id).where(Movie.user_id.isnot(None)).distinct()).all()
+    for user_id in user_ids:
+        user = session.get(User, user_id)
+        movies = session.scalars(select(Movie).where(Movie.user_id == user_id)).all()
+        movie_ids = [movie.id for movie in movies]
+        reviews = session.scalars(select(Review).where(Review.movie_id.in_(movie_ids))).all() if movie_ids else []
+        category_ids = {movie.category_id for movie in movies if movie.category_id is not None}
+        categories = session.scalars(select(Category).where(Category.id.in_(category_ids))).all()
+        authors = {review.user_id for review in reviews if review.user_id not in (None, user_id)}
+        with router.session_for(user) as shard:
+            copy_users(shard, session.scalars(select(User).where(User.id.in_(authors))).all())
+            if categories:
+                shard.execute(insert(Category).prefix_with('OR IGNORE'),
+                              [{'id': category.id, 'name': category.name} for category in categories])
+            # Rating aggregates and genre links are left to the triggers as the rows go in
+            shard.execute(insert(Movie), [
+                {'id': movie.id, 'title': movie.title, 'director': movie.director,
+                 'genre': genre_text(movie.genre),
+                 'watched': movie.watched, 'category_id': movie.category_id, 'user_id': user_id}
+                for movie in movies])
+            if reviews:
+                shard.execute(insert(Review), [
+                    {'id': review.id, 'movie_id': review.movie_id, 'rating': review.rating,
+                     'comment': review.comment, 'user_id': review.user_id}
+                    for review in reviews])
+            shard.commit()
+        Movie.bulk_delete(session, ids=movie_ids, user_id=user_id)
+        moved += len(movies)
+        if on_user:
+            on_user(user, len(movies))
+    return moved
+
+
+router = ShardRouter(SHARD_DIR) if SHARD_DIR else None
@@ -0,0 +1,105 @@
+"""Transactions spanning several model calls.
+
+The model classmethods commit after every call, so a single call from the
+CLI or the API is durable when it returns. To group calls into one
+transaction, open a unit of work:
+
+    with unit_of_work() as uow:
+        for title, director, genre in rows:
+            Movie.create(uow.session, title, director, genre)
+        Movie.bulk_mark_watched(uow.session, ids=[1, 2, 3])
+
+Inside it the classmethods neither commit nor flush. New rows are flushed
+together, as one batched INSERT per table, when the session next runs an ORM
+query or statement or when the block ends; then everything is committed
+once. Leaving the block with an exception rolls all of it back. Until a
+flush, new instances have no id and raw SQL (full-text search) does not see
+them; call uow.flush() when you need either.
+
+A unit of work opened inside another one, or uow.savepoint(), runs in a
+SAVEPOINT: if its block raises, only its own work is rolled back.
+"""
+from contextlib import contextmanager
+
+from cache import lookup_cache
+from models import SessionLocal, begin_write
+
+
+class UnitOfWork:
+    """Handle on an open unit of work; see unit_of_work()."""
+
+    def __init__(self, session, flush_each=False):
+        self.session = session
+        self.flush_each = flush_each
+        self.commits = 0
+
+    def flush(self):
+        """Send pending changes to the database without committing them."""
+        self.session.flush()
+
+    def commit(self):
+        """Commit the work done so far and start a new transaction for the rest of the block."""
+        self.session.commit()
+        self.commits += 1
+        begin_write(self.session)
+
+    def rollback(self):
+        """Roll back everything since the last commit; the block may carry on with new work."""
+        self.session.rollback()
+        # Values read inside the transaction may have been cached
+        lookup_cache.clear()
+        begin_write(self.session)
+
+    @contextmanager
+    def savepoint(self):
+        """Run the block in a SAVEPOINT, rolling back only its own work if it raises."""
+        begin_write(self.session)
+        try:
+            with self.session.begin_nested():
+                yield self
+        except BaseException:
+            # As in rollback(): values read inside it may have been cached
+            lookup_cache.clear()
+            raise
+
+
+@contextmanager
+def unit_of_work(session=None, flush_each=False):
+    """Run the block's model calls in one transaction on session (a new session if None) and commit at the end.
+
+    With flush_each, every model call still flushes, so ids are assigned and
+    constraint errors raised by the call that caused them, at the cost of
+    the batched INSERTs.
+    """
+    own_session = session is None
+    if own_session:
+        session = SessionLocal()
+    outer = session.info.get('unit_of_work')
+    if outer is not None:
+        # savepoint() clears the lookup cache if the block raises
+        with outer.savepoint():
+            yield outer
+        return
+
+    uow = UnitOfWork(session, flush_each)
+    previous_autoflush = session.autoflush
+    session.info['unit_of_work'] = uow
+    session.info['defer_commit'] = True
+    session.info['defer_flush'] = not flush_each
+    # Pending rows are flushed before any query, so reads see them
+    session.autoflush = True
+    try:
+        begin_write(session)
+        yield uow
+        session.commit()
+        uow.commits += 1
+    except BaseException:
+        session.rollback()
+        lookup_cache.clear()
+        raise
+    finally:
+        session.autoflush = previous_autoflush
+        for key in ('unit_of_work', 'defer_commit', 'defer_flush'):
+            session.info.pop(key, None)
+        if own_session:
+            session.close()